@@ -0,0 +1,55 @@
+import os
+import time
+import asyncio
+import logging
+import storage
+from metrics import current_stats, unwrap
+
+#Firestore AsyncClient for the async views of asgi.py. The client's channel belongs to the
+#event loop it was built on, so there is one client per running loop (one per process
+#under an ASGI server), created on first use and rebuilt after a fork.
+
+log = logging.getLogger(__name__)
+
+class AsyncClients:
+    def __init__(self, db):
+        #db: the app's sync client; the memory backend's async face shares its store
+        self.db = unwrap(db)
+        self._loop = None
+        self._client = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self):
+        #Only called from coroutines, so the running loop is the one that will use the client
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            backend = storage.backend_name(getattr(self.db, "backend", None))
+            sync_client = self.db.resolve() if backend == "memory" else None
+            self._client = storage.get_async_client(backend, sync_client)
+            self._loop = loop
+            log.info("Created async %s client in process %d", backend, os.getpid())
+        return self._client
+
+    def _after_fork(self):
+        self._loop = None
+        self._client = None
+
+#Reads on the async client, charged to the request like the sync proxy's
+
+def _charge(**counts):
+    stats = current_stats()
+    if stats is not None:
+        stats.add(**counts)
+
+async def fetch(query):
+    started = time.perf_counter()
+    docs = [doc async for doc in query.stream()]
+    _charge(queries=1, reads=len(docs), seconds=time.perf_counter() - started)
+    return docs
+
+async def fetch_doc(ref):
+    started = time.perf_counter()
+    doc = await ref.get()
+    _charge(reads=1, seconds=time.perf_counter() - started)
+    return doc
@@ -1,18 +1,69 @@
-from flask import Flask, render_template, request, jsonify
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Blueprint, Response, render_template, request, jsonify
 import os
+import logging
+import click
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
-import json
+from firebase_admin import firestore
+import storage
+from recompute import recompute_season
+from results import load_race_ledger, sum_driver_points, driver_history, migrate_driver_race_maps, \
+    snapshot_ref, render_race_snapshot, render_all_snapshots, scored_results
+from scoring import apply_race_results, refresh_fantasy_totals, refresh_pending_standings, pending_ref, \
+    pending_update, fantasy_index_entry_ref, FANTASY_INDEX_COLLECTIONS, FANTASY_INDEX_SUBCOLLECTION
+from progression import refresh_progression, fantasy_team_progression, league_progression, \
+    PROGRESSION_COLLECTION, SEASON_DOCUMENT
+from refcache import ReferenceCache
+from batching import get_many, BulkWritePipeline
+from tokencache import TokenCache, preload_signing_keys, insecure_dev_verify
+from realtime import init_realtime, publish_scoring, socketio
+from httpcache import DataVersions, conditional, cached_json, compress_response
+from pagination import page_params, paginate_query, paginate_items, page_response
+from fanout import fan_out, FanOutError
+from singleflight import SingleFlight, coalesce
+from jobs import JobQueue
+from joincodes import JoinCodes
+from memberships import join_league, set_member_team, joined_leagues, refresh_league_summaries, \
+    rebuild_membership_index, AlreadyMember, NotMember
+from optimizer import optimize_lineups, OBJECTIVES
+from race_import import parse_races, parse_results, detect_format, RaceImportError, FORMATS, \
+    MAX_REPORTED_ERRORS
+from metrics import Metrics, instrument, configure_logging, log_event, LOG_SAMPLE_RATE
+from standings import refresh_league_standings, leagues_for_fantasy_team, \
+    read_standings_page, read_member_rank
 
 load_dotenv()
-cred_path = os.getenv("FIREBASE_CREDENTIALS")
-cred = credentials.Certificate(cred_path)
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+configure_logging()
+log = logging.getLogger(__name__)
+
+#STORAGE_BACKEND=memory runs against the in-memory engine with no credentials.
+#The client is created on first use and again in each forked worker, so importing
+#this module does no credential or network work and is safe to preload.
+#instrument() charges every database call to the request that made it, for /metrics.
+db = instrument(storage.LazyClient())
+metrics = Metrics(slow_request_seconds=float(os.getenv("SLOW_REQUEST_MS", "0")) / 1000)
+ref_cache = ReferenceCache(db, collections=("drivers", "teams", PROGRESSION_COLLECTION))
+
+#DEV_AUTH=1 (memory backend only) treats the bearer token as the uid, for offline runs and load tests
+dev_auth = storage.is_memory(db) and os.getenv("DEV_AUTH") == "1"
+if dev_auth:
+    log.warning("DEV_AUTH enabled, bearer tokens are not verified")
+token_cache = TokenCache(
+    verify=insecure_dev_verify if dev_auth else None,
+    max_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    revocation_check_seconds=int(os.getenv("TOKEN_REVOCATION_CHECK_SECONDS", "0"))
+)
+data_versions = DataVersions(db)
+join_codes = JoinCodes(db)
+#Identical concurrent reads of shared data share one computation per process
+single_flight = SingleFlight(timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT_SECONDS", "10")))
+metrics.add_collector(single_flight.render)
 
 def recalculate_fantasy_points_on_startup():
     teams = db.collection("fantasy_teams").stream()
+    pipeline = BulkWritePipeline(db)
     count = 0
 
     for team_doc in teams:
@@ -22,36 +73,38 @@ def recalculate_fantasy_points_on_startup():
         fantasy_team_name = team_data.get("name", team_doc.id)
 
         total_points = 0
-        print(f"\nUpdating team: {fantasy_team_name}")
 
         for did in driver_ids:
             ddoc = db.collection("drivers").document(did).get()
             if ddoc.exists:
                 points = ddoc.to_dict().get("points", 0)
-                print(f"  Driver {did}: {points} pts")
+                log_event(log, logging.DEBUG, "fantasy_team.driver", sample=LOG_SAMPLE_RATE,
+                          team=fantasy_team_name, driver=did, points=points)
                 total_points += points
             else:
-                print(f"Driver '{did}' not found")
+                log_event(log, logging.WARNING, "fantasy_team.driver_missing", team=fantasy_team_name, driver=did)
 
         if constructor_id:
             cdoc = db.collection("teams").document(constructor_id).get()
             if cdoc.exists:
                 points = cdoc.to_dict().get("score", 0)
-                print(f"  Constructor {constructor_id}: {points} pts")
+                log_event(log, logging.DEBUG, "fantasy_team.constructor", sample=LOG_SAMPLE_RATE,
+                          team=fantasy_team_name, constructor=constructor_id, points=points)
                 total_points += points
             else:
-                print(f"Constructor '{constructor_id}' not found")
+                log_event(log, logging.WARNING, "fantasy_team.constructor_missing", team=fantasy_team_name, constructor=constructor_id)
 
-        team_doc.reference.update({ "points": total_points })
-        print(f" Total updated: {total_points} pts")
+        pipeline.update(team_doc.reference, { "points": total_points })
+        log_event(log, logging.DEBUG, "fantasy_team.total", sample=LOG_SAMPLE_RATE, team=fantasy_team_name, points=total_points)
         count += 1
 
-    print(f"\nRecalculated {count} fantasy teams.\n")
+    stats = pipeline.close()
+    log_event(log, logging.INFO, "fantasy_teams.recalculated", teams=count, writes=stats["writes"], writes_per_sec=stats["writes_per_sec"])
 
 def recalculate_fantasy_points_for_team(team_id):
     team_doc = db.collection("fantasy_teams").document(team_id).get()
     if not team_doc.exists:
-        print(f"Team '{team_id}' not found")
+        log_event(log, logging.WARNING, "fantasy_team.missing", team_id=team_id)
         return
 
     team_data = team_doc.to_dict()
@@ -60,67 +113,168 @@ def recalculate_fantasy_points_for_team(team_id):
     fantasy_team_name = team_data.get("name", team_id)
 
     total_points = 0
-    print(f"\nUpdating team: {fantasy_team_name}")
 
-    for did in driver_ids:
-        ddoc = db.collection("drivers").document(did).get()
-        if ddoc.exists:
+    refs = [db.collection("drivers").document(did) for did in driver_ids]
+    if constructor_id:
+        refs.append(db.collection("teams").document(constructor_id))
+    docs = get_many(db, refs)
+
+    for did, ddoc in zip(driver_ids, docs):
+        if ddoc:
             points = ddoc.to_dict().get("points", 0)
-            print(f"  Driver {did}: {points} pts")
+            log_event(log, logging.DEBUG, "fantasy_team.driver", team=fantasy_team_name, driver=did, points=points)
             total_points += points
         else:
-            print(f"Driver '{did}' not found")
+            log_event(log, logging.WARNING, "fantasy_team.driver_missing", team=fantasy_team_name, driver=did)
 
     if constructor_id:
-        cdoc = db.collection("teams").document(constructor_id).get()
-        if cdoc.exists:
-            points = cdoc.to_dict().get("points", 0)
-            print(f"  Constructor {constructor_id}: {points} pts")
+        cdoc = docs[-1]
+        if cdoc:
+            points = cdoc.to_dict().get("score", 0)
+            log_event(log, logging.DEBUG, "fantasy_team.constructor", team=fantasy_team_name, constructor=constructor_id, points=points)
             total_points += points
         else:
-            print(f"Constructor '{constructor_id}' not found")
+            log_event(log, logging.WARNING, "fantasy_team.constructor_missing", team=fantasy_team_name, constructor=constructor_id)
 
     team_doc.reference.update({ "points": total_points })
-    print(f" Total updated: {total_points} pts")
+    log_event(log, logging.DEBUG, "fantasy_team.total", team=fantasy_team_name, points=total_points)
 
 def recalculate_driver_and_team_points():
-    #Recalculate driver totals
-    for driver_doc in db.collection("drivers").stream():
-        driver_data = driver_doc.to_dict()
-        races = driver_data.get("races", {})
-        total = sum(races.values())
-        db.collection("drivers").document(driver_doc.id).update({"points": total})
-
-    #Recalculate team totals
+    pipeline = BulkWritePipeline(db)
+
+    #Recalculate driver totals from the race results, which then count as scored
+    ledger = load_race_ledger(db)
+    race_totals = sum_driver_points({rid: results for rid, (results, _) in ledger.items()})
+    for rid, (results, scored) in ledger.items():
+        if results != scored:
+            pipeline.update(db.collection("races").document(rid), {"scored": results})
+    driver_totals = {}
+    for driver_doc in db.collection("drivers").select(["points"]).stream():
+        total = race_totals.get(driver_doc.id, 0)
+        driver_totals[driver_doc.id] = total
+        pipeline.update(db.collection("drivers").document(driver_doc.id), {"points": total})
+
+    #Recalculate team totals from the fresh driver totals
     for team_doc in db.collection("teams").stream():
         team_data = team_doc.to_dict()
-        total_score = 0
-        for d_id in team_data.get("drivers", []):
-            ddoc = db.collection("drivers").document(d_id).get()
-            if ddoc.exists:
-                total_score += ddoc.to_dict().get("points", 0)
-        db.collection("teams").document(team_doc.id).update({"score": total_score})
+        total_score = sum(driver_totals.get(d_id, 0) for d_id in team_data.get("drivers", []))
+        pipeline.update(db.collection("teams").document(team_doc.id), {"score": total_score})
+
+    stats = pipeline.close()
+    log_event(log, logging.INFO, "driver_team_points.recalculated", writes=stats["writes"], writes_per_sec=stats["writes_per_sec"])
+
+#Price cap for 5 drivers plus a constructor
+TEAM_BUDGET = 100_000_000
+
+def commit_writes(writes):
+    #writes: list of (op, ref, data) pushed through the bulk write pipeline
+    with BulkWritePipeline(db) as pipeline:
+        for op, ref, data in writes:
+            if op == "set":
+                pipeline.set(ref, data, merge=True)
+            elif op == "replace":
+                pipeline.set(ref, data)
+            elif op == "delete":
+                pipeline.delete(ref)
+            else:
+                pipeline.update(ref, data)
+    return pipeline.stats()
+
+def commit_batch(writes):
+    #Like commit_writes, but in one atomic batch; for the few writes of a single change
+    batch = db.batch()
+    for op, ref, data in writes:
+        if op == "replace":
+            batch.set(ref, data)
+        elif op == "delete":
+            batch.delete(ref)
+        else:
+            batch.update(ref, data)
+    batch.commit()
 
-app = Flask(__name__, static_folder='static', template_folder='templates')
+def fantasy_index_writes(team_id, driver_ids, constructor_id, user_id=None, remove=False):
+    #One entry per pick; user_id routes score pushes to the owner
+    keys = [("drivers", did) for did in sorted(set(driver_ids))]
+    if constructor_id:
+        keys.append(("teams", constructor_id))
+    writes = []
+    for kind, item_id in keys:
+        ref = fantasy_index_entry_ref(db, kind, item_id, team_id)
+        if remove:
+            writes.append(("delete", ref, None))
+        else:
+            writes.append(("replace", ref, {"kind": kind, "item_id": item_id, "user_id": user_id}))
+    return writes
 
-#print("\nPoints recalculation...")
-#recalculate_driver_and_team_points()
-#recalculate_fantasy_points_on_startup()
+def rebuild_fantasy_team_index():
+    entries = {}
+    owners = {}
+    for team_doc in db.collection("fantasy_teams").select(["user_id", "drivers", "team"]).stream():
+        team_data = team_doc.to_dict()
+        owners[team_doc.id] = team_data.get("user_id")
+        for did in team_data.get("drivers", []):
+            entries[("drivers", did, team_doc.id)] = team_data.get("user_id")
+        if team_data.get("team"):
+            entries[("teams", team_data["team"], team_doc.id)] = team_data.get("user_id")
+
+    writes = []
+    #Documents directly under the index collections are the older per-driver arrays
+    for collection in FANTASY_INDEX_COLLECTIONS.values():
+        for doc in db.collection(collection).stream():
+            writes.append(("delete", doc.reference, None))
+    for doc in db.collection_group(FANTASY_INDEX_SUBCOLLECTION).select(["kind", "item_id"]).stream():
+        entry = doc.to_dict()
+        if (entry.get("kind"), entry.get("item_id"), doc.id) not in entries:
+            writes.append(("delete", doc.reference, None))
+    for (kind, item_id, fid), user_id in entries.items():
+        writes.append(("replace", fantasy_index_entry_ref(db, kind, item_id, fid),
+                       {"kind": kind, "item_id": item_id, "user_id": user_id}))
+
+    commit_writes(writes)
+    drivers = {item_id for kind, item_id, _ in entries if kind == "drivers"}
+    constructors = {item_id for kind, item_id, _ in entries if kind == "teams"}
+    log_event(log, logging.INFO, "fantasy_index.rebuilt", drivers=len(drivers), constructors=len(constructors))
+    return {"fantasy_teams": len(owners), "drivers": len(drivers), "constructors": len(constructors)}
+
+#Routes and CLI commands; create_app() registers them on an application
+bp = Blueprint("fantasy", __name__, cli_group=None)
+
+#Called by admin writes: drop cached reference data and bump ETag versions
+def mark_changed(*collections):
+    cached = [c for c in collections if c in ref_cache.collections]
+    if cached:
+        ref_cache.invalidate(*cached)
+    data_versions.bump(*collections)
+
+#Points progression: rebuilt after scoring, served from the reference cache
+def update_progression():
+    season = refresh_progression(db, ref_cache.drivers(), ref_cache.teams())
+    ref_cache.invalidate(PROGRESSION_COLLECTION)
+    return season
+
+def season_progression():
+    season = ref_cache.get(PROGRESSION_COLLECTION).get(SEASON_DOCUMENT)
+    return season if season is not None else update_progression()
 
 #Firebase token verification
-def get_current_user_id():
-    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+def uid_from_token(token):
+    if not token:
+        return None
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = token_cache.verify(token)
         return decoded_token.get("uid")
     except Exception:
         return None
 
-@app.route("/")
+def get_current_user_id():
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+    return uid_from_token(token)
+
+@bp.route("/")
 def home():
   return render_template("login.html")
 
-@app.route("/assign_user_role", methods=["POST"])
+@bp.route("/assign_user_role", methods=["POST"])
 def assign_user_role():
     data = request.get_json()
     uid = data.get("uid")
@@ -135,37 +289,39 @@ def assign_user_role():
 
     return {"status": "role and username assigned"}, 200
 
-@app.route("/admin_dashboard")
+@bp.route("/admin_dashboard")
 def admin_dashboard():
     return render_template("admin_dashboard.html")
 
-@app.route("/user_dashboard")
+@bp.route("/user_dashboard")
 def user_dashboard():
     return render_template("user_dashboard.html")
 
-@app.route("/leagues")
+@bp.route("/leagues")
 def show_leagues():
     return render_template("leagues.html")
 
-@app.route("/user_data")
+@bp.route("/user_data")
 def user_data():
     return render_template("user_data.html")
 
-@app.route("/admin/data/teams")
+@bp.route("/admin/data/teams")
+@conditional(data_versions, "teams", "drivers")
+@coalesce(single_flight, data_versions, ("teams", "drivers"))
 def get_teams():
-    all_drivers = {d.id: d.to_dict() for d in db.collection("drivers").stream()}
+    all_drivers = ref_cache.drivers()
     teams = []
 
-    for doc in db.collection("teams").stream():
-        team = doc.to_dict()
+    for tid, data in ref_cache.teams().items():
+        team = dict(data)
         driver_names = [all_drivers.get(d_id, {}).get("name", "Unknown") for d_id in team.get("drivers", [])]
         team["driver_names"] = driver_names
-        team["id"] = doc.id
+        team["id"] = tid
         teams.append(team)
 
     return jsonify(teams)
 
-@app.route("/admin/update/teams", methods=["POST", "PUT"])
+@bp.route("/admin/update/teams", methods=["POST", "PUT"])
 def update_team():
     data = request.get_json()
     doc_id = data.get("id")
@@ -175,24 +331,30 @@ def update_team():
     if not isinstance(driver_ids, list):
         return jsonify({"error": "Invalid driver format"}), 400
 
-    #Parse score and price
+    if len(set(driver_ids)) != len(driver_ids):
+        return jsonify({"error": "A constructor cannot list the same driver twice"}), 400
+
+    #Parse price; the score is not editable, it follows the drivers' totals
     def safe_int(val, default=0):
         try:
             return int(str(val).strip())
         except (ValueError, TypeError):
             return default
 
-    score = safe_int(data.get("score"), 0)
     price = safe_int(data.get("price"), 0)
 
     #Get or create the team document reference
     team_ref = db.collection("teams").document(doc_id) if doc_id else db.collection("teams").document()
     team_id = team_ref.id
 
-    #Validate drivers
+    #Validate drivers, reading them concurrently
+    try:
+        driver_docs = fan_out(lambda d_id: db.collection("drivers").document(d_id).get(), driver_ids)
+    except FanOutError as e:
+        return jsonify({"error": "Could not read drivers", "failed": sorted(e.errors)}), 503
+
     conflicts = []
-    for d_id in driver_ids:
-        d_doc = db.collection("drivers").document(d_id).get()
+    for d_id, d_doc in zip(driver_ids, driver_docs):
         if d_doc.exists:
             current_team = d_doc.to_dict().get("team_id")
             if current_team and current_team != team_id:
@@ -207,45 +369,98 @@ def update_team():
     team_data = {
         "name": team_name,
         "drivers": driver_ids,
-        "score": score,
         "price": price
     }
-
-    #Update or create the team document
-    if doc_id:
-        team_ref.update(team_data)
-    else:
-        team_ref.set(team_data)
-
-    #Assign team_id to drivers
-    for d_id in driver_ids:
-        db.collection("drivers").document(d_id).update({"team_id": team_id})
+    driver_refs = [db.collection("drivers").document(d_id) for d_id in driver_ids]
+
+    #The score is the drivers' current totals, read in the same transaction as the write so a
+    #concurrent scoring pass either sees the new driver list or retries. A changed score is
+    #marked pending like any scored change, so the fantasy teams are refreshed below.
+    #teams/{id}.drivers is what scores; drivers.team_id follows it for display.
+    def write(transaction):
+        old = team_ref.get(transaction=transaction) if doc_id else None
+        old_team = old.to_dict() if old and old.exists else {}
+        drivers = db.get_all(driver_refs, field_paths=["points"], transaction=transaction)
+        score = sum(int(snap.to_dict().get("points", 0) or 0) for snap in drivers if snap.exists)
+        removed_refs = [db.collection("drivers").document(d_id)
+                        for d_id in old_team.get("drivers", []) if d_id not in driver_ids]
+        removed = [snap for snap in db.get_all(removed_refs, field_paths=["team_id"], transaction=transaction)
+                   if snap.exists and snap.to_dict().get("team_id") == team_id]
+
+        if doc_id:
+            transaction.update(team_ref, {**team_data, "score": score})
+        else:
+            transaction.set(team_ref, {**team_data, "score": score})
+        for ref in driver_refs:
+            transaction.update(ref, {"team_id": team_id})
+        for snap in removed:
+            transaction.update(snap.reference, {"team_id": None})
+        changed = score != int(old_team.get("score", 0) or 0)
+        if changed:
+            transaction.set(pending_ref(db), pending_update(team_ids=[team_id]), merge=True)
+        return changed
+
+    score_changed = storage.run_transaction(db, write)
+
+    mark_changed("teams", "drivers")
+    #Constructor lines follow the team's driver list
+    update_progression()
+
+    if score_changed:
+        _, user_deltas = refresh_fantasy_totals(db)
+        standings_changes = refresh_pending_standings(db)
+        publish_scoring(standings_changes=standings_changes, user_deltas=user_deltas)
 
     return jsonify({"status": "Team created or updated successfully"}), 200
 
-@app.route("/admin/data/drivers")
+@bp.route("/admin/data/drivers")
+@conditional(data_versions, "drivers", "teams")
+@coalesce(single_flight, data_versions, ("drivers", "teams"))
 def get_drivers():
-    teams = {t.id: t.to_dict().get("name", "Unknown") for t in db.collection("teams").stream()}
+    try:
+        limit, cursor, fields = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    teams = {tid: t.get("name", "Unknown") for tid, t in ref_cache.teams().items()}
     drivers = []
 
-    for doc in db.collection("drivers").stream():
-        driver = doc.to_dict()
-        driver["id"] = doc.id
+    for did, data in ref_cache.drivers().items():
+        driver = dict(data)
+        driver["id"] = did
         driver["team_name"] = teams.get(driver.get("team_id"), "Unassigned")
         drivers.append(driver)
 
-    return jsonify(drivers)
+    #Drivers are served from the reference cache, so paging happens in memory
+    drivers, next_cursor = paginate_items(drivers, limit, cursor, fields)
+    return page_response(drivers, next_cursor, limit, cursor)
+
+@bp.route("/admin/cache/stats")
+def get_cache_stats():
+    return jsonify({
+        "reference": ref_cache.stats(),
+        "tokens": token_cache.stats(),
+        "join_codes": join_codes.stats(),
+        "single_flight": single_flight.stats()
+    })
+
+#Prometheus scrape target: per-route latency histograms and database call counters
+@bp.route("/metrics")
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-@app.route("/admin/data/driver/<driver_id>")
+@bp.route("/admin/data/driver/<driver_id>")
 def get_driver(driver_id):
     driver_doc = db.collection("drivers").document(driver_id).get()
     if driver_doc.exists:
         data = driver_doc.to_dict()
         data["id"] = driver_id
+        #History lives with the races, so only this detail view pays for it
+        data["races"] = driver_history(db, driver_id)
         return jsonify(data)
     return jsonify({"error": "Driver not found"}), 404
 
-@app.route("/admin/update/drivers", methods=["POST", "PUT"])
+@bp.route("/admin/update/drivers", methods=["POST", "PUT"])
 def update_driver():
     data = request.get_json()
     doc_id = data.get("id")
@@ -256,30 +471,148 @@ def update_driver():
         except (ValueError, TypeError):
             return default
 
+    #Points are not editable: they are the driver's scored race results (see scoring.py),
+    #so a new driver starts at 0 and an edit leaves the total alone
     driver_data = {
         "name": data.get("name", "").strip(),
         "price": safe_int(data.get("price")),
-        "points": safe_int(data.get("points")),
         "team_id": data.get("team_id", "").strip() or None
     }
 
     if request.method == "PUT" and doc_id:
         db.collection("drivers").document(doc_id).update(driver_data)
     else:
-        db.collection("drivers").add(driver_data)
+        db.collection("drivers").add({**driver_data, "points": 0})
 
+    mark_changed("drivers")
     return jsonify({"status": "success"}), 200
 
-@app.route("/admin/data/races")
+@bp.route("/admin/data/races")
+@conditional(data_versions, "races")
+@coalesce(single_flight, data_versions, ("races",))
 def get_races():
+    try:
+        limit, cursor, fields = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    races, next_cursor = paginate_query(db.collection("races"), limit, cursor, fields)
+    return page_response(races, next_cursor, limit, cursor)
+
+#Writes one race with its per-driver results. Scoring is a separate pass (scoring.py):
+#scored is carried over, so the pass knows what the totals already include.
+def save_race(race_id, race_name, race_date, name_results):
+    race_ref = db.collection("races").document(race_id)
+
+    #Read every driver in the results concurrently
+    involved = sorted(name_results)
+    driver_docs = fan_out(lambda did: db.collection("drivers").document(did).get(), involved)
+
+    drivers = {}
+    driver_results = {}
+    for driver_id, driver_doc in zip(involved, driver_docs):
+        if not driver_doc.exists:
+            log_event(log, logging.WARNING, "race.driver_missing", race_id=race_id, driver=driver_id)
+            continue
+        drivers[driver_id] = driver_doc.to_dict()
+        driver_results[driver_id] = int(name_results[driver_id])
+
+    #The race document is the only copy of these results; drivers just get new totals.
+    #The user-facing table is rendered once here instead of on every read.
+    race = {"name": race_name, "date": race_date, "results": driver_results}
+    snapshot = render_race_snapshot(race_id, race, drivers, ref_cache.teams())
+
+    def write(transaction):
+        old_race = race_ref.get(transaction=transaction)
+        scored = scored_results(old_race.to_dict()) if old_race.exists else {}
+        transaction.set(race_ref, {**race, "scored": scored})
+        transaction.set(snapshot_ref(db, race_id), snapshot)
+
+    storage.run_transaction(db, write)
+
+#Bulk variant for imports: drivers were validated against one in-memory lookup and
+#every race is written in one transaction
+def save_races(races, drivers):
+    teams = ref_cache.teams()
+    race_refs = [db.collection("races").document(race["id"]) for race in races]
+    saved = [{
+        "name": race["name"],
+        "date": race["date"],
+        "results": {did: int(pts) for did, pts in race["results"].items() if did in drivers}
+    } for race in races]
+
+    def write(transaction):
+        old = {snap.id: snap.to_dict() for snap in db.get_all(race_refs, field_paths=["results", "scored"],
+                                                               transaction=transaction) if snap.exists}
+        for race_ref, data in zip(race_refs, saved):
+            scored = scored_results(old[race_ref.id]) if race_ref.id in old else {}
+            transaction.set(race_ref, {**data, "scored": scored})
+            transaction.set(snapshot_ref(db, race_ref.id), render_race_snapshot(race_ref.id, data, drivers, teams))
+
+    storage.run_transaction(db, write)
+
+#Single scoring pass for any number of saved races. It also finishes the fantasy team
+#and standings updates of an earlier pass that failed part way, so resubmitting a job repairs it.
+def score_races(races, report=None):
+    report = report or (lambda *args: None)
+
+    #Move each race's unscored difference into the driver and constructor totals
+    report("scoring", len(races), len(races))
+    driver_deltas, team_deltas = apply_race_results(db, [race["id"] for race in races])
+    mark_changed("drivers", "teams", "races")
+    update_progression()
+
+    report("updating fantasy teams", len(races), len(races))
+    fantasy, user_deltas = refresh_fantasy_totals(db)
+
+    report("refreshing standings", len(races), len(races))
+    #Only the leagues that one of the changed fantasy teams is entered in, including any
+    #an earlier pass marked but failed to refresh
+    standings_changes = refresh_pending_standings(db)
+    log_event(log, logging.INFO, "races.scored", races=len(races), drivers=len(driver_deltas),
+              constructors=len(team_deltas), fantasy_teams=fantasy["fantasy_teams"])
+
+    publish_scoring(races=races, standings_changes=standings_changes, user_deltas=user_deltas)
+    return {
+        "writes_per_sec": fantasy["writes_per_sec"],
+        "drivers": len(driver_deltas),
+        "teams": len(team_deltas),
+        "fantasy_teams": fantasy["fantasy_teams"]
+    }
+
+#Job processor: save every coalesced race or import, then run a single scoring pass
+@metrics.track("job:race_scoring")
+def process_race_jobs(jobs, report):
     races = []
-    for doc in db.collection("races").stream():
-        race = doc.to_dict()
-        race["id"] = doc.id
-        races.append(race)
-    return jsonify(races)
+    results = {}
+
+    for done, job in enumerate(jobs):
+        report("saving races", done, len(jobs))
+        payload = job["payload"]
+        try:
+            if job["kind"] == "race_import":
+                job_races = payload["races"]
+                save_races(job_races, ref_cache.drivers())
+            else:
+                job_races = [payload]
+                save_race(payload["id"], payload["name"], payload["date"], payload["results"])
+        except Exception as e:
+            results[job["id"]] = {"race_id": payload.get("id"), "error": str(e)}
+            continue
+        races.extend({"id": race["id"], "name": race["name"], "date": race["date"]} for race in job_races)
+        if job["kind"] == "race_import":
+            results[job["id"]] = {"race_ids": [race["id"] for race in job_races]}
+        else:
+            results[job["id"]] = {"race_id": payload["id"]}
 
-@app.route("/admin/update/races", methods=["POST", "PUT"])
+    counts = score_races(races, report)
+    for job_result in results.values():
+        job_result["scoring"] = counts
+    return results
+
+race_jobs = JobQueue(db, process_race_jobs, window=float(os.getenv("JOB_COALESCE_SECONDS", "2")))
+
+@bp.route("/admin/update/races", methods=["POST", "PUT"])
 def update_race():
     data = request.get_json()
     race_id = data.get("id") or None
@@ -289,91 +622,209 @@ def update_race():
 
     if not race_name or not race_date or not name_results:
         return jsonify({"error": "Missing race data"}), 400
-
-    race_ref = db.collection("races").document(race_id) if race_id else db.collection("races").document()
-    driver_results = {}
-
-    for driver_id, points in name_results.items():
-        driver_doc = db.collection("drivers").document(driver_id).get()
-        if driver_doc.exists:
-            driver_data = driver_doc.to_dict()
-            db.collection("drivers").document(driver_id).update({
-                f"races.{race_ref.id}": int(points)
-            })
-
-            driver_results[driver_id] = int(points)
-        else:
-            print(f"Driver '{driver_id}' not found")
-
-    #Save race with resolved driver IDs
-    race_ref.set({
+    if race_id and "/" in race_id:
+        return jsonify({"error": "Invalid race id"}), 400
+    #Same rules as a season import, checked before anything is queued
+    if not isinstance(name_results, dict):
+        return jsonify({"error": "results must be an object of driver_id: points"}), 400
+    results, errors = parse_results(name_results.items(), ref_cache.drivers())
+    if errors:
+        return jsonify({"error": "Invalid results", "errors": errors[:MAX_REPORTED_ERRORS]}), 400
+
+    #Scoring runs on the background worker; the id is assigned now so the client can track it
+    race_id = race_id or db.collection("races").document().id
+    job = race_jobs.submit("race", {
+        "id": race_id,
         "name": race_name,
         "date": race_date,
-        "results": driver_results
+        "results": results
     })
 
-    #Recalculate team scores
-    for team_doc in db.collection("teams").stream():
-        team_data = team_doc.to_dict()
-        total_score = 0
-        for d_id in team_data.get("drivers", []):
-            driver = db.collection("drivers").document(d_id).get().to_dict()
-            total_score += driver.get("points", 0)
-        db.collection("teams").document(team_doc.id).update({"score": total_score})
-    
-    recalculate_driver_and_team_points()
-    recalculate_fantasy_points_on_startup()
-    print("All scores recalculated after race update.")
+    return jsonify({"status": "queued", "job_id": job["id"], "race_id": race_id}), 202
+
+#Season import: CSV or JSONL streamed from the request body (or a multipart "file"),
+#validated up front, then saved and scored as one job
+@bp.route("/admin/import/races", methods=["POST"])
+def import_races():
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get("format") or detect_format(
+        upload.filename if upload else None,
+        upload.content_type if upload else request.content_type
+    )
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
 
-    return jsonify({"status": "Race recorded with driver IDs"}), 200
+    try:
+        races = parse_races(stream, fmt, ref_cache.drivers())
+    except RaceImportError as e:
+        return jsonify({"error": "Invalid import", "error_count": e.error_count, "errors": e.errors}), 400
+
+    summary = {"races": len(races), "results": sum(len(race["results"]) for race in races)}
+    if request.args.get("dry_run") == "1":
+        return jsonify({"status": "valid", **summary}), 200
+
+    job = race_jobs.submit("race_import", {"races": races})
+    return jsonify({"status": "queued", "job_id": job["id"], **summary}), 202
+
+@bp.cli.command("import-races")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension")
+@click.option("--dry-run", is_flag=True, help="Validate only")
+def import_races_command(path, fmt, dry_run):
+    """Import a season of race results from CSV or JSONL and score it once."""
+    fmt = fmt or detect_format(path)
+    if not fmt:
+        raise click.UsageError("Cannot tell the format from the file name, pass --format")
+
+    drivers = ref_cache.drivers()
+    with open(path, "rb") as f:
+        try:
+            races = parse_races(f, fmt, drivers)
+        except RaceImportError as e:
+            for error in e.errors:
+                click.echo(f"line {error['line']}: {error['error']}", err=True)
+            raise click.ClickException(f"{e.error_count} invalid row(s), nothing imported")
+
+    click.echo(f"{len(races)} races, {sum(len(race['results']) for race in races)} results")
+    if dry_run:
+        return
 
-@app.route("/user/race_results/<race_id>")
-def get_race_results(race_id):
-    race_doc = db.collection("races").document(race_id).get()
-    if not race_doc.exists:
-        return jsonify({"error": "Race not found"}), 404
+    save_races(races, drivers)
+    races = [{"id": race["id"], "name": race["name"], "date": race["date"]} for race in races]
+    counts = score_races(races)
+    click.echo(f"Scored: {counts['drivers']} drivers, {counts['teams']} constructors, {counts['fantasy_teams']} fantasy teams")
+
+@bp.cli.command("rebuild-fantasy-index")
+def rebuild_fantasy_index_command():
+    """Rebuild the driver/constructor -> fantasy team index from every fantasy team."""
+    counts = rebuild_fantasy_team_index()
+    click.echo(f"Indexed {counts['fantasy_teams']} fantasy team(s) under {counts['drivers']} driver(s) "
+               f"and {counts['constructors']} constructor(s)")
+
+@bp.cli.command("backfill-join-codes")
+def backfill_join_codes_command():
+    """Reserve league_codes entries for private leagues created before the index."""
+    click.echo(f"Indexed {join_codes.backfill()} join code(s)")
+
+@bp.cli.command("migrate-driver-races")
+@click.option("--dry-run", is_flag=True, help="Report what would move without writing")
+def migrate_driver_races_command(dry_run):
+    """Move per-race points out of driver documents into the race documents."""
+    counts = migrate_driver_race_maps(db, dry_run=dry_run)
+    click.echo(f"{counts['drivers']} driver(s) with race maps, {counts['results_moved']} result(s) "
+               f"to move into {counts['races_patched']} race(s)")
+    if not dry_run:
+        report = recompute_season(db)
+        mark_changed("drivers", "teams", "races")
+        update_progression()
+        click.echo(f"Recomputed totals: {report['changed']}")
+
+@bp.cli.command("render-race-snapshots")
+def render_race_snapshots_command():
+    """Re-render every race's results table, e.g. after renaming drivers or constructors."""
+    click.echo(f"Rendered {render_all_snapshots(db, ref_cache.drivers(), ref_cache.teams())} race snapshot(s)")
+
+@bp.cli.command("rebuild-membership-index")
+def rebuild_membership_index_command():
+    """Move memberships to deterministic ids and rebuild the user_leagues / league_members indexes."""
+    counts = rebuild_membership_index(db)
+    refresh_league_standings(db)
+    click.echo(f"Indexed {counts['memberships']} membership(s) across {counts['leagues']} league(s) "
+               f"for {counts['users']} user(s); {counts['migrated']} legacy document(s) moved")
+
+@bp.route("/admin/jobs/<job_id>")
+def get_job(job_id):
+    job = race_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+#Full-season recompute, e.g. after correcting an old race
+@bp.route("/admin/recalculate", methods=["POST"])
+def recalculate_all():
+    dry_run = request.args.get("dry_run") == "1"
+    report = recompute_season(db, dry_run=dry_run)
+    if report["writes"]:
+        #races too when scored was rewritten, since /admin/data/races returns it
+        mark_changed("drivers", "teams", *(["races"] if report["changed"].get("races") else []))
+    if not dry_run:
+        update_progression()
+    if report["changed"].get("fantasy_teams"):
+        publish_scoring(standings_changes=refresh_league_standings(db))
+    log_event(log, logging.INFO, "season.recomputed", reads=report["reads"], writes=report["writes"], seconds=report["seconds"]["total"])
+    return jsonify(report), 200
+
+#Cumulative points after each race, for charts. kind: drivers, constructors, fantasy_teams or leagues
+@bp.route("/user/progression/<kind>/<item_id>")
+@coalesce(single_flight)
+def get_progression(kind, item_id):
+    season = season_progression()
+
+    if kind in ("drivers", "constructors"):
+        docs = ref_cache.drivers() if kind == "drivers" else ref_cache.teams()
+        lines = season["drivers"] if kind == "drivers" else season["teams"]
+        if item_id not in docs:
+            return jsonify({"error": "Not found"}), 404
+        points = lines.get(item_id) or [0] * len(season["races"])
+        series = [{"id": item_id, "name": docs[item_id].get("name"), "points": points}]
+    elif kind == "fantasy_teams":
+        series = fantasy_team_progression(db, season, item_id)
+        if series is None:
+            return jsonify({"error": "Fantasy team not found"}), 404
+    elif kind == "leagues":
+        if not db.collection("leagues").document(item_id).get().exists:
+            return jsonify({"error": "League not found"}), 404
+        entries, _ = read_standings_page(db, item_id)
+        series = league_progression(db, season, entries)
+    else:
+        return jsonify({"error": "kind must be drivers, constructors, fantasy_teams or leagues"}), 400
+
+    return jsonify({"kind": kind, "id": item_id, "races": season["races"], "series": series})
 
-    race = race_doc.to_dict()
-    all_drivers = {d.id: d.to_dict().get("name", "Unknown") for d in db.collection("drivers").stream()}
+#Pre-rendered at save time: one read, cacheable until the race is edited
+@bp.route("/user/race_results/<race_id>")
+def get_race_results(race_id):
+    doc = snapshot_ref(db, race_id).get()
+    if doc.exists:
+        snapshot = doc.to_dict()
+    else:
+        #Races saved before snapshots existed are rendered on first view
+        race_doc = db.collection("races").document(race_id).get()
+        if not race_doc.exists:
+            return jsonify({"error": "Race not found"}), 404
+        snapshot = render_race_snapshot(race_id, race_doc.to_dict(), ref_cache.drivers(), ref_cache.teams())
+        snapshot_ref(db, race_id).set(snapshot)
+
+    etag = snapshot.pop("etag", None) or race_id
+    return cached_json(snapshot, etag)
+
+@bp.route("/admin/data/leagues")
+@conditional(data_versions, "leagues")
+@coalesce(single_flight, data_versions, ("leagues",))
+def get_leagues():
+    try:
+        limit, cursor, fields = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    #Combine driver names with points from this race
-    results = []
-    for driver_id, name in all_drivers.items():
-        points = race.get("results", {}).get(driver_id, 0)
-        results.append({ "name": name, "points": points })
+    leagues, next_cursor = paginate_query(db.collection("leagues"), limit, cursor, fields)
+    return page_response(leagues, next_cursor, limit, cursor)
 
-    return jsonify({
-        "race_name": race.get("name"),
-        "date": race.get("date"),
-        "results": results
-    })
+#New league; private leagues get a code reserved in the same transaction
+def add_league(league_data):
+    if league_data.get("type") == "private":
+        return join_codes.create_league(league_data)
+    _, league_ref = db.collection("leagues").add(league_data)
+    return league_ref.id, None
 
-@app.route("/admin/data/leagues")
-def get_leagues():
-    leagues = []
-    for doc in db.collection("leagues").stream():
-        league = doc.to_dict()
-        league["id"] = doc.id
-        leagues.append(league)
-    return jsonify(leagues)
-
-@app.route("/admin/create_league", methods=["POST"])
+@bp.route("/admin/create_league", methods=["POST"])
 def create_league():
     data = request.get_json()
     name = data.get("name")
     league_type = data.get("type", "public")
     team_filter = data.get("team_restriction") or None
 
-    #Generate a unique code for private leagues
-    code = None
-    if league_type == "private":
-        import random, string
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            existing = db.collection("leagues").where("code", "==", code).get()
-            if not existing:
-                break
-
     league_data = {
         "name": name,
         "type": league_type,
@@ -382,13 +833,11 @@ def create_league():
         "created_at": firestore.SERVER_TIMESTAMP
     }
 
-    if code:
-        league_data["code"] = code
-
-    db.collection("leagues").add(league_data)
+    _, code = add_league(league_data)
+    mark_changed("leagues")
     return jsonify({ "status": "league created", "code": code })
 
-@app.route("/user/create_league", methods=["POST"])
+@bp.route("/user/create_league", methods=["POST"])
 def create_league_user():
     uid = get_current_user_id()
     if not uid:
@@ -399,16 +848,6 @@ def create_league_user():
     league_type = data.get("type", "public")
     team_filter = data.get("team_restriction") or None
 
-    #Generate a join code if private
-    code = None
-    if league_type == "private":
-        import random, string
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            existing = db.collection("leagues").where("code", "==", code).get()
-            if not existing:
-                break
-
     league_data = {
         "name": name,
         "type": league_type,
@@ -417,39 +856,21 @@ def create_league_user():
         "created_at": firestore.SERVER_TIMESTAMP
     }
 
-    if code:
-        league_data["code"] = code
-
-    doc_ref = db.collection("leagues").add(league_data)
-    league_id = doc_ref[1].id  #Newly created league doc ID
+    league_id, code = add_league(league_data)
+    mark_changed("leagues")
 
-    #Auto-add user to league_memberships
-    db.collection("league_memberships").add({
-        "user_id": uid,
-        "league_id": league_id,
-        "joined_at": firestore.SERVER_TIMESTAMP,
-        "team_id": None  #Updated manually
-    })
+    #Auto-add the creator; their team is picked later
+    join_league(db, uid, league_id, {**league_data, "code": code})
 
     return jsonify({ "status": "league created", "code": code })
 
-@app.route("/admin/update/leagues", methods=["POST", "PUT"])
+@bp.route("/admin/update/leagues", methods=["POST", "PUT"])
 def update_league():
     data = request.get_json()
     doc_id = data.get("id")
     league_type = data.get("type", "public")
     team_filter = data.get("team_restriction") or None
 
-    #Generate join code if creating a new private league
-    code = None
-    if request.method == "POST" and league_type == "private":
-        import random, string
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            existing = db.collection("leagues").where("code", "==", code).get()
-            if not existing:
-                break
-
     league_data = {
         "name": data.get("name"),
         "type": league_type,
@@ -458,45 +879,50 @@ def update_league():
         "created_at": firestore.SERVER_TIMESTAMP
     }
 
-    if code:
-        league_data["code"] = code
-
     if request.method == "PUT" and doc_id:
-        db.collection("leagues").document(doc_id).set(league_data)
+        #Edits keep a private league's code; switching to public releases it
+        league_ref = db.collection("leagues").document(doc_id)
+        old_league = league_ref.get()
+        code = old_league.to_dict().get("code") if old_league.exists else None
+        if league_type == "private" and not code:
+            _, code = join_codes.create_league(league_data, league_ref)
+        else:
+            if league_type == "private":
+                league_data["code"] = code
+            league_ref.set(league_data)
+            if code and league_type != "private":
+                join_codes.release(code)
+                code = None
+        refresh_league_summaries(db, doc_id, {**league_data, "code": code})
     else:
-        db.collection("leagues").add(league_data)
+        _, code = add_league(league_data)
 
+    mark_changed("leagues")
     return jsonify({ "status": "success", "code": code }), 200
 
-@app.route("/user/leagues/public")
+@bp.route("/user/leagues/public")
+@conditional(data_versions, "leagues")
+@coalesce(single_flight, data_versions, ("leagues",))
 def get_public_leagues():
-    public = []
-    for doc in db.collection("leagues").where("type", "==", "public").stream():
-        league = doc.to_dict()
-        league["id"] = doc.id
-        public.append(league)
-    return jsonify(public)
-
-@app.route("/user/leagues/joined")
+    try:
+        limit, cursor, fields = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = db.collection("leagues").where("type", "==", "public")
+    public, next_cursor = paginate_query(query, limit, cursor, fields)
+    return page_response(public, next_cursor, limit, cursor)
+
+@bp.route("/user/leagues/joined")
 def get_joined_leagues():
     uid = get_current_user_id()
     if not uid:
         return jsonify({"error": "Unauthorized"}), 401
 
-    memberships = db.collection("league_memberships").where("user_id", "==", uid).stream()
-    league_ids = [doc.to_dict().get("league_id") for doc in memberships]
-
-    joined = []
-    for lid in league_ids:
-        doc = db.collection("leagues").document(lid).get()
-        if doc.exists:
-            league = doc.to_dict()
-            league["id"] = doc.id
-            joined.append(league)
-
-    return jsonify(joined)
+    #One read of the user's membership index document
+    return jsonify(joined_leagues(db, uid))
 
-@app.route("/user/update_team_in_league", methods=["POST"])
+@bp.route("/user/update_team_in_league", methods=["POST"])
 def update_team_in_league():
     uid = get_current_user_id()
     if not uid:
@@ -506,46 +932,45 @@ def update_team_in_league():
     league_id = data.get("league_id")
     team_id = data.get("team_id")
 
-    #Find membership record
-    membership_docs = db.collection("league_memberships") \
-        .where("user_id", "==", uid) \
-        .where("league_id", "==", league_id).get()
+    if not league_id:
+        return jsonify({"error": "Missing league_id"}), 400
 
-    for doc in membership_docs:
-        doc.reference.update({ "team_id": team_id })
+    try:
+        set_member_team(db, uid, league_id, team_id)
+    except NotMember:
+        return jsonify({"error": "Not a member of this league"}), 404
+
+    publish_scoring(standings_changes=refresh_league_standings(db, [league_id]))
 
     return jsonify({ "status": "team updated" })
 
-@app.route("/user/leagues/<league_id>/standings")
+@bp.route("/user/leagues/<league_id>/standings")
+@coalesce(single_flight)
 def get_league_standings(league_id):
-    members = db.collection("league_memberships") \
-        .where("league_id", "==", league_id).stream()
-
-    standings = []
-    for m in members:
-        mem = m.to_dict()
-        team_id = mem.get("team_id")
-        if not team_id:
-            continue
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor", type=int)
+    if limit is not None and not 1 <= limit <= 500:
+        return jsonify({"error": "limit must be between 1 and 500"}), 400
 
-        team_doc = db.collection("fantasy_teams").document(team_id).get()
-        user_doc = db.collection("users").document(mem["user_id"]).get()
+    entries, next_cursor = read_standings_page(db, league_id, limit=limit, cursor=cursor)
 
-        if team_doc.exists:
-            team = team_doc.to_dict()
-            username = user_doc.to_dict().get("username") if user_doc.exists else mem["user_id"]
+    #Without paging params return the plain ranked list
+    if limit is None and cursor is None:
+        return jsonify(entries)
+    return jsonify({"entries": entries, "next_cursor": next_cursor})
 
-            standings.append({
-                "user_id": mem["user_id"],
-                "username": username,
-                "team_name": team.get("name"),
-                "points": team.get("points", 0)
-            })
+@bp.route("/user/leagues/<league_id>/standings/me")
+def get_my_league_rank(league_id):
+    uid = get_current_user_id()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
 
-    standings.sort(key=lambda x: x["points"], reverse=True)
-    return jsonify(standings)
+    entry = read_member_rank(db, league_id, uid)
+    if not entry:
+        return jsonify({"error": "Not ranked in this league"}), 404
+    return jsonify(entry)
 
-@app.route("/user/leagues/<league_id>/info")
+@bp.route("/user/leagues/<league_id>/info")
 def get_league_info(league_id):
     doc = db.collection("leagues").document(league_id).get()
     if not doc.exists:
@@ -554,7 +979,7 @@ def get_league_info(league_id):
     league["id"] = doc.id
     return jsonify(league)
 
-@app.route("/user/join_private_league", methods=["POST"])
+@bp.route("/user/join_private_league", methods=["POST"])
 def join_private_league():
     uid = get_current_user_id()
     if not uid:
@@ -563,33 +988,20 @@ def join_private_league():
     data = request.get_json()
     code = data.get("code")
 
-    #Find league with matching code
-    leagues = db.collection("leagues").where("code", "==", code).get()
-    if not leagues:
+    #Resolve the code through the join-code index (cached), checked against the league
+    league_id, league = join_codes.resolve(code)
+    if not league_id:
         return jsonify({ "error": "Invalid code" }), 404
 
-    league_doc = leagues[0]
-    league_id = league_doc.id
-
-    #Check if user is already a member
-    existing = db.collection("league_memberships") \
-        .where("user_id", "==", uid) \
-        .where("league_id", "==", league_id).get()
-
-    if existing:
+    #The membership index rejects duplicate joins inside the same transaction
+    try:
+        join_league(db, uid, league_id, league)
+    except AlreadyMember:
         return jsonify({ "error": "Already joined" }), 400
 
-    #Add membership
-    db.collection("league_memberships").add({
-        "user_id": uid,
-        "league_id": league_id,
-        "joined_at": firestore.SERVER_TIMESTAMP,
-        "team_id": None
-    })
-
     return jsonify({ "status": "joined" })
 
-@app.route("/user/join_public_league", methods=["POST"])
+@bp.route("/user/join_public_league", methods=["POST"])
 def join_public_league():
     uid = get_current_user_id()
     if not uid:
@@ -609,45 +1021,80 @@ def join_public_league():
     if league.get("type") != "public":
         return jsonify({"error": "League is not public"}), 403
 
-    #Check if user is already a member
-    existing = db.collection("league_memberships")\
-        .where("user_id", "==", uid)\
-        .where("league_id", "==", league_id)\
-        .stream()
-
-    if any(existing):
+    try:
+        join_league(db, uid, league_id, league)
+    except AlreadyMember:
         return jsonify({"status": "already joined"})
 
-    #Add membership
-    db.collection("league_memberships").add({
-        "user_id": uid,
-        "league_id": league_id
-    })
-
     return jsonify({"status": "joined"})
 
+#Best lineups under the budget from cached prices and points; no per-driver reads
+@bp.route("/user/optimize_team")
+def optimize_team():
+    uid = get_current_user_id()
+    if not uid:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    objective = request.args.get("objective", "points")
+    limit = request.args.get("limit", 5, type=int)
+    budget = request.args.get("budget", TEAM_BUDGET, type=int)
+    if objective not in OBJECTIVES:
+        return jsonify({"error": f"objective must be one of {', '.join(OBJECTIVES)}"}), 400
+    if not 1 <= limit <= 50:
+        return jsonify({"error": "limit must be between 1 and 50"}), 400
+    budget = min(budget, TEAM_BUDGET)
+
+    teams = ref_cache.teams()
+
+    #A league's team_restriction (stored as the constructor name) or an explicit team
+    restriction = request.args.get("team")
+    league_id = request.args.get("league_id")
+    if league_id:
+        league_doc = db.collection("leagues").document(league_id).get()
+        if not league_doc.exists:
+            return jsonify({"error": "League not found"}), 404
+        restriction = league_doc.to_dict().get("team_restriction") or restriction
+
+    team_ids = None
+    if restriction:
+        team_ids = [tid for tid, t in teams.items() if restriction in (tid, t.get("name"))]
+        if not team_ids:
+            return jsonify({"error": f"Unknown constructor '{restriction}'"}), 400
+
+    lineups = optimize_lineups(ref_cache.drivers(), teams, budget, limit=limit,
+                               objective=objective, team_ids=team_ids)
+    return jsonify({
+        "objective": objective,
+        "budget": budget,
+        "team_restriction": restriction,
+        "lineups": lineups
+    })
+
 #Load fantasy team options within league
-@app.route("/user/teams")
+@bp.route("/user/teams")
 def get_user_teams():
     uid = get_current_user_id()
     if not uid:
         return jsonify({ "error": "Unauthorized" }), 401
 
-    teams = []
-    docs = db.collection("fantasy_teams").where("user_id", "==", uid).stream()
+    try:
+        limit, cursor, _ = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    for doc in docs:
-        team = doc.to_dict()
-        team["id"] = doc.id
-        teams.append({
-            "id": team["id"],
-            "name": team.get("name"),
-            "points": team.get("points", 0)
-        })
+    #Only the fields this dropdown renders
+    query = db.collection("fantasy_teams").where("user_id", "==", uid)
+    docs, next_cursor = paginate_query(query, limit, cursor, ["name", "points"])
 
-    return jsonify(teams)
+    teams = [{
+        "id": team["id"],
+        "name": team.get("name"),
+        "points": team.get("points", 0)
+    } for team in docs]
+
+    return page_response(teams, next_cursor, limit, cursor)
 
-@app.route("/user/fantasy_teams", methods=["GET", "POST"])
+@bp.route("/user/fantasy_teams", methods=["GET", "POST"])
 def handle_fantasy_teams():
     user_id = get_current_user_id()
     if not user_id:
@@ -658,8 +1105,8 @@ def handle_fantasy_teams():
         teams = []
 
         # Fetch readable names
-        drivers = {d.id: d.to_dict().get("name") for d in db.collection("drivers").stream()}
-        team_map = {t.id: t.to_dict().get("name") for t in db.collection("teams").stream()}
+        drivers = {did: d.get("name") for did, d in ref_cache.drivers().items()}
+        team_map = {tid: t.get("name") for tid, t in ref_cache.teams().items()}
 
         for doc in teams_ref:
             t = doc.to_dict()
@@ -678,33 +1125,41 @@ def handle_fantasy_teams():
 
         if len(driver_ids) != 5 or not team_id or not name:
             return jsonify({"error": "Missing or invalid selection"}), 400
+        #Totals count a driver once per pick while the index holds one entry per team,
+        #so a lineup must name five different drivers
+        if len(set(driver_ids)) != 5:
+            return jsonify({"error": "A team cannot pick the same driver twice"}), 400
+
+        refs = [db.collection("drivers").document(d_id) for d_id in driver_ids]
+        refs.append(db.collection("teams").document(team_id))
+        docs = get_many(db, refs)
+        if not all(docs):
+            return jsonify({"error": "Unknown driver or team"}), 400
 
-        total_price = 0
-        for d_id in driver_ids:
-            doc = db.collection("drivers").document(d_id).get()
-            total_price += doc.to_dict().get("price", 0)
-        team_doc = db.collection("teams").document(team_id).get()
-        total_price += team_doc.to_dict().get("price", 0)
+        total_price = sum(doc.to_dict().get("price", 0) for doc in docs)
 
-        if total_price > 100_000_000:
+        if total_price > TEAM_BUDGET:
             return jsonify({"error": "Budget exceeded"}), 400
 
-        new_team_ref = db.collection("fantasy_teams").add({
+        #The team and its index entries are written together, so a team is never left unindexed
+        new_team_ref = db.collection("fantasy_teams").document()
+        writes = [("replace", new_team_ref, {
             "user_id": user_id,
             "name": name,
             "drivers": driver_ids,
             "team": team_id,
             "price": total_price,
             "points": 0
-        })
+        })]
+        writes.extend(fantasy_index_writes(new_team_ref.id, driver_ids, team_id, user_id=user_id))
+        commit_batch(writes)
 
         # Recalculate points for the newly created team
-        new_team_id = new_team_ref[1].id
-        recalculate_fantasy_points_for_team(new_team_id)
+        recalculate_fantasy_points_for_team(new_team_ref.id)
 
         return jsonify({"status": "Fantasy team created successfully"}), 200
     
-@app.route("/user/fantasy_teams/<team_id>", methods=["DELETE"])
+@bp.route("/user/fantasy_teams/<team_id>", methods=["DELETE"])
 def delete_fantasy_team(team_id):
     user_id = get_current_user_id()
     if not user_id:
@@ -718,5 +1173,62 @@ def delete_fantasy_team(team_id):
     if team_data.get("user_id") != user_id:
         return jsonify({"error": "Forbidden"}), 403
 
-    db.collection("fantasy_teams").document(team_id).delete()
-    return jsonify({"status": "Fantasy team deleted"}), 200
\ No newline at end of file
+    writes = fantasy_index_writes(team_id, team_data.get("drivers", []), team_data.get("team"), remove=True)
+    writes.append(("delete", db.collection("fantasy_teams").document(team_id), None))
+    commit_batch(writes)
+
+    affected_leagues = leagues_for_fantasy_team(db, team_id)
+    if affected_leagues:
+        publish_scoring(standings_changes=refresh_league_standings(db, affected_leagues))
+    return jsonify({"status": "Fantasy team deleted"}), 200
+
+#Startup
+
+def warm_up():
+    #Fills the process's caches before it takes traffic; returns seconds per step
+    timings = {}
+    with metrics.track("startup:warm_up"):
+        for name, step in (
+            ("client", db.resolve),
+            ("reference_cache", lambda: (ref_cache.drivers(), ref_cache.teams())),
+            ("data_versions", data_versions.snapshot)
+        ):
+            started = time.perf_counter()
+            step()
+            timings[name] = time.perf_counter() - started
+    return timings
+
+def create_app(warm=None):
+    #warm=None follows WARM_UP=1 (token signing keys are preloaded either way); with gunicorn
+    #--preload the warmed caches are inherited by every worker, while clients and listeners
+    #are recreated per process after the fork
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder='static', template_folder='templates')
+    #Registered first so its after_request runs last and the timing includes compression
+    metrics.init_app(app)
+    app.after_request(compress_response)
+    app.register_blueprint(bp)
+    init_realtime(app, uid_from_token)
+
+    phases = {"factory": time.perf_counter() - started}
+    if "import" not in metrics.startup:
+        phases["import"] = started - IMPORT_STARTED
+    if warm if warm is not None else os.getenv("WARM_UP") == "1":
+        steps = warm_up()
+        phases["warm_up"] = sum(steps.values())
+        phases.update({f"warm_up:{name}": seconds for name, seconds in steps.items()})
+    #Always, not only with WARM_UP: otherwise the first authenticated request fetches the
+    #certificates. One HTTP fetch, and a failure only logs a warning.
+    if not (dev_auth or storage.is_memory(db)):
+        keys_started = time.perf_counter()
+        preload_signing_keys()
+        phases["signing_keys"] = time.perf_counter() - keys_started
+    metrics.record_startup(**phases)
+    log_event(log, logging.INFO, "startup", pid=os.getpid(), backend=storage.backend_name(),
+              **{phase: round(seconds * 1000, 1) for phase, seconds in phases.items()})
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    socketio.run(app)
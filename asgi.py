@@ -0,0 +1,234 @@
+import io
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from werkzeug.http import parse_accept_header
+from app import app as flask_app, db, ref_cache, metrics, uid_from_token
+from aio import AsyncClients, fetch, fetch_doc
+from httpcache import encode_body
+from metrics import DbStats, charged_to
+from memberships import joined_leagues_async
+from standings import read_standings_page_async, read_member_rank_async
+
+#ASGI entrypoint, e.g. `uvicorn asgi:app`. The user read endpoints below are coroutines on
+#the Firestore AsyncClient that gather the independent reads of a request, so one event
+#loop serves many concurrent users instead of holding a thread per request. Every other
+#route, Socket.IO long-polling included, is handed to the Flask app on a thread pool.
+#WebSocket upgrades are refused (Socket.IO clients stay on polling); serve app.py's
+#Socket.IO server where websockets are needed.
+
+FLASK_THREADS = int(os.getenv("ASGI_FLASK_THREADS", "32"))
+
+log = logging.getLogger(__name__)
+clients = AsyncClients(db)
+flask_pool = ThreadPoolExecutor(max_workers=FLASK_THREADS, thread_name_prefix="flask")
+
+class Request:
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = parse_qs(scope["query_string"].decode("latin-1"))
+        self.headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+
+    def arg_int(self, name):
+        #Like request.args.get(name, type=int): None when missing or not a number
+        try:
+            return int(self.query[name][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def user_id(self):
+        #Verification may fetch keys or check revocation, so it runs off the loop
+        token = self.headers.get("authorization", "").replace("Bearer ", "")
+        return await asyncio.to_thread(uid_from_token, token) if token else None
+
+#Async views: (request, **path params) -> (status, payload)
+
+async def get_fantasy_teams(request):
+    uid = await request.user_id()
+    if not uid:
+        return 401, {"error": "Unauthorized"}
+
+    query = clients.get().collection("fantasy_teams").where("user_id", "==", uid)
+    docs, drivers, teams = await asyncio.gather(
+        fetch(query), asyncio.to_thread(ref_cache.drivers), asyncio.to_thread(ref_cache.teams)
+    )
+    drivers = {did: d.get("name") for did, d in drivers.items()}
+    team_map = {tid: t.get("name") for tid, t in teams.items()}
+    result = []
+    for doc in docs:
+        team = doc.to_dict()
+        team["id"] = doc.id
+        team["driver_names"] = [drivers.get(did, "Unknown") for did in team.get("drivers", [])]
+        team["team_name"] = team_map.get(team.get("team"), "Unknown")
+        result.append(team)
+    return 200, result
+
+async def get_joined_leagues(request):
+    uid = await request.user_id()
+    if not uid:
+        return 401, {"error": "Unauthorized"}
+    return 200, await joined_leagues_async(clients.get(), uid)
+
+#Identical concurrent standings reads share one task, as @coalesce does for the Flask view
+_standings_flights = {}
+
+async def get_league_standings(request, league_id):
+    limit = request.arg_int("limit")
+    cursor = request.arg_int("cursor")
+    if limit is not None and not 1 <= limit <= 500:
+        return 400, {"error": "limit must be between 1 and 500"}
+
+    key = (league_id, limit, cursor)
+    flight = _standings_flights.get(key)
+    if flight is None:
+        flight = asyncio.ensure_future(read_standings_page_async(clients.get(), db, league_id, limit, cursor))
+        _standings_flights[key] = flight
+        flight.add_done_callback(lambda _: _standings_flights.pop(key, None))
+    entries, next_cursor = await asyncio.shield(flight)
+
+    if limit is None and cursor is None:
+        return 200, entries
+    return 200, {"entries": entries, "next_cursor": next_cursor}
+
+async def get_my_league_rank(request, league_id):
+    uid = await request.user_id()
+    if not uid:
+        return 401, {"error": "Unauthorized"}
+    entry = await read_member_rank_async(clients.get(), league_id, uid)
+    if not entry:
+        return 404, {"error": "Not ranked in this league"}
+    return 200, entry
+
+async def get_league_info(request, league_id):
+    doc = await fetch_doc(clients.get().collection("leagues").document(league_id))
+    if not doc.exists:
+        return 404, {"error": "League not found"}
+    league = doc.to_dict()
+    league["id"] = doc.id
+    return 200, league
+
+#Same rules (and metric labels) as the Flask routes they stand in for
+ROUTES = [
+    ("/user/fantasy_teams", get_fantasy_teams),
+    ("/user/leagues/joined", get_joined_leagues),
+    ("/user/leagues/<league_id>/standings", get_league_standings),
+    ("/user/leagues/<league_id>/standings/me", get_my_league_rank),
+    ("/user/leagues/<league_id>/info", get_league_info)
+]
+_compiled = [(rule, re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", rule) + "$"), view)
+             for rule, view in ROUTES]
+
+def match(method, path):
+    if method != "GET":
+        return None
+    for rule, pattern, view in _compiled:
+        found = pattern.match(path)
+        if found:
+            return rule, view, found.groupdict()
+    return None
+
+async def call_view(scope, send, rule, view, params):
+    request = Request(scope)
+    started = time.perf_counter()
+    with charged_to(DbStats()) as stats:
+        status, payload = await view(request, **params)
+
+    body = (flask_app.json.dumps(payload) + "\n").encode("utf-8")
+    headers = [(b"content-type", b"application/json")]
+    if status == 200:
+        body, encoding = encode_body(body, parse_accept_header(request.headers.get("accept-encoding")))
+        if encoding:
+            headers += [(b"content-encoding", encoding.encode("latin-1")), (b"vary", b"Accept-Encoding")]
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+    metrics.observe(rule, request.method, status, time.perf_counter() - started, stats)
+
+#Everything else runs on the Flask app
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-length":
+            continue
+        key = "CONTENT_TYPE" if name == "content-type" else "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def run_wsgi(environ):
+    #Returns (status code, headers, body); the response is buffered
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+        return chunks.append
+
+    result = flask_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+async def call_flask(scope, receive, send):
+    environ = wsgi_environ(scope, await read_body(receive))
+    status, headers, body = await asyncio.get_running_loop().run_in_executor(flask_pool, run_wsgi, environ)
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                flask_pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    elif scope["type"] == "websocket":
+        await send({"type": "websocket.close", "code": 1000})
+    else:
+        found = match(scope["method"], scope["path"])
+        if found:
+            await call_view(scope, send, *found)
+        else:
+            await call_flask(scope, receive, send)
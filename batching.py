@@ -0,0 +1,165 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import transforms
+
+#Batched multi-document reads: one get_all round-trip per chunk instead of one get() per document
+
+def get_many(db, refs, chunk_size=100, field_paths=None):
+    #Returns snapshots aligned with refs; None where the document does not exist.
+    #field_paths limits each snapshot to those fields.
+    unique = list({ref.path: ref for ref in refs}.values())
+    found = {}
+
+    for start in range(0, len(unique), chunk_size):
+        for snap in db.get_all(unique[start:start + chunk_size], field_paths=field_paths):
+            if snap.exists:
+                found[snap.reference.path] = snap
+
+    return [found.get(ref.path) for ref in refs]
+
+def get_many_dicts(db, refs, chunk_size=100):
+    return [snap.to_dict() if snap else None for snap in get_many(db, refs, chunk_size)]
+
+#Buffered bulk writes: 500-operation WriteBatch commits on a bounded thread pool, retried on transient errors.
+#Not atomic: each batch commits on its own and in parallel, so a BulkWriteError can leave
+#other batches applied. Callers that need all-or-nothing use a transaction.
+
+RETRYABLE_ERRORS = (gexc.Aborted, gexc.ServiceUnavailable, gexc.ResourceExhausted, gexc.InternalServerError)
+#Errors after which the commit may still have been applied (the response was lost)
+AMBIGUOUS_ERRORS = (gexc.ServiceUnavailable, gexc.InternalServerError)
+
+def has_increment(data):
+    if isinstance(data, transforms.Increment):
+        return True
+    return isinstance(data, dict) and any(has_increment(value) for value in data.values())
+
+class BulkWriteError(Exception):
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(f"{len(failures)} write batch(es) failed: {failures[0][1]}")
+
+class BulkWritePipeline:
+    def __init__(self, db, batch_size=500, max_workers=4, max_retries=3, backoff=0.5, retry_increments=False):
+        #retry_increments: also retry batches holding Increment transforms after ambiguous
+        #errors, where a commit that did land would be applied twice
+        self.db = db
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_increments = retry_increments
+        self.writes = 0
+        self.batches = 0
+        self.retries = 0
+        self.failures = []
+        self._pending = []
+        self._futures = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._started = None
+        self._finished = None
+
+    def set(self, ref, data, merge=False):
+        self._add(("set", ref, data, merge))
+
+    def update(self, ref, data):
+        self._add(("update", ref, data, False))
+
+    def delete(self, ref):
+        self._add(("delete", ref, None, False))
+
+    def flush(self):
+        if self._pending:
+            self._submit(self._pending)
+            self._pending = []
+        if self._futures:
+            wait(self._futures)
+            self._futures.clear()
+        self._finished = time.perf_counter()
+        if self.failures:
+            failures, self.failures = self.failures, []
+            raise BulkWriteError(failures)
+        return self.stats()
+
+    def close(self):
+        try:
+            return self.flush()
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def stats(self):
+        elapsed = ((self._finished or time.perf_counter()) - self._started) if self._started else 0.0
+        return {
+            "writes": self.writes,
+            "batches": self.batches,
+            "retries": self.retries,
+            "seconds": round(elapsed, 4),
+            "writes_per_sec": round(self.writes / elapsed, 1) if elapsed else 0.0
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return False
+
+    def _add(self, op):
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._pending.append(op)
+        if len(self._pending) >= self.batch_size:
+            self._submit(self._pending)
+            self._pending = []
+
+    def _submit(self, ops):
+        if self.max_workers <= 1:
+            self._commit(ops)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        #Back-pressure: never hold more than two batches per worker in flight
+        while len(self._futures) >= self.max_workers * 2:
+            done, self._futures = wait(self._futures, return_when=FIRST_COMPLETED)
+        self._futures.add(self._executor.submit(contextvars.copy_context().run, self._commit, ops))
+
+    def _commit(self, ops):
+        idempotent = self.retry_increments or not any(has_increment(data) for _, _, data, _ in ops)
+        for attempt in range(self.max_retries + 1):
+            batch = self.db.batch()
+            for op, ref, data, merge in ops:
+                if op == "set":
+                    batch.set(ref, data, merge=merge)
+                elif op == "delete":
+                    batch.delete(ref)
+                else:
+                    batch.update(ref, data)
+            try:
+                batch.commit()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries or (isinstance(e, AMBIGUOUS_ERRORS) and not idempotent):
+                    with self._lock:
+                        self.failures.append((len(ops), e))
+                    return
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff * (2 ** attempt))
+                continue
+            except Exception as e:
+                with self._lock:
+                    self.failures.append((len(ops), e))
+                return
+
+            with self._lock:
+                self.writes += len(ops)
+                self.batches += 1
+            return
@@ -0,0 +1,517 @@
+import os
+import sys
+import json
+import time
+import random
+import string
+import logging
+import argparse
+import platform
+import threading
+import contextlib
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+#Benchmark and load test: seeds a full season into the in-memory store, drives every
+#route with concurrent simulated users and times the recalculation entry points.
+#
+#  python bench.py --fantasy-teams 50000 --leagues 2000 --concurrency 16 --output bench_results.json
+#
+#Per-request reads/writes come from the memory engine's counters, so they are exact
+#and comparable between runs. Latencies are in-process (Flask test client, no network).
+
+F1_POINTS = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+BUDGET = 100_000_000
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a season and benchmark every route")
+    parser.add_argument("--drivers", type=int, default=20)
+    parser.add_argument("--constructors", type=int, default=10)
+    parser.add_argument("--races", type=int, default=24)
+    parser.add_argument("--fantasy-teams", type=int, default=50000)
+    parser.add_argument("--teams-per-user", type=int, default=2)
+    parser.add_argument("--leagues", type=int, default=2000)
+    parser.add_argument("--league-size", type=int, nargs=2, default=(5, 40), metavar=("MIN", "MAX"))
+    parser.add_argument("--requests", type=int, default=200, help="requests per route (heavy routes run fewer)")
+    parser.add_argument("--concurrency", type=int, default=16, help="simulated users in flight")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timed function")
+    parser.add_argument("--routes", default="", help="comma separated route names to run (default all)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json", help="JSON results path, - for stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's own output")
+    return parser.parse_args(argv)
+
+#Seeding
+
+def make_code(rng, taken):
+    while True:
+        code = "".join(rng.choices(string.ascii_uppercase + string.digits, k=6))
+        if code not in taken:
+            taken.add(code)
+            return code
+
+def race_results(rng, driver_ids):
+    order = rng.sample(driver_ids, len(driver_ids))
+    return {did: pts for did, pts in zip(order, F1_POINTS)}
+
+def build_season(args, rng):
+    #Raw documents only; points, the fantasy index and standings are derived by the app itself
+    team_ids = [f"team{i:02d}" for i in range(args.constructors)]
+    driver_ids = [f"driver{i:02d}" for i in range(args.drivers)]
+
+    drivers = {}
+    for i, did in enumerate(driver_ids):
+        drivers[did] = {
+            "name": f"Driver {i + 1}",
+            "team_id": team_ids[i % len(team_ids)],
+            "price": rng.randrange(5, 31) * 1_000_000,
+            "points": 0
+        }
+
+    teams = {}
+    for i, tid in enumerate(team_ids):
+        teams[tid] = {
+            "name": f"Constructor {i + 1}",
+            "drivers": [did for did in driver_ids if drivers[did]["team_id"] == tid],
+            "price": rng.randrange(10, 31) * 1_000_000,
+            "score": 0
+        }
+
+    races = {}
+    opening = datetime(2025, 3, 2)
+    for i in range(args.races):
+        rid = f"race{i + 1:02d}"
+        results = race_results(rng, driver_ids)
+        races[rid] = {
+            "name": f"Grand Prix {i + 1}",
+            "date": (opening + timedelta(days=14 * i)).strftime("%Y-%m-%d"),
+            "results": results
+        }
+
+    #Lineups that fit the budget, reused across fantasy teams
+    lineups = []
+    while len(lineups) < 500:
+        picks = rng.sample(driver_ids, 5)
+        tid = rng.choice(team_ids)
+        price = sum(drivers[did]["price"] for did in picks) + teams[tid]["price"]
+        if price <= BUDGET:
+            lineups.append((picks, tid, price))
+
+    user_count = max(1, args.fantasy_teams // args.teams_per_user)
+    users = {f"user{i:05d}": {"email": f"user{i}@example.com", "username": f"user{i}", "role": "user"}
+             for i in range(user_count)}
+    user_ids = sorted(users)
+
+    fantasy_teams = {}
+    teams_by_user = {}
+    for i in range(args.fantasy_teams):
+        fid = f"fantasy{i:06d}"
+        uid = user_ids[i % user_count]
+        picks, tid, price = rng.choice(lineups)
+        fantasy_teams[fid] = {"user_id": uid, "name": f"Team {i}", "drivers": list(picks),
+                              "team": tid, "price": price, "points": 0}
+        teams_by_user.setdefault(uid, []).append(fid)
+
+    leagues = {}
+    memberships = {}
+    codes = set()
+    for i in range(args.leagues):
+        lid = f"league{i:05d}"
+        private = i % 2 == 1
+        leagues[lid] = {
+            "name": f"League {i}",
+            "type": "private" if private else "public",
+            "team_restriction": rng.choice(team_ids) if i % 10 == 0 else None,
+            "created_by": "admin",
+            "created_at": opening
+        }
+        if private:
+            leagues[lid]["code"] = make_code(rng, codes)
+        for uid in rng.sample(user_ids, min(len(user_ids), rng.randint(*args.league_size))):
+            memberships[f"m{len(memberships):07d}"] = {
+                "user_id": uid,
+                "league_id": lid,
+                "joined_at": opening,
+                "team_id": rng.choice(teams_by_user[uid])
+            }
+
+    return {
+        "drivers": drivers,
+        "teams": teams,
+        "races": races,
+        "users": users,
+        "fantasy_teams": fantasy_teams,
+        "leagues": leagues,
+        "league_memberships": memberships
+    }, lineups
+
+def seed(app_module, args, rng):
+    started = time.perf_counter()
+    data, lineups = build_season(args, rng)
+    app_module.db.load(data)
+    built = time.perf_counter()
+
+    #Derive everything else through the app's own code paths
+    app_module.recompute_season(app_module.db)
+    app_module.rebuild_fantasy_team_index()
+    app_module.rebuild_membership_index(app_module.db)
+    app_module.refresh_league_standings(app_module.db)
+    app_module.join_codes.backfill()
+    app_module.update_progression()
+    app_module.render_all_snapshots(app_module.db, app_module.ref_cache.drivers(), app_module.ref_cache.teams())
+    app_module.mark_changed("drivers", "teams", "races", "leagues")
+    finished = time.perf_counter()
+
+    counts = {collection: len(docs) for collection, docs in data.items()}
+    counts["seconds"] = {"build": round(built - started, 3), "derive": round(finished - built, 3)}
+    return data, lineups, counts
+
+#Scenarios
+
+class Context:
+    def __init__(self, app_module, data, lineups, rng):
+        self.app = app_module
+        self.data = data
+        self.lineups = lineups
+        self.rng = rng
+        self._rng_lock = threading.Lock()
+        self.driver_ids = sorted(data["drivers"])
+        self.team_ids = sorted(data["teams"])
+        self.race_ids = sorted(data["races"])
+        self.user_ids = sorted(data["users"])
+        self.public_leagues = sorted(lid for lid, l in data["leagues"].items() if l["type"] == "public")
+        self.private_codes = sorted(l["code"] for l in data["leagues"].values() if l.get("code"))
+        self.memberships = list(data["league_memberships"].values())
+        self.teams_by_user = {}
+        for fid, team in data["fantasy_teams"].items():
+            self.teams_by_user.setdefault(team["user_id"], []).append(fid)
+        self.job_ids = []
+
+    def choice(self, items):
+        with self._rng_lock:
+            return self.rng.choice(items)
+
+    def user(self):
+        return self.choice(self.user_ids)
+
+def throwaway_teams(ctx, count):
+    #Fresh teams for the delete scenario, created through the real POST route
+    client = ctx.app.app.test_client()
+    owned = []
+    for i in range(count):
+        uid = ctx.user()
+        picks, tid, _ = ctx.choice(ctx.lineups)
+        client.post("/user/fantasy_teams", json={"name": f"Throwaway {i}", "drivers": picks, "team": tid},
+                    headers={"Authorization": f"Bearer {uid}"})
+        before = set(ctx.teams_by_user.get(uid, []))
+        docs = ctx.app.db.collection("fantasy_teams").where("user_id", "==", uid).stream()
+        new = [doc.id for doc in docs if doc.id not in before]
+        if new:
+            ctx.teams_by_user.setdefault(uid, []).extend(new)
+            owned.append((uid, new[0]))
+    return owned
+
+def scenarios(ctx):
+    #Each scenario: name, share of --requests, build(ctx, i, prepared) -> (method, path, uid, json)
+    def get(path, uid=None):
+        return ("GET", path, uid, None)
+
+    def member():
+        return ctx.choice(ctx.memberships)
+
+    def race_payload(ctx, i, prepared):
+        rid = ctx.choice(ctx.race_ids)
+        race = ctx.data["races"][rid]
+        with ctx._rng_lock:
+            results = race_results(ctx.rng, ctx.driver_ids)
+        return ("PUT", "/admin/update/races", None,
+                {"id": rid, "name": race["name"], "date": race["date"], "results": results})
+
+    def driver_payload(ctx, i, prepared):
+        did = ctx.choice(ctx.driver_ids)
+        driver = ctx.app.db.collection("drivers").document(did).get().to_dict()
+        return ("PUT", "/admin/update/drivers", None,
+                {"id": did, "name": driver["name"], "price": driver["price"], "team_id": driver["team_id"]})
+
+    def team_payload(ctx, i, prepared):
+        tid = ctx.choice(ctx.team_ids)
+        team = ctx.app.db.collection("teams").document(tid).get().to_dict()
+        return ("PUT", "/admin/update/teams", None,
+                {"id": tid, "name": team["name"], "drivers": team["drivers"], "price": team["price"]})
+
+    def import_payload(dry_run):
+        #A JSONL upload re-entering a few existing races with fresh results. It draws from its
+        #own generator so adding it leaves the other scenarios' picks unchanged.
+        def build(ctx, i, prepared):
+            rng = random.Random(f"import-{i}")
+            lines = []
+            for rid in rng.sample(ctx.race_ids, min(3, len(ctx.race_ids))):
+                race = ctx.data["races"][rid]
+                lines.append(json.dumps({"id": rid, "name": race["name"], "date": race["date"],
+                                         "results": race_results(rng, ctx.driver_ids)}))
+            path = "/admin/import/races?format=jsonl" + ("&dry_run=1" if dry_run else "")
+            return ("POST", path, None, "\n".join(lines) + "\n")
+        return build
+
+    def new_fantasy_team(ctx, i, prepared):
+        picks, tid, _ = ctx.choice(ctx.lineups)
+        return ("POST", "/user/fantasy_teams", ctx.user(), {"name": f"Bench {i}", "drivers": picks, "team": tid})
+
+    def league_payload(kind):
+        def build(ctx, i, prepared):
+            league = {"name": f"Bench league {i}", "type": "private" if i % 2 else "public", "team_restriction": None}
+            path = {"admin": "/admin/create_league", "user": "/user/create_league", "update": "/admin/update/leagues"}[kind]
+            return ("POST", path, ctx.user() if kind == "user" else None, league)
+        return build
+
+    def set_league_team(ctx, i, prepared):
+        m = member()
+        return ("POST", "/user/update_team_in_league", m["user_id"],
+                {"league_id": m["league_id"], "team_id": ctx.choice(ctx.teams_by_user[m["user_id"]])})
+
+    def latest_job(ctx, i, prepared):
+        return get(f"/admin/jobs/{ctx.choice(ctx.job_ids)}" if ctx.job_ids else "/admin/jobs/missing")
+
+    return [
+        ("home", 1.0, lambda ctx, i, p: get("/")),
+        ("admin_dashboard", 1.0, lambda ctx, i, p: get("/admin_dashboard")),
+        ("user_dashboard", 1.0, lambda ctx, i, p: get("/user_dashboard")),
+        ("leagues_page", 1.0, lambda ctx, i, p: get("/leagues")),
+        ("user_data_page", 1.0, lambda ctx, i, p: get("/user_data")),
+        ("assign_user_role", 0.25, lambda ctx, i, p: ("POST", "/assign_user_role", None,
+            {"uid": f"bench{i:05d}", "email": f"bench{i}@example.com", "username": f"bench{i}"})),
+        ("admin_teams", 1.0, lambda ctx, i, p: get("/admin/data/teams")),
+        ("admin_update_team", 0.1, team_payload),
+        ("admin_drivers", 1.0, lambda ctx, i, p: get("/admin/data/drivers")),
+        ("admin_drivers_page", 1.0, lambda ctx, i, p: get("/admin/data/drivers?limit=5&fields=name,points")),
+        ("cache_stats", 1.0, lambda ctx, i, p: get("/admin/cache/stats")),
+        ("metrics", 1.0, lambda ctx, i, p: get("/metrics")),
+        ("admin_driver", 1.0, lambda ctx, i, p: get(f"/admin/data/driver/{ctx.choice(ctx.driver_ids)}")),
+        ("admin_update_driver", 0.1, driver_payload),
+        ("admin_races", 1.0, lambda ctx, i, p: get("/admin/data/races")),
+        ("admin_update_race", 0.1, race_payload),
+        ("admin_job", 1.0, latest_job),
+        ("admin_import_races_dry_run", 0.25, import_payload(True)),
+        ("admin_import_races", 0.05, import_payload(False)),
+        ("admin_recalculate_dry_run", 0.02, lambda ctx, i, p: ("POST", "/admin/recalculate?dry_run=1", None, None)),
+        ("race_results", 1.0, lambda ctx, i, p: get(f"/user/race_results/{ctx.choice(ctx.race_ids)}")),
+        ("admin_leagues", 0.1, lambda ctx, i, p: get("/admin/data/leagues")),
+        ("admin_leagues_page", 1.0, lambda ctx, i, p: get("/admin/data/leagues?limit=50")),
+        ("admin_create_league", 0.25, league_payload("admin")),
+        ("user_create_league", 0.25, league_payload("user")),
+        ("admin_update_league", 0.25, league_payload("update")),
+        ("public_leagues", 0.1, lambda ctx, i, p: get("/user/leagues/public")),
+        ("public_leagues_page", 1.0, lambda ctx, i, p: get("/user/leagues/public?limit=50")),
+        ("joined_leagues", 1.0, lambda ctx, i, p: get("/user/leagues/joined", ctx.user())),
+        ("update_team_in_league", 0.25, set_league_team),
+        ("league_standings", 1.0, lambda ctx, i, p: get(f"/user/leagues/{member()['league_id']}/standings")),
+        ("league_standings_page", 1.0, lambda ctx, i, p: get(f"/user/leagues/{member()['league_id']}/standings?limit=10")),
+        ("my_league_rank", 1.0, lambda ctx, i, p: (lambda m: get(f"/user/leagues/{m['league_id']}/standings/me", m["user_id"]))(member())),
+        ("league_progression", 1.0, lambda ctx, i, p: get(f"/user/progression/leagues/{member()['league_id']}")),
+        ("driver_progression", 1.0, lambda ctx, i, p: get(f"/user/progression/drivers/{ctx.choice(ctx.driver_ids)}")),
+        ("fantasy_team_progression", 1.0, lambda ctx, i, p: (lambda uid: get(
+            f"/user/progression/fantasy_teams/{ctx.choice(ctx.teams_by_user[uid])}", uid))(ctx.choice(sorted(ctx.teams_by_user)))),
+        ("league_info", 1.0, lambda ctx, i, p: get(f"/user/leagues/{member()['league_id']}/info")),
+        ("join_private_league", 0.5, lambda ctx, i, p: ("POST", "/user/join_private_league", ctx.user(),
+            {"code": ctx.choice(ctx.private_codes)})),
+        ("join_public_league", 0.5, lambda ctx, i, p: ("POST", "/user/join_public_league", ctx.user(),
+            {"league_id": ctx.choice(ctx.public_leagues)})),
+        ("user_teams", 1.0, lambda ctx, i, p: get("/user/teams", ctx.user())),
+        ("fantasy_teams", 1.0, lambda ctx, i, p: get("/user/fantasy_teams", ctx.user())),
+        ("optimize_team", 1.0, lambda ctx, i, p: get("/user/optimize_team?limit=5", ctx.user())),
+        ("optimize_team_value", 1.0, lambda ctx, i, p: get(f"/user/optimize_team?objective=value&team={ctx.choice(ctx.team_ids)}", ctx.user())),
+        ("create_fantasy_team", 0.25, new_fantasy_team),
+        ("delete_fantasy_team", 0.1, lambda ctx, i, p: ("DELETE", f"/user/fantasy_teams/{p[i][1]}", p[i][0], None))
+    ]
+
+PREPARE = {"delete_fantasy_team": throwaway_teams}
+
+#Running
+
+_local = threading.local()
+
+def client_for(app_module):
+    #One test client per worker thread
+    if getattr(_local, "client", None) is None:
+        _local.client = app_module.app.test_client()
+    return _local.client
+
+def wait_for_jobs(ctx, job_ids, timeout=600):
+    deadline = time.monotonic() + timeout
+    pending = set(job_ids)
+    while pending and time.monotonic() < deadline:
+        for job_id in list(pending):
+            job = ctx.app.race_jobs.get(job_id)
+            if not job or job["status"] in ("done", "failed"):
+                pending.discard(job_id)
+        if pending:
+            time.sleep(0.02)
+    return not pending
+
+def latency_summary(latencies, wall_seconds):
+    values = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0, 0, 0)
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(values.mean()), 3) if len(values) else 0.0,
+        "max_ms": round(float(values.max()), 3) if len(values) else 0.0,
+        "throughput_rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0
+    }
+
+def per_request(before, after, count):
+    return {key: round((after[key] - before[key]) / count, 2) if count else 0.0 for key in after}
+
+def run_scenario(ctx, name, build, count, concurrency):
+    prepared = PREPARE[name](ctx, count) if name in PREPARE else None
+    if prepared is not None:
+        count = len(prepared)
+    if not count:
+        return None
+
+    requests = [build(ctx, i, prepared) for i in range(count)]
+    latencies = [None] * count
+    statuses = {}
+    status_lock = threading.Lock()
+
+    def send(i):
+        method, path, uid, payload = requests[i]
+        headers = {"Authorization": f"Bearer {uid}"} if uid else {}
+        client = client_for(ctx.app)
+        started = time.perf_counter()
+        #Raw string payloads are uploads, everything else is sent as JSON
+        send_as = {"data": payload} if isinstance(payload, str) else {"json": payload}
+        response = client.open(path, method=method, headers=headers, **send_as)
+        latencies[i] = time.perf_counter() - started
+        body = response.get_json(silent=True) if response.is_json else None
+        with status_lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if isinstance(body, dict) and body.get("job_id"):
+                ctx.job_ids.append(body["job_id"])
+
+    jobs_before = len(ctx.job_ids)
+    db_before = ctx.app.db.snapshot_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(count)))
+    wall = time.perf_counter() - started
+
+    #Background scoring triggered by these requests counts toward their reads/writes
+    wait_for_jobs(ctx, ctx.job_ids[jobs_before:])
+    db_after = ctx.app.db.snapshot_stats()
+
+    result = {"requests": count, "concurrency": concurrency, "wall_seconds": round(wall, 3),
+              "statuses": {str(code): n for code, n in sorted(statuses.items())}}
+    result.update(latency_summary(latencies, wall))
+    result["db_per_request"] = per_request(db_before, db_after, count)
+    return result
+
+def time_function(ctx, fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        db_before = ctx.app.db.snapshot_stats()
+        started = time.perf_counter()
+        extra = fn() or {}
+        elapsed = time.perf_counter() - started
+        run = {"seconds": round(elapsed, 4), "db": per_request(db_before, ctx.app.db.snapshot_stats(), 1)}
+        run.update(extra)
+        runs.append(run)
+    seconds = [run["seconds"] for run in runs]
+    return {"runs": runs, "min_seconds": min(seconds), "median_seconds": round(float(np.median(seconds)), 4)}
+
+def timed_update_race(ctx):
+    #End to end: 202 from the route, then the background scoring pass to completion
+    client = client_for(ctx.app)
+    rid = ctx.choice(ctx.race_ids)
+    race = ctx.data["races"][rid]
+    with ctx._rng_lock:
+        results = race_results(ctx.rng, ctx.driver_ids)
+    started = time.perf_counter()
+    response = client.put("/admin/update/races", json={"id": rid, "name": race["name"], "date": race["date"], "results": results})
+    submitted = time.perf_counter() - started
+    job_id = response.get_json()["job_id"]
+    wait_for_jobs(ctx, [job_id])
+    job = ctx.app.race_jobs.get(job_id)
+    return {"submit_seconds": round(submitted, 4), "job_status": job["status"], "job_timings": job["timings"]}
+
+def run_functions(ctx, repeat):
+    app_module = ctx.app
+    return {
+        "recalculate_driver_and_team_points": time_function(ctx, app_module.recalculate_driver_and_team_points, repeat),
+        "recalculate_fantasy_points_on_startup": time_function(ctx, app_module.recalculate_fantasy_points_on_startup, repeat),
+        "recompute_season": time_function(ctx, lambda: {"changed": app_module.recompute_season(app_module.db)["changed"]}, repeat),
+        "update_race": time_function(ctx, lambda: timed_update_race(ctx), repeat)
+    }
+
+def print_summary(results, stream):
+    print(f"\n{'route':32} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'reads':>9} {'writes':>8}", file=stream)
+    for name, r in results["routes"].items():
+        db = r["db_per_request"]
+        print(f"{name:32} {r['requests']:>5} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['throughput_rps']:>9} {db['reads']:>9} {db['writes']:>8}", file=stream)
+    print(f"\n{'function':40} {'min s':>9} {'median s':>9}", file=stream)
+    for name, r in results["functions"].items():
+        print(f"{name:40} {r['min_seconds']:>9} {r['median_seconds']:>9}", file=stream)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    #The app builds its clients at import time, so the backend is chosen before importing it
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ["DEV_AUTH"] = "1"
+    os.environ.pop("STORAGE_MEMORY_SEED", None)
+    os.environ.setdefault("JOB_COALESCE_SECONDS", "0.5")
+
+    summary_stream = sys.stdout
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+        import app as app_module
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        rng = random.Random(args.seed)
+        print(f"Seeding {args.fantasy_teams} fantasy teams and {args.leagues} leagues...", file=summary_stream)
+        data, lineups, seeded = seed(app_module, args, rng)
+        ctx = Context(app_module, data, lineups, rng)
+
+        wanted = {name.strip() for name in args.routes.split(",") if name.strip()}
+        routes = {}
+        for name, share, build in scenarios(ctx):
+            if wanted and name not in wanted:
+                continue
+            count = max(2, int(args.requests * share))
+            print(f"  {name} x{count}", file=summary_stream)
+            result = run_scenario(ctx, name, build, count, args.concurrency)
+            if result:
+                routes[name] = result
+
+        print("Timing recalculation functions...", file=summary_stream)
+        functions = run_functions(ctx, args.repeat)
+
+    if quiet:
+        quiet.close()
+
+    results = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "job_coalesce_seconds": float(os.environ["JOB_COALESCE_SECONDS"]),
+        "seeded": seeded,
+        "routes": routes,
+        "functions": functions,
+        "db_totals": app_module.db.snapshot_stats()
+    }
+
+    print_summary(results, summary_stream)
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2, default=str)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"\nResults written to {args.output}", file=summary_stream)
+    return results
+
+if __name__ == "__main__":
+    main()
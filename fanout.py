@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+#Bounded concurrent fan-out for independent per-item Firestore calls.
+#One shared pool per process; each call caps its own in-flight items.
+
+MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class FanOutError(Exception):
+    def __init__(self, errors, results):
+        #errors: item -> exception, results: per-item results (None where failed)
+        self.errors = errors
+        self.results = results
+        first = next(iter(errors.values()))
+        super().__init__(f"{len(errors)} of {len(results)} calls failed: {first!r}")
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fanout")
+        return _executor
+
+def _reset_after_fork():
+    #The parent's pool threads don't exist in a forked child
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def fan_out(fn, items, max_workers=8, timeout=10.0):
+    #Runs fn(item) for every item, at most max_workers at a time; results keep item order
+    items = list(items)
+    results = [None] * len(items)
+    errors = {}
+    if not items:
+        return results
+
+    executor = get_executor()
+    gate = threading.Semaphore(max(1, min(max_workers, MAX_WORKERS)))
+    deadline = time.monotonic() + timeout
+
+    def run(item):
+        try:
+            return fn(item)
+        finally:
+            gate.release()
+
+    futures = []
+    for item in items:
+        if not gate.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            futures.append(None)
+            continue
+        #Each call runs in a copy of the caller's context so per-request metrics follow it
+        futures.append(executor.submit(contextvars.copy_context().run, run, item))
+
+    for index, (item, future) in enumerate(zip(items, futures)):
+        if future is None:
+            errors[item] = TimeoutError(f"not started within {timeout}s")
+            continue
+        try:
+            results[index] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            errors[item] = TimeoutError(f"no result within {timeout}s")
+        except Exception as e:
+            errors[item] = e
+
+    if errors:
+        raise FanOutError(errors, results)
+    return results
@@ -0,0 +1,169 @@
+import os
+import gzip
+import hashlib
+import logging
+import threading
+from functools import wraps
+from flask import request, make_response, jsonify
+from firebase_admin import firestore
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#Version counters for read endpoints. meta/data_versions holds one counter per
+#resource; a snapshot listener mirrors it so ETag checks never touch Firestore.
+
+VERSIONS_COLLECTION = "meta"
+VERSIONS_DOCUMENT = "data_versions"
+
+log = logging.getLogger(__name__)
+
+class DataVersions:
+    def __init__(self, db, listen=True):
+        self.db = db
+        self.listen = listen
+        self._versions = None
+        self._watch = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def ref(self):
+        return self.db.collection(VERSIONS_COLLECTION).document(VERSIONS_DOCUMENT)
+
+    def snapshot(self):
+        with self._lock:
+            versions, watching = self._versions, self._watch is not None
+        if versions is not None:
+            if not watching:
+                self._start_watch()
+            return versions
+        doc = self.ref.get()
+        data = doc.to_dict() if doc.exists else {}
+        with self._lock:
+            if self._versions is None:
+                self._versions = data
+        self._start_watch()
+        return self._versions
+
+    def get(self, *resources):
+        versions = self.snapshot()
+        return tuple(int(versions.get(r, 0) or 0) for r in resources)
+
+    def last_modified(self, *resources):
+        versions = self.snapshot()
+        stamps = [versions.get(f"{r}_at") for r in resources]
+        stamps = [s for s in stamps if s is not None and hasattr(s, "timestamp")]
+        return max(stamps) if stamps else None
+
+    def bump(self, *resources):
+        update = {}
+        for r in resources:
+            update[r] = firestore.Increment(1)
+            update[f"{r}_at"] = firestore.SERVER_TIMESTAMP
+        self.ref.set(update, merge=True)
+
+        #Reflect locally right away; the listener will deliver the authoritative values
+        with self._lock:
+            if self._versions is not None:
+                local = dict(self._versions)
+                for r in resources:
+                    local[r] = int(local.get(r, 0) or 0) + 1
+                self._versions = local
+
+    def _after_fork(self):
+        #The parent's listener is gone; the next snapshot() starts one in the child
+        self._lock = threading.Lock()
+        self._watch = None
+
+    def _start_watch(self):
+        if not self.listen:
+            return
+        with self._lock:
+            if self._watch is not None:
+                return
+            self._watch = False
+
+        def on_snapshot(docs, changes, read_time):
+            for doc in docs:
+                if doc.exists:
+                    with self._lock:
+                        self._versions = doc.to_dict()
+
+        try:
+            watch = self.ref.on_snapshot(on_snapshot)
+        except Exception as e:
+            #Left as False so requests don't retry it; versions then refresh on bump() only
+            log.warning("Version listener not started: %s", e)
+            return
+        with self._lock:
+            self._watch = watch
+
+def conditional(versions, *resources):
+    #ETag/Last-Modified for a read view that only depends on the given resources
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            key = "|".join([request.full_path] + [str(v) for v in versions.get(*resources)])
+            etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+            last_modified = versions.last_modified(*resources)
+
+            not_modified = request.if_none_match.contains_weak(etag) if request.if_none_match else (
+                last_modified is not None and request.if_modified_since is not None
+                and last_modified.replace(microsecond=0) <= request.if_modified_since
+            )
+            if not_modified:
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapped
+    return decorator
+
+def cached_json(payload, etag, max_age=3600, stale_while_revalidate=604800):
+    #ETag on content that only changes when it is regenerated; clients and CDNs reuse it
+    #for max_age and then revalidate in the background. Weak, because compress_response
+    #sends gzip, br and identity bodies under the same tag.
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(jsonify(payload))
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+    return response
+
+def compress_response(response, min_size=1024, level=6):
+    #after_request hook: gzip/brotli for large JSON bodies
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != "application/json"
+            or "Content-Encoding" in response.headers):
+        return response
+
+    data, encoding = encode_body(response.get_data(), request.accept_encodings, min_size, level)
+    if not encoding:
+        return response
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+def encode_body(data, accepted, min_size=1024, level=6):
+    #accepted: the parsed Accept-Encoding header; returns (body, encoding or None)
+    if len(data) < min_size:
+        return data, None
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(data, quality=5), "br"
+    if accepted["gzip"]:
+        return gzip.compress(data, compresslevel=level), "gzip"
+    return data, None
@@ -0,0 +1,244 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime, timezone
+
+#Background job queue. Submissions that arrive within the coalescing window are
+#handed to the processor together, so a burst of admin edits costs one scoring pass.
+#Jobs run in the process that accepted them. Each queue heartbeats job_workers/{worker_id}
+#while it has unfinished jobs; a queued or running job whose worker has stopped beating
+#(a restart or crash) is marked failed, so pollers stop waiting and it can be resubmitted.
+
+JOBS_COLLECTION = "jobs"
+WORKERS_COLLECTION = "job_workers"
+UNFINISHED = ("queued", "running")
+
+log = logging.getLogger(__name__)
+
+class JobQueue:
+    def __init__(self, db, process, window=2.0, persist=True, max_jobs=1000, heartbeat=15.0, orphan_after=60.0):
+        #process(jobs, report) handles a list of job dicts; report(stage, done, total) updates progress.
+        #orphan_after: seconds without a heartbeat before another process gives a worker's jobs up
+        self.db = db
+        self.process = process
+        self.window = window
+        self.persist = persist
+        self.max_jobs = max_jobs
+        self.heartbeat = heartbeat
+        self.orphan_after = orphan_after
+        self.worker_id = uuid.uuid4().hex
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._recovered = False
+        self._last_beat = 0.0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def submit(self, kind, payload):
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "payload": payload,
+            "progress": {"stage": "queued", "done": 0, "total": 0},
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "coalesced_with": [],
+            "result": None,
+            "error": None,
+            "worker_id": self.worker_id
+        }
+        #The record has to exist before the job is accepted, or nobody could track it
+        self._beat()
+        self._save(job, required=True)
+        with self._lock:
+            self.jobs[job["id"]] = job
+            #Forget the oldest finished jobs; their records stay in Firestore
+            finished = [jid for jid, j in self.jobs.items() if j["finished_at"]]
+            for jid in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[jid]
+        self._ensure_worker()
+        self._queue.put(job["id"])
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return self._public(job)
+        if self.persist:
+            doc = self.db.collection(JOBS_COLLECTION).document(job_id).get()
+            if doc.exists:
+                job = doc.to_dict()
+                if job.get("status") in UNFINISHED and self._orphaned(job, {}):
+                    job = self._fail_orphan(doc.reference, job)
+                return job
+        return None
+
+    def recover_orphans(self):
+        #Fails unfinished jobs whose worker is gone; returns how many
+        if not self.persist:
+            return 0
+        beats = {}
+        count = 0
+        for doc in self.db.collection(JOBS_COLLECTION).where("status", "in", list(UNFINISHED)).stream():
+            job = doc.to_dict()
+            if self._orphaned(job, beats):
+                self._fail_orphan(doc.reference, job)
+                count += 1
+        if count:
+            log.warning("Marked %d orphaned job(s) failed", count)
+        return count
+
+    def _orphaned(self, job, beats):
+        #beats: worker id -> last heartbeat, shared across one sweep
+        worker_id = job.get("worker_id")
+        if worker_id == self.worker_id:
+            with self._lock:
+                return job.get("id") not in self.jobs
+        if worker_id not in beats:
+            doc = self.db.collection(WORKERS_COLLECTION).document(worker_id).get() if worker_id else None
+            beats[worker_id] = doc.to_dict().get("beat_at", 0) if doc and doc.exists else 0
+        return time.time() - beats[worker_id] > self.orphan_after
+
+    def _fail_orphan(self, ref, job):
+        update = {
+            "status": "failed",
+            "error": "The worker running this job stopped before it finished; submit it again",
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "progress": {**(job.get("progress") or {}), "stage": "failed"}
+        }
+        try:
+            ref.update(update)
+        except Exception as e:
+            log.warning("Could not mark job %s failed: %s", job.get("id"), e)
+        return {**job, **update}
+
+    def _after_fork(self):
+        #Queued work belongs to the parent's worker; a child starts empty with its own
+        self.worker_id = uuid.uuid4().hex
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._recovered = False
+        self._last_beat = 0.0
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="job-worker", daemon=True)
+                self._worker.start()
+                threading.Thread(target=self._beat_loop, name="job-heartbeat", daemon=True).start()
+
+    def _beat(self):
+        if not self.persist:
+            return
+        self.db.collection(WORKERS_COLLECTION).document(self.worker_id).set({
+            "beat_at": time.time(),
+            "pid": os.getpid()
+        })
+        self._last_beat = time.time()
+
+    def _beat_loop(self):
+        worker = self._worker
+        while worker.is_alive() and worker is self._worker:
+            time.sleep(self.heartbeat)
+            with self._lock:
+                busy = any(job["finished_at"] is None for job in self.jobs.values())
+            if busy:
+                try:
+                    self._beat()
+                except Exception as e:
+                    log.warning("Job heartbeat failed: %s", e)
+
+    def _run(self):
+        if not self._recovered:
+            self._recovered = True
+            try:
+                self.recover_orphans()
+            except Exception as e:
+                log.warning("Could not check for orphaned jobs: %s", e)
+        while True:
+            job_ids = [self._queue.get()]
+
+            #Coalesce everything that lands within the window
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job_ids.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                batch = [self.jobs[jid] for jid in job_ids if jid in self.jobs]
+            self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.time()
+        ids = [job["id"] for job in batch]
+        for job in batch:
+            job.update(status="running", started_at=started,
+                       coalesced_with=[jid for jid in ids if jid != job["id"]])
+            self._save(job)
+
+        def report(stage, done=0, total=0):
+            #Persisted on stage changes, so pollers on other workers see progress too
+            changed = batch and batch[0]["progress"]["stage"] != stage
+            for job in batch:
+                job["progress"] = {"stage": stage, "done": done, "total": total}
+                if changed:
+                    self._save(job)
+
+        try:
+            results = self.process(batch, report) or {}
+            status, error = "done", None
+        except Exception as e:
+            log.exception("Job batch %s failed", ids)
+            results, status, error = {}, "failed", str(e)
+
+        finished = time.time()
+        for job in batch:
+            job_result = results.get(job["id"], {})
+            job_error = error or job_result.get("error")
+            job.update(
+                status="failed" if job_error else status,
+                error=job_error,
+                result=job_result,
+                finished_at=finished
+            )
+            job["progress"]["stage"] = job["status"]
+            self._save(job)
+
+        log.info("Processed %d coalesced job(s) in %.3fs", len(batch), finished - started)
+
+    def _public(self, job):
+        public = {k: v for k, v in job.items() if k != "payload"}
+        public["progress"] = dict(job["progress"])
+        public["timings"] = {
+            "queued_seconds": round((job["started_at"] or time.time()) - job["submitted_at"], 3),
+            "run_seconds": round(job["finished_at"] - job["started_at"], 3) if job["finished_at"] else None
+        }
+        for key in ("submitted_at", "started_at", "finished_at"):
+            if public[key] is not None:
+                public[key] = datetime.fromtimestamp(public[key], tz=timezone.utc).isoformat()
+        return public
+
+    def _save(self, job, required=False):
+        if not self.persist:
+            return
+        try:
+            self.db.collection(JOBS_COLLECTION).document(job["id"]).set(self._public(job))
+        except Exception as e:
+            if required:
+                raise
+            log.warning("Could not persist job %s: %s", job["id"], e)
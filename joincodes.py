@@ -0,0 +1,174 @@
+import random
+import string
+import logging
+import threading
+from collections import OrderedDict
+from firebase_admin import firestore
+import storage
+
+#Join codes for private leagues. league_codes/{code} reserves a code for one league;
+#the reservation and the league document are written in the same transaction, so a
+#code can never be handed out twice. Joins resolve codes through an LRU in front of it.
+
+CODES_COLLECTION = "league_codes"
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+
+log = logging.getLogger(__name__)
+
+class CodeAllocationError(Exception):
+    pass
+
+def normalize_code(code):
+    return (code or "").strip().upper()
+
+class JoinCodes:
+    def __init__(self, db, candidates=5, max_size=50000):
+        #candidates: codes checked per allocation, all in one batched read
+        self.db = db
+        self.candidates = candidates
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.allocations = 0
+        self.collisions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def code_ref(self, code):
+        return self.db.collection(CODES_COLLECTION).document(code)
+
+    def generate(self):
+        return "".join(random.choices(CODE_ALPHABET, k=CODE_LENGTH))
+
+    def create_league(self, league_data, league_ref=None):
+        #Writes a private league with a freshly reserved code; returns (league_id, code)
+        league_ref = league_ref or self.db.collection("leagues").document()
+
+        def allocate(transaction):
+            candidates = list(dict.fromkeys(self.generate() for _ in range(self.candidates)))
+            refs = [self.code_ref(code) for code in candidates]
+            taken = {snap.id for snap in self.db.get_all(refs, transaction=transaction) if snap.exists}
+            free = [code for code in candidates if code not in taken]
+            if not free:
+                raise CodeAllocationError(f"all {len(candidates)} candidate codes were taken")
+            code = free[0]
+            transaction.create(self.code_ref(code), {
+                "league_id": league_ref.id,
+                "created_at": firestore.SERVER_TIMESTAMP
+            })
+            transaction.set(league_ref, {**league_data, "code": code})
+            return code, len(taken)
+
+        code, collisions = storage.run_transaction(self.db, allocate)
+        with self._lock:
+            self.allocations += 1
+            self.collisions += collisions
+        self._remember(code, league_ref.id)
+        return league_ref.id, code
+
+    def lookup(self, code):
+        #league id for a join code, or None; one document read on a cache miss
+        code = normalize_code(code)
+        if len(code) != CODE_LENGTH or any(c not in CODE_ALPHABET for c in code):
+            return None
+
+        with self._lock:
+            league_id = self._entries.get(code)
+            if league_id:
+                self._entries.move_to_end(code)
+                self.hits += 1
+                return league_id
+            self.misses += 1
+
+        doc = self.code_ref(code).get()
+        if doc.exists:
+            league_id = doc.to_dict().get("league_id")
+        else:
+            league_id = self._legacy_lookup(code)
+        if league_id:
+            self._remember(code, league_id)
+        return league_id
+
+    def resolve(self, code):
+        #(league id, league fields) for a code that still opens a private league, else (None, None).
+        #release() only clears this process's LRU, so the league document it has to be read
+        #for anyway is the check: a stale entry is forgotten and the code looked up again
+        code = normalize_code(code)
+        for _ in range(2):
+            league_id = self.lookup(code)
+            if not league_id:
+                return None, None
+            doc = self.db.collection("leagues").document(league_id).get()
+            league = doc.to_dict() if doc.exists else None
+            if league and league.get("type") == "private" and normalize_code(league.get("code")) == code:
+                return league_id, league
+            self.forget(code)
+        return None, None
+
+    def forget(self, code):
+        with self._lock:
+            self._entries.pop(normalize_code(code), None)
+
+    def release(self, code):
+        code = normalize_code(code)
+        self.code_ref(code).delete()
+        self.forget(code)
+
+    def backfill(self):
+        #Reserves the codes of leagues created before the index existed; returns how many were added
+        leagues = self.db.collection("leagues").where("type", "==", "private").stream()
+        by_code = {}
+        for doc in leagues:
+            code = normalize_code(doc.to_dict().get("code"))
+            if code:
+                by_code.setdefault(code, doc.id)
+        refs = [self.code_ref(code) for code in by_code]
+        existing = {snap.id for snap in self.db.get_all(refs) if snap.exists} if refs else set()
+
+        batch = self.db.batch()
+        added = 0
+        for code, league_id in by_code.items():
+            if code in existing:
+                continue
+            batch.set(self.code_ref(code), {"league_id": league_id, "created_at": firestore.SERVER_TIMESTAMP})
+            added += 1
+            if added % 500 == 0:
+                batch.commit()
+                batch = self.db.batch()
+        if added % 500:
+            batch.commit()
+        log.info("Backfilled %d join code(s)", added)
+        return added
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "allocations": self.allocations,
+                "collisions": self.collisions
+            }
+
+    def _legacy_lookup(self, code):
+        #Codes issued before league_codes existed; the hit is written back so this runs once per code
+        leagues = self.db.collection("leagues").where("code", "==", code).limit(1).get()
+        if not leagues:
+            return None
+        league_id = leagues[0].id
+        try:
+            self.code_ref(code).create({"league_id": league_id, "created_at": firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            log.warning("Could not index legacy join code %s: %s", code, e)
+        return league_id
+
+    def _remember(self, code, league_id):
+        with self._lock:
+            self._entries[code] = league_id
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,194 @@
+import logging
+from firebase_admin import firestore
+import storage
+from batching import get_many, BulkWritePipeline
+from fanout import fan_out
+from aio import fetch_doc
+
+#Membership index. league_memberships/{league_id}_{user_id} is the membership record,
+#user_leagues/{user_id} holds a summary of every league the user has joined and
+#league_members/{league_id}/members/{user_id} the member's chosen team. Joins and team
+#changes update all three in one transaction, so "my leagues" is one read, a league's
+#members one query, and duplicate joins are caught without a query. Members live in a
+#subcollection so joins to a busy league don't contend on (or outgrow) one document.
+
+MEMBERSHIPS_COLLECTION = "league_memberships"
+USER_LEAGUES_COLLECTION = "user_leagues"
+LEAGUE_MEMBERS_COLLECTION = "league_members"
+MEMBERS_SUBCOLLECTION = "members"
+SUMMARY_FIELDS = ("name", "type", "team_restriction", "code")
+
+log = logging.getLogger(__name__)
+
+class AlreadyMember(Exception):
+    pass
+
+class NotMember(Exception):
+    pass
+
+def membership_ref(db, league_id, user_id):
+    return db.collection(MEMBERSHIPS_COLLECTION).document(f"{league_id}_{user_id}")
+
+def user_leagues_ref(db, user_id):
+    return db.collection(USER_LEAGUES_COLLECTION).document(user_id)
+
+def league_members_ref(db, league_id):
+    return db.collection(LEAGUE_MEMBERS_COLLECTION).document(league_id).collection(MEMBERS_SUBCOLLECTION)
+
+def league_member_ref(db, league_id, user_id):
+    return league_members_ref(db, league_id).document(user_id)
+
+def league_summary(league):
+    return {field: league.get(field) for field in SUMMARY_FIELDS if league.get(field) is not None}
+
+def join_league(db, user_id, league_id, league, team_id=None):
+    #league: the league document's fields, for the user's summary; raises AlreadyMember
+    def join(transaction):
+        user_doc = user_leagues_ref(db, user_id).get(transaction=transaction)
+        if user_doc.exists and league_id in user_doc.to_dict().get("leagues", {}):
+            raise AlreadyMember(league_id)
+
+        transaction.set(membership_ref(db, league_id, user_id), {
+            "user_id": user_id,
+            "league_id": league_id,
+            "joined_at": firestore.SERVER_TIMESTAMP,
+            "team_id": team_id
+        })
+        transaction.set(user_leagues_ref(db, user_id), {"leagues": {league_id: {
+            **league_summary(league),
+            "team_id": team_id,
+            "joined_at": firestore.SERVER_TIMESTAMP
+        }}}, merge=True)
+        transaction.set(league_member_ref(db, league_id, user_id), {
+            "league_id": league_id,
+            "user_id": user_id,
+            "team_id": team_id
+        })
+
+    storage.run_transaction(db, join)
+
+def set_member_team(db, user_id, league_id, team_id):
+    #Raises NotMember when the user has not joined the league
+    def update(transaction):
+        user_doc = user_leagues_ref(db, user_id).get(transaction=transaction)
+        if not user_doc.exists or league_id not in user_doc.to_dict().get("leagues", {}):
+            raise NotMember(league_id)
+
+        transaction.set(membership_ref(db, league_id, user_id), {
+            "user_id": user_id,
+            "league_id": league_id,
+            "team_id": team_id
+        }, merge=True)
+        transaction.set(user_leagues_ref(db, user_id), {"leagues": {league_id: {"team_id": team_id}}}, merge=True)
+        transaction.set(league_member_ref(db, league_id, user_id), {
+            "league_id": league_id,
+            "user_id": user_id,
+            "team_id": team_id
+        })
+
+    storage.run_transaction(db, update)
+
+def joined_leagues(db, user_id):
+    return joined_from(user_leagues_ref(db, user_id).get())
+
+async def joined_leagues_async(client, user_id):
+    return joined_from(await fetch_doc(user_leagues_ref(client, user_id)))
+
+def joined_from(doc):
+    #The user_leagues document as a list sorted by league name
+    leagues = doc.to_dict().get("leagues", {}) if doc.exists else {}
+    joined = [{**summary, "id": league_id} for league_id, summary in leagues.items()]
+    joined.sort(key=lambda league: (str(league.get("name") or ""), league["id"]))
+    return joined
+
+def load_league_members(db, league_ids=None):
+    #league id -> [{"league_id", "user_id", "team_id"}]; one query per league (run
+    #concurrently), or one collection group scan
+    if league_ids is None:
+        docs = db.collection_group(MEMBERS_SUBCOLLECTION).stream()
+    else:
+        pages = fan_out(lambda lid: list(league_members_ref(db, lid).stream()), list(league_ids), timeout=60.0)
+        docs = [doc for page in pages for doc in page]
+
+    members = {}
+    for doc in docs:
+        member = doc.to_dict()
+        members.setdefault(member["league_id"], []).append({
+            "league_id": member["league_id"],
+            "user_id": member["user_id"],
+            "team_id": member.get("team_id")
+        })
+    return members
+
+def refresh_league_summaries(db, league_id, league):
+    #Pushes a renamed/retyped league into every member's summary
+    members = [doc.id for doc in league_members_ref(db, league_id).select(["user_id"]).stream()]
+    summary = league_summary(league)
+    #Fields the league no longer has (a dropped code or team restriction) are cleared too
+    summary.update({field: firestore.DELETE_FIELD for field in SUMMARY_FIELDS if field not in summary})
+    with BulkWritePipeline(db) as pipeline:
+        for user_id in members:
+            pipeline.set(user_leagues_ref(db, user_id), {"leagues": {league_id: summary}}, merge=True)
+    return len(members)
+
+def rebuild_membership_index(db):
+    #Rewrites memberships under deterministic ids and rebuilds both index collections
+    memberships = {}
+    legacy = []
+    for doc in db.collection(MEMBERSHIPS_COLLECTION).stream():
+        mem = doc.to_dict()
+        league_id, user_id = mem.get("league_id"), mem.get("user_id")
+        if not league_id or not user_id:
+            continue
+        key = (league_id, user_id)
+        #Duplicate joins collapse into one; a record with a chosen team wins
+        if key not in memberships or (mem.get("team_id") and not memberships[key].get("team_id")):
+            memberships[key] = mem
+        if doc.id != f"{league_id}_{user_id}":
+            legacy.append(doc.reference)
+
+    league_ids = sorted({league_id for league_id, _ in memberships})
+    league_docs = get_many(db, [db.collection("leagues").document(lid) for lid in league_ids])
+    leagues = {doc.id: doc.to_dict() for doc in league_docs if doc}
+
+    user_leagues = {}
+    league_members = {}
+    for (league_id, user_id), mem in memberships.items():
+        if league_id not in leagues:
+            continue
+        summary = {**league_summary(leagues[league_id]), "team_id": mem.get("team_id")}
+        if mem.get("joined_at"):
+            summary["joined_at"] = mem["joined_at"]
+        user_leagues.setdefault(user_id, {})[league_id] = summary
+        league_members[(league_id, user_id)] = mem.get("team_id")
+
+    with BulkWritePipeline(db) as pipeline:
+        for ref in legacy:
+            pipeline.delete(ref)
+        for (league_id, user_id), mem in memberships.items():
+            pipeline.set(membership_ref(db, league_id, user_id), {
+                "user_id": user_id,
+                "league_id": league_id,
+                "joined_at": mem.get("joined_at"),
+                "team_id": mem.get("team_id")
+            })
+        for doc in db.collection(USER_LEAGUES_COLLECTION).stream():
+            if doc.id not in user_leagues:
+                pipeline.delete(doc.reference)
+        #league_members/{league_id} documents are the older single-document member maps
+        for doc in db.collection(LEAGUE_MEMBERS_COLLECTION).stream():
+            pipeline.delete(doc.reference)
+        for doc in db.collection_group(MEMBERS_SUBCOLLECTION).select(["league_id", "user_id"]).stream():
+            member = doc.to_dict()
+            if (member.get("league_id"), member.get("user_id")) not in league_members:
+                pipeline.delete(doc.reference)
+        for user_id, leagues_map in user_leagues.items():
+            pipeline.set(user_leagues_ref(db, user_id), {"leagues": leagues_map})
+        for (league_id, user_id), team_id in league_members.items():
+            pipeline.set(league_member_ref(db, league_id, user_id),
+                         {"league_id": league_id, "user_id": user_id, "team_id": team_id})
+
+    counts = {"memberships": len(memberships), "migrated": len(legacy),
+              "users": len(user_leagues), "leagues": len({league_id for league_id, _ in league_members})}
+    log.info("Rebuilt membership index: %s", counts)
+    return counts
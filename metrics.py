@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from flask import request, g
+
+#Per-request database instrumentation and Prometheus text exposition.
+#instrument(db) wraps the storage client; every read, write, query and commit made while
+#a request (or a track() block) is active is charged to it, including work done on the
+#fan-out and bulk-write pools, which copy the caller's context.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+READS_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+log = logging.getLogger(__name__)
+
+#Structured logging
+
+def configure_logging(level=None):
+    logging.basicConfig(
+        level=(level or os.getenv("LOG_LEVEL", "INFO")).upper(),
+        format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
+
+def log_event(logger, level, event, sample=None, **fields):
+    #"event key=value ..." lines; sample=0.01 keeps about 1% of calls, for per-document loops
+    if not logger.isEnabledFor(level):
+        return
+    if sample is not None and random.random() >= sample:
+        return
+    logger.log(level, "%s %s", event, " ".join(f"{k}={json.dumps(v, default=str)}" for k, v in fields.items()))
+
+#Database counters
+
+class DbStats:
+    __slots__ = ("reads", "writes", "queries", "commits", "rpc_seconds", "_lock")
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.commits = 0
+        self.rpc_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, reads=0, writes=0, queries=0, commits=0, seconds=0.0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.queries += queries
+            self.commits += commits
+            self.rpc_seconds += seconds
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "reads": self.reads,
+                "writes": self.writes,
+                "queries": self.queries,
+                "commits": self.commits,
+                "rpc_seconds": round(self.rpc_seconds, 6)
+            }
+
+_current = contextvars.ContextVar("db_stats", default=None)
+
+def current_stats():
+    return _current.get()
+
+def _charge(**counts):
+    stats = _current.get()
+    if stats is not None:
+        stats.add(**counts)
+
+@contextmanager
+def charged_to(stats):
+    #Charges database calls made in the block, and in tasks it starts, to stats
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+#Client proxy
+
+KINDS = (
+    ("DocumentReference", "document"),
+    ("CollectionReference", "collection"),
+    ("CollectionGroup", "query"),
+    ("Query", "query"),
+    ("Snapshot", "snapshot"),
+    ("Transaction", "transaction"),
+    ("WriteBatch", "batch"),
+    ("Client", "client")
+)
+
+WRITE_METHODS = {"set", "update", "delete", "create"}
+
+def kind_of(obj):
+    name = type(obj).__name__
+    for suffix, kind in KINDS:
+        if name.endswith(suffix):
+            return kind
+    return None
+
+def wrap(value):
+    if isinstance(value, (list, tuple)):
+        return type(value)(wrap(v) for v in value)
+    kind = kind_of(value)
+    return Instrumented(value, kind) if kind else value
+
+def unwrap(value):
+    if isinstance(value, Instrumented):
+        return value._target
+    if isinstance(value, (list, tuple)):
+        return type(value)(unwrap(v) for v in value)
+    return value
+
+def counted_stream(iterator, queries=0):
+    #Reads and RPC time are charged as the caller iterates
+    started = time.perf_counter()
+    iterator = iter(iterator)
+    _charge(queries=queries, seconds=time.perf_counter() - started)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _charge(seconds=time.perf_counter() - started)
+            return
+        _charge(reads=1, seconds=time.perf_counter() - started)
+        yield wrap(item)
+
+class Instrumented:
+    __slots__ = ("_target", "_kind")
+
+    def __init__(self, target, kind):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_kind", kind)
+
+    @property
+    def __class__(self):
+        #isinstance() checks keep working against the wrapped type
+        return type(self._target)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if _current.get() is None:
+            #Nothing is being tracked: hand back the raw object so untracked loops pay nothing
+            return value
+        if not callable(value) or isinstance(value, type):
+            return wrap(value)
+
+        def call(*args, **kwargs):
+            return self._call(name, value, unwrap(args), {k: unwrap(v) for k, v in kwargs.items()})
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, unwrap(value))
+
+    def __eq__(self, other):
+        return self._target == unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __len__(self):
+        return len(self._target)
+
+    def __repr__(self):
+        return f"Instrumented({self._target!r})"
+
+    def _call(self, name, method, args, kwargs):
+        kind = self._kind
+        if kind in ("query", "collection") and name == "stream":
+            return counted_stream(method(*args, **kwargs), queries=1)
+        if kind == "client" and name == "get_all":
+            return counted_stream(method(*args, **kwargs))
+        if kind in ("batch", "transaction") and name in WRITE_METHODS:
+            _charge(writes=1)
+            return wrap(method(*args, **kwargs))
+
+        started = time.perf_counter()
+        result = method(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        if name == "get" and kind in ("query", "collection"):
+            result = list(result)
+            _charge(queries=1, reads=len(result), seconds=elapsed)
+        elif name == "get" and kind in ("document", "transaction"):
+            if kind_of(result) == "snapshot":
+                _charge(reads=1, seconds=elapsed)
+            else:
+                return counted_stream(result, queries=1)
+        elif (kind == "document" and name in WRITE_METHODS) or (kind == "collection" and name == "add"):
+            _charge(writes=1, commits=1, seconds=elapsed)
+        elif name == "commit":
+            _charge(commits=1, seconds=elapsed)
+        return wrap(result)
+
+def instrument(db):
+    return Instrumented(db, "client")
+
+#Registry
+
+def histogram(buckets):
+    return {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+
+def observe_into(hist, buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            hist["buckets"][i] += 1
+            break
+    hist["sum"] += value
+    hist["count"] += 1
+
+class Metrics:
+    def __init__(self, slow_request_seconds=0.0):
+        self.slow_request_seconds = slow_request_seconds
+        self.requests = {}
+        self.latency = {}
+        self.reads = {}
+        self.db = {}
+        self.startup = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status, seconds, stats):
+        key = (route, method)
+        db = stats.to_dict() if stats else None
+        with self._lock:
+            status_key = (route, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            observe_into(self.latency.setdefault(key, histogram(LATENCY_BUCKETS)), LATENCY_BUCKETS, seconds)
+            if db:
+                observe_into(self.reads.setdefault(key, histogram(READS_BUCKETS)), READS_BUCKETS, db["reads"])
+                totals = self.db.setdefault(key, dict.fromkeys(db, 0))
+                for field, value in db.items():
+                    totals[field] += value
+
+        if self.slow_request_seconds and seconds >= self.slow_request_seconds:
+            log_event(log, logging.WARNING, "slow_request", route=route, method=method, status=status,
+                      ms=round(seconds * 1000, 1), **(db or {}))
+
+    def add_collector(self, collect):
+        #collect() -> exposition lines from another component, appended to render()
+        self.collectors.append(collect)
+
+    def record_startup(self, **phases):
+        #Seconds per startup phase (import, factory, warm-up), exported as a gauge
+        with self._lock:
+            self.startup.update(phases)
+
+    @contextmanager
+    def track(self, name, method="TASK"):
+        #Times a block outside a request (job batches, startup work) and charges its database calls to it
+        stats = DbStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield stats
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            _current.reset(token)
+            self.observe(name, method, status, time.perf_counter() - started, stats)
+
+    def init_app(self, app):
+        @app.before_request
+        def start_request():
+            g.metrics_started = time.perf_counter()
+            g.metrics_token = _current.set(DbStats())
+
+        @app.after_request
+        def finish_request(response):
+            started = g.pop("metrics_started", None)
+            if started is not None:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                self.observe(route, request.method, response.status_code,
+                             time.perf_counter() - started, _current.get())
+            return response
+
+        @app.teardown_request
+        def reset_request(exc=None):
+            token = g.pop("metrics_token", None)
+            if token is not None:
+                _current.reset(token)
+
+    def render(self):
+        with self._lock:
+            requests = dict(self.requests)
+            latency = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.latency.items()}
+            reads = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.reads.items()}
+            db = {k: dict(v) for k, v in self.db.items()}
+            startup = dict(self.startup)
+
+        lines = []
+        lines += header("app_requests_total", "counter", "Requests and tasks by route, method and status")
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f"app_requests_total{labels(route=route, method=method, status=status)} {count}")
+
+        lines += render_histograms("app_request_duration_seconds", "Request and task latency", latency, LATENCY_BUCKETS)
+        lines += render_histograms("app_db_reads_per_request", "Documents read per request", reads, READS_BUCKETS)
+
+        for field, kind, help_text in (
+            ("reads", "counter", "Documents read"),
+            ("writes", "counter", "Document writes"),
+            ("queries", "counter", "Queries run"),
+            ("commits", "counter", "Write RPCs (single writes and batch commits)"),
+            ("rpc_seconds", "counter", "Time spent waiting on the database")
+        ):
+            name = f"app_db_{field}_total"
+            lines += header(name, kind, help_text)
+            for (route, method), totals in sorted(db.items()):
+                lines.append(f"{name}{labels(route=route, method=method)} {totals[field]}")
+
+        lines += header("app_startup_seconds", "gauge", "Time spent in each startup phase of this process")
+        for phase, seconds in sorted(startup.items()):
+            lines.append(f"app_startup_seconds{labels(phase=phase)} {round(seconds, 6)}")
+
+        for collect in self.collectors:
+            lines += collect()
+
+        return "\n".join(lines) + "\n"
+
+def header(name, kind, help_text):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+def labels(**values):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in values.items()) + "}"
+
+def render_histograms(name, help_text, histograms, buckets):
+    lines = header(name, "histogram", help_text)
+    for (route, method), hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(buckets, hist["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{labels(route=route, method=method, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{labels(route=route, method=method, le='+Inf')} {hist['count']}")
+        lines.append(f"{name}_sum{labels(route=route, method=method)} {round(hist['sum'], 6)}")
+        lines.append(f"{name}_count{labels(route=route, method=method)} {hist['count']}")
+    return lines
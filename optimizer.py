@@ -0,0 +1,147 @@
+import threading
+from itertools import combinations
+import numpy as np
+
+#Budget-constrained lineup search. The final ranking scores every 5-driver combination
+#against every constructor with NumPy, so it is exact; two safe prunes keep the pool small:
+#  - dominance: a driver beaten on both price and points by enough others never reaches the top N
+#  - bound: a quick search over the strongest drivers gives the N-th best score so far, and a
+#    budget-aware knapsack DP bounds the best lineup each driver could be part of
+#"value" (points per price) is made additive for the bound with Dinkelbach's trick:
+#ratio >= t  <=>  points - t * price >= 0.
+
+LINEUP_SIZE = 5
+OBJECTIVES = ("points", "value")
+SEED_POOL = 12
+BUDGET_UNITS = 2000
+
+_combo_cache = {}
+_combo_lock = threading.Lock()
+
+def combination_matrix(n, k=LINEUP_SIZE):
+    #All k-subsets of range(n) as an (C(n, k), k) index matrix, cached per n
+    with _combo_lock:
+        matrix = _combo_cache.get((n, k))
+        if matrix is None:
+            flat = np.fromiter((i for combo in combinations(range(n), k) for i in combo), dtype=np.int32)
+            matrix = _combo_cache[(n, k)] = flat.reshape(-1, k)
+        return matrix
+
+def prune_dominated(prices, points, keep):
+    #A driver beaten (cheaper or equal and at least as many points, strictly better in one)
+    #by keep + LINEUP_SIZE - 1 others is replaceable in at least `keep` distinct lineups
+    cheaper = prices[None, :] <= prices[:, None]
+    better = points[None, :] >= points[:, None]
+    strictly = (prices[None, :] < prices[:, None]) | (points[None, :] > points[:, None])
+    dominators = (cheaper & better & strictly).sum(axis=1)
+    return dominators < keep + LINEUP_SIZE - 1
+
+def best_within(weights, units, k, capacity):
+    #best[j, u]: largest weight sum of j distinct drivers whose rounded-down cost is <= u
+    best = np.full((k + 1, capacity + 1), -np.inf)
+    best[0, :] = 0
+    for weight, unit in zip(weights, units):
+        if unit > capacity:
+            continue
+        for j in range(k, 0, -1):
+            candidate = best[j - 1, :capacity + 1 - unit] + weight
+            np.maximum(best[j, unit:], candidate, out=best[j, unit:])
+    return best
+
+def upper_bounds(weights, prices, team_weights, team_prices, budget):
+    #Upper bound on the total weight of any feasible lineup containing each driver.
+    #Rounding costs down only loosens the budget, so the bound stays valid.
+    unit = max(1, budget // BUDGET_UNITS)
+    units = prices // unit
+    capacity = budget // unit
+    best = best_within(weights, units, LINEUP_SIZE - 1, capacity)[LINEUP_SIZE - 1]
+
+    bounds = np.full(len(weights), -np.inf)
+    for team_weight, team_price in zip(team_weights, team_prices):
+        remaining = (budget - prices - team_price) // unit
+        ok = remaining >= 0
+        bounds[ok] = np.maximum(bounds[ok], weights[ok] + team_weight + best[np.minimum(remaining[ok], capacity)])
+    return bounds
+
+def rank_lineups(candidates, prices, points, team_prices, team_scores, budget, limit, objective):
+    #Exact search over the candidate drivers: (score, total price, team index, driver indexes)
+    if len(candidates) < LINEUP_SIZE:
+        return []
+    combos = candidates[combination_matrix(len(candidates))]
+    combo_prices = prices[combos].sum(axis=1)
+    combo_points = points[combos].sum(axis=1)
+
+    #Best `limit` rows per constructor, then the best `limit` overall
+    best = []
+    for t, (team_price, team_score) in enumerate(zip(team_prices, team_scores)):
+        total_prices = combo_prices + team_price
+        rows = np.flatnonzero(total_prices <= budget)
+        if not len(rows):
+            continue
+        total_points = combo_points[rows] + team_score
+        if objective == "value":
+            scores = total_points / np.maximum(total_prices[rows], 1)
+        else:
+            scores = total_points.astype(np.float64)
+        #Partition down to the top scores (ties included) before sorting; ties go to the cheaper lineup
+        if len(scores) > limit:
+            top = np.flatnonzero(scores >= np.partition(scores, len(scores) - limit)[len(scores) - limit])
+            rows, scores = rows[top], scores[top]
+        for i in np.lexsort((total_prices[rows], -scores))[:limit]:
+            row = rows[i]
+            best.append((float(scores[i]), int(total_prices[row]), t, combos[row]))
+
+    best.sort(key=lambda item: (-item[0], item[1], item[2]))
+    return best[:limit]
+
+def optimize_lineups(drivers, teams, budget, limit=5, objective="points", team_ids=None):
+    #drivers/teams: id -> document dict (price, points / score); returns up to `limit` lineups
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {', '.join(OBJECTIVES)}")
+
+    driver_ids = sorted(drivers)
+    team_ids = sorted(team_ids if team_ids is not None else teams)
+    if len(driver_ids) < LINEUP_SIZE or not team_ids:
+        return []
+
+    prices = np.array([int(drivers[did].get("price", 0) or 0) for did in driver_ids], dtype=np.int64)
+    points = np.array([int(drivers[did].get("points", 0) or 0) for did in driver_ids], dtype=np.int64)
+    team_prices = np.array([int(teams[tid].get("price", 0) or 0) for tid in team_ids], dtype=np.int64)
+    team_scores = np.array([int(teams[tid].get("score", 0) or 0) for tid in team_ids], dtype=np.int64)
+
+    keep = prune_dominated(prices, points, limit)
+
+    #Lower bound on the N-th best score from the strongest and best-value drivers
+    pool = set(np.argsort(-points, kind="stable")[:SEED_POOL])
+    pool |= set(np.argsort(-points / np.maximum(prices, 1), kind="stable")[:SEED_POOL])
+    pool |= set(np.argsort(prices, kind="stable")[:LINEUP_SIZE])
+    seed = rank_lineups(np.array(sorted(pool)), prices, points, team_prices, team_scores, budget, limit, objective)
+
+    if len(seed) == limit:
+        threshold = seed[-1][0]
+        if objective == "value":
+            weights = points - threshold * prices
+            team_weights = team_scores - threshold * team_prices
+            floor = -1e-9
+        else:
+            weights, team_weights, floor = points.astype(np.float64), team_scores.astype(np.float64), threshold
+        keep &= upper_bounds(weights, prices, team_weights, team_prices, budget) >= floor
+
+    candidates = np.flatnonzero(keep)
+    lineups = []
+    for score, price, t, combo in rank_lineups(candidates, prices, points, team_prices, team_scores,
+                                               budget, limit, objective):
+        tid = team_ids[t]
+        lineup_drivers = [driver_ids[i] for i in combo]
+        total_points = int(points[combo].sum() + team_scores[t])
+        lineups.append({
+            "drivers": lineup_drivers,
+            "driver_names": [drivers[did].get("name", "Unknown") for did in lineup_drivers],
+            "team": tid,
+            "team_name": teams[tid].get("name", "Unknown"),
+            "price": price,
+            "points": total_points,
+            "value": round(total_points / price * 1_000_000, 4) if price else 0.0,
+            "budget_left": budget - price
+        })
+    return lineups
@@ -0,0 +1,87 @@
+import re
+from flask import jsonify
+
+#Cursor pagination (limit + last document id) and field projection for list endpoints.
+#Without limit/cursor/fields the endpoints keep returning the plain full list.
+
+MAX_PAGE_SIZE = 500
+FIELD_PATTERN = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+
+def page_params(args, max_limit=MAX_PAGE_SIZE):
+    #Raises ValueError with a user-facing message on bad input
+    limit = args.get("limit")
+    cursor = args.get("cursor") or None
+    fields = args.get("fields")
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if not 1 <= limit <= max_limit:
+            raise ValueError(f"limit must be between 1 and {max_limit}")
+
+    if fields:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+        bad = [f for f in fields if not FIELD_PATTERN.match(f)]
+        if bad:
+            raise ValueError(f"Invalid fields: {', '.join(bad)}")
+    else:
+        fields = None
+
+    return limit, cursor, fields
+
+def paginate_query(query, limit=None, cursor=None, fields=None):
+    if fields:
+        query = query.select(fields)
+    if limit or cursor:
+        query = query.order_by("__name__")
+        if cursor:
+            query = query.start_after({"__name__": cursor})
+        if limit:
+            query = query.limit(limit)
+
+    items = []
+    for doc in query.stream():
+        item = doc.to_dict()
+        item["id"] = doc.id
+        items.append(item)
+
+    next_cursor = items[-1]["id"] if limit and len(items) == limit else None
+    return items, next_cursor
+
+def paginate_items(items, limit=None, cursor=None, fields=None):
+    #In-memory equivalent for cached collections; items must carry "id"
+    if limit or cursor:
+        items = sorted(items, key=lambda item: item["id"])
+        if cursor:
+            items = [item for item in items if item["id"] > cursor]
+        if limit:
+            items = items[:limit]
+    if fields:
+        items = [project(item, fields) for item in items]
+
+    next_cursor = items[-1]["id"] if limit and len(items) == limit else None
+    return items, next_cursor
+
+def project(item, fields):
+    #Same shape as a Firestore select(): dotted paths come back as nested maps
+    projected = {"id": item["id"]}
+    for field in fields:
+        parts = field.split(".")
+        value = item
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
+
+def page_response(items, next_cursor, limit=None, cursor=None):
+    if limit is None and cursor is None:
+        return jsonify(items)
+    return jsonify({"items": items, "next_cursor": next_cursor})
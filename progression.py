@@ -0,0 +1,97 @@
+import logging
+import numpy as np
+from firebase_admin import firestore
+from batching import get_many
+from recompute import index_matrix
+from results import RACES_COLLECTION
+
+#Points progression. progression/season holds the race calendar and each driver's and
+#constructor's cumulative points after every race, rebuilt with one cumulative sum over the
+#driver x race matrix whenever results are scored. Fantasy teams and leagues are summed
+#from those rows on read, so a league chart is two batched reads and one NumPy gather.
+
+PROGRESSION_COLLECTION = "progression"
+SEASON_DOCUMENT = "season"
+
+log = logging.getLogger(__name__)
+
+def season_ref(db):
+    return db.collection(PROGRESSION_COLLECTION).document(SEASON_DOCUMENT)
+
+def build_progression(races, drivers, teams):
+    #races: id -> {name, date, results}; drivers/teams: id -> document dict
+    race_ids = sorted(races, key=lambda rid: (str(races[rid].get("date") or ""), rid))
+    driver_ids = sorted(drivers)
+    driver_index = {did: i for i, did in enumerate(driver_ids)}
+
+    points = np.zeros((len(driver_ids), len(race_ids)), dtype=np.int64)
+    for col, rid in enumerate(race_ids):
+        for did, pts in (races[rid].get("results") or {}).items():
+            row = driver_index.get(did)
+            if row is not None:
+                points[row, col] = int(pts or 0)
+    cumulative = np.cumsum(points, axis=1)
+
+    team_ids = sorted(teams)
+    team_rows = sum_rows(cumulative, index_matrix([teams[tid].get("drivers", []) for tid in team_ids], driver_index))
+
+    return {
+        "races": [{"id": rid, "name": races[rid].get("name"), "date": races[rid].get("date")} for rid in race_ids],
+        "drivers": {did: cumulative[i].tolist() for i, did in enumerate(driver_ids)},
+        "teams": {tid: team_rows[i].tolist() for i, tid in enumerate(team_ids)}
+    }
+
+def sum_rows(series, matrix):
+    #series: (items, races); matrix: per output row, indexes into series (-1 = none)
+    padded = np.vstack([series, np.zeros((1, series.shape[1]), dtype=series.dtype)])
+    if matrix.shape[1] == 0:
+        return np.zeros((matrix.shape[0], series.shape[1]), dtype=series.dtype)
+    return padded[matrix].sum(axis=1)
+
+def refresh_progression(db, drivers, teams):
+    #Called after results are scored; reads the calendar and results of every race once
+    docs = db.collection(RACES_COLLECTION).select(["name", "date", "results"]).stream()
+    season = build_progression({doc.id: doc.to_dict() for doc in docs}, drivers, teams)
+    season_ref(db).set({**season, "updated_at": firestore.SERVER_TIMESTAMP})
+    log.info("Rebuilt points progression for %d races", len(season["races"]))
+    return season
+
+def lineup_series(season, lineups):
+    #lineups: [(driver ids, constructor id)] -> (len(lineups), races) cumulative points
+    driver_ids = sorted(season["drivers"])
+    team_ids = sorted(season["teams"])
+    width = len(season["races"])
+    driver_series = np.array([season["drivers"][did] for did in driver_ids], dtype=np.int64).reshape(-1, width)
+    team_series = np.array([season["teams"][tid] for tid in team_ids], dtype=np.int64).reshape(-1, width)
+
+    driver_index = {did: i for i, did in enumerate(driver_ids)}
+    team_index = {tid: i for i, tid in enumerate(team_ids)}
+    totals = sum_rows(driver_series, index_matrix([list(d or []) for d, _ in lineups], driver_index, width=5))
+    constructors = np.array([team_index.get(t, -1) for _, t in lineups], dtype=np.int64)
+    return totals + np.vstack([team_series, np.zeros((1, width), dtype=np.int64)])[constructors]
+
+def fantasy_team_progression(db, season, team_id):
+    doc = db.collection("fantasy_teams").document(team_id).get()
+    if not doc.exists:
+        return None
+    team = doc.to_dict()
+    points = lineup_series(season, [(team.get("drivers"), team.get("team"))])[0]
+    return [{"id": team_id, "name": team.get("name"), "points": points.tolist()}]
+
+def league_progression(db, season, entries):
+    #entries: the league's standings rows (user, team, rank); one batched read of their lineups
+    entries = [e for e in entries if e.get("team_id")]
+    refs = [db.collection("fantasy_teams").document(e["team_id"]) for e in entries]
+    lineups = []
+    for doc in get_many(db, refs, field_paths=["drivers", "team"]):
+        team = doc.to_dict() if doc else {}
+        lineups.append((team.get("drivers"), team.get("team")))
+    series = lineup_series(season, lineups) if entries else []
+    return [{
+        "id": entry["team_id"],
+        "name": entry.get("team_name"),
+        "user_id": entry.get("user_id"),
+        "username": entry.get("username"),
+        "rank": entry.get("rank"),
+        "points": points.tolist()
+    } for entry, points in zip(entries, series)]
@@ -0,0 +1,120 @@
+import io
+import csv
+import json
+
+#Streaming parser for season imports. Accepts either
+#  CSV, one row per driver result:  race_id,name,date,driver_id,points
+#  JSONL, one race per line:        {"id", "name", "date", "results": {driver_id: points}}
+#     or one result per line:       {"race_id", "name", "date", "driver_id", "points"}
+#Rows for the same race are merged in file order; a later row for the same driver wins.
+
+FORMATS = ("csv", "jsonl")
+MAX_REPORTED_ERRORS = 50
+
+class RaceImportError(ValueError):
+    def __init__(self, errors, error_count):
+        self.errors = errors
+        self.error_count = error_count
+        super().__init__(f"{error_count} invalid row(s)")
+
+def detect_format(name=None, content_type=None):
+    name = (name or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    return None
+
+def iter_rows(stream, fmt):
+    #Yields (line number, row dict); decoding is incremental so large files are never held whole
+    if isinstance(stream, io.TextIOBase):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k.strip(): (v or "").strip() for k, v in row.items() if k}
+    elif fmt == "jsonl":
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, {"_error": f"invalid JSON: {e}"}
+                continue
+            yield line_num, row if isinstance(row, dict) else {"_error": "expected a JSON object"}
+    else:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+def row_results(row):
+    if "results" in row:
+        results = row.get("results")
+        return results.items() if isinstance(results, dict) else None
+    return [(row.get("driver_id"), row.get("points"))]
+
+def parse_results(results, driver_ids):
+    #results: (driver_id, points) pairs; returns (driver_id -> points, error messages)
+    parsed = {}
+    errors = []
+    for driver_id, points in results:
+        if driver_id not in driver_ids:
+            errors.append(f"unknown driver '{driver_id}'")
+            continue
+        try:
+            points = int(str(points).strip())
+        except (TypeError, ValueError):
+            errors.append(f"invalid points for driver '{driver_id}'")
+            continue
+        if points < 0:
+            errors.append(f"negative points for driver '{driver_id}'")
+            continue
+        parsed[driver_id] = points
+    return parsed, errors
+
+def parse_races(stream, fmt, driver_ids):
+    #Returns races in file order; raises RaceImportError listing bad rows (unknown drivers, bad points, missing fields)
+    races = {}
+    errors = []
+    error_count = 0
+
+    def fail(line_num, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_num, "error": message})
+
+    for line_num, row in iter_rows(stream, fmt):
+        if "_error" in row:
+            fail(line_num, row["_error"])
+            continue
+
+        race_id = str(row.get("race_id") or row.get("id") or "").strip()
+        if not race_id or "/" in race_id:
+            fail(line_num, "missing or invalid race_id")
+            continue
+        race = races.setdefault(race_id, {"id": race_id, "name": "", "date": "", "results": {}})
+        race["name"] = str(row.get("name") or row.get("race_name") or race["name"]).strip()
+        race["date"] = str(row.get("date") or race["date"]).strip()
+
+        results = row_results(row)
+        if results is None:
+            fail(line_num, "results must be an object of driver_id: points")
+            continue
+        parsed, messages = parse_results(results, driver_ids)
+        for message in messages:
+            fail(line_num, message)
+        race["results"].update(parsed)
+
+    for race in races.values():
+        if not race["name"] or not race["date"]:
+            fail(None, f"race '{race['id']}' is missing a name or date")
+        elif not race["results"]:
+            fail(None, f"race '{race['id']}' has no results")
+
+    if error_count:
+        raise RaceImportError(errors, error_count)
+    return list(races.values())
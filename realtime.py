@@ -0,0 +1,64 @@
+import os
+from flask_socketio import SocketIO, join_room, leave_room
+
+#Realtime score pushes. Clients join league:<id> and user:<uid> rooms;
+#after scoring the server emits one precomputed diff per room.
+
+socketio = SocketIO()
+RACES_ROOM = "races"
+
+def league_room(league_id):
+    return f"league:{league_id}"
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+def init_realtime(app, verify_uid):
+    #verify_uid(token) -> uid or None; SOCKETIO_MESSAGE_QUEUE lets several workers share rooms
+    socketio.init_app(app, message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None)
+
+    @socketio.on("subscribe_league")
+    def on_subscribe_league(data):
+        league_id = (data or {}).get("league_id")
+        if not league_id:
+            return {"error": "Missing league_id"}
+        join_room(league_room(league_id))
+        return {"status": "subscribed", "room": league_room(league_id)}
+
+    @socketio.on("unsubscribe_league")
+    def on_unsubscribe_league(data):
+        league_id = (data or {}).get("league_id")
+        if league_id:
+            leave_room(league_room(league_id))
+        return {"status": "unsubscribed"}
+
+    @socketio.on("subscribe_user")
+    def on_subscribe_user(data):
+        uid = verify_uid((data or {}).get("token", ""))
+        if not uid:
+            return {"error": "Unauthorized"}
+        join_room(user_room(uid))
+        join_room(RACES_ROOM)
+        return {"status": "subscribed", "room": user_room(uid)}
+
+    @socketio.on("subscribe_races")
+    def on_subscribe_races(data=None):
+        join_room(RACES_ROOM)
+        return {"status": "subscribed", "room": RACES_ROOM}
+
+    return socketio
+
+def publish_scoring(races=None, standings_changes=None, user_deltas=None):
+    #standings_changes: league id -> changed entries, user_deltas: uid -> {fantasy team id: delta}
+    emitted = 0
+    for race in races or []:
+        socketio.emit("race_update", race, to=RACES_ROOM)
+        emitted += 1
+    for league_id, changes in (standings_changes or {}).items():
+        if changes:
+            socketio.emit("standings_update", {"league_id": league_id, "changes": changes}, to=league_room(league_id))
+            emitted += 1
+    for uid, deltas in (user_deltas or {}).items():
+        socketio.emit("points_update", {"teams": deltas}, to=user_room(uid))
+        emitted += 1
+    return emitted
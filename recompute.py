@@ -0,0 +1,122 @@
+import time
+import numpy as np
+from batching import BulkWritePipeline
+from results import load_race_ledger
+
+#Full-season recompute: load everything once, total it with NumPy, write back only what changed
+
+def index_matrix(id_lists, index, width=None):
+    #Pads each id list to a common width with -1, which points at a trailing zero slot
+    width = width or max((len(ids) for ids in id_lists), default=0)
+    matrix = np.full((len(id_lists), width), -1, dtype=np.int64)
+    for row, ids in enumerate(id_lists):
+        for col, item_id in enumerate(ids[:width]):
+            matrix[row, col] = index.get(item_id, -1)
+    return matrix
+
+def gather_sum(values, matrix):
+    padded = np.append(values, 0)
+    if matrix.shape[1] == 0:
+        return np.zeros(matrix.shape[0], dtype=values.dtype)
+    return padded[matrix].sum(axis=1)
+
+def load_season(db):
+    #Only the fields the totals need
+    drivers = [(d.id, d.to_dict()) for d in db.collection("drivers").select(["points"]).stream()]
+    teams = [(t.id, t.to_dict()) for t in db.collection("teams").select(["drivers", "score"]).stream()]
+    fantasy_teams = [(f.id, f.to_dict())
+                     for f in db.collection("fantasy_teams").select(["drivers", "team", "points"]).stream()]
+
+    driver_index = {did: i for i, (did, _) in enumerate(drivers)}
+    team_index = {tid: i for i, (tid, _) in enumerate(teams)}
+
+    ledger = load_race_ledger(db)
+    results = {rid: entered for rid, (entered, _) in ledger.items()}
+    race_ids = sorted(results)
+
+    #Driver x race points matrix; results for drivers that no longer exist are ignored
+    points = np.zeros((len(drivers), len(race_ids)), dtype=np.int64)
+    for col, rid in enumerate(race_ids):
+        for did, pts in results[rid].items():
+            row = driver_index.get(did)
+            if row is not None:
+                points[row, col] = int(pts or 0)
+
+    return {
+        "drivers": drivers,
+        "teams": teams,
+        "fantasy_teams": fantasy_teams,
+        "race_ids": race_ids,
+        "results": results,
+        #Totals are rebuilt from every result, so every race counts as scored afterwards
+        "unscored": [rid for rid, (entered, scored) in ledger.items() if entered != scored],
+        "points": points,
+        "team_drivers": index_matrix([t.get("drivers", []) for _, t in teams], driver_index),
+        "fantasy_drivers": index_matrix([f.get("drivers", []) for _, f in fantasy_teams], driver_index, width=5),
+        "fantasy_constructors": np.array(
+            [team_index.get(f.get("team"), -1) for _, f in fantasy_teams], dtype=np.int64
+        ),
+        "reads": len(drivers) + len(teams) + len(fantasy_teams) + len(race_ids)
+    }
+
+def compute_totals(season):
+    driver_totals = season["points"].sum(axis=1)
+    team_scores = gather_sum(driver_totals, season["team_drivers"])
+    fantasy_points = gather_sum(driver_totals, season["fantasy_drivers"])
+    fantasy_points = fantasy_points + np.append(team_scores, 0)[season["fantasy_constructors"]]
+    return driver_totals, team_scores, fantasy_points
+
+def changed_rows(docs, field, totals):
+    stored = np.array([int(data.get(field, 0) or 0) for _, data in docs], dtype=np.int64)
+    return np.nonzero(stored != totals)[0]
+
+def recompute_season(db, dry_run=False, batch_size=500):
+    started = time.perf_counter()
+    season = load_season(db)
+    loaded = time.perf_counter()
+
+    driver_totals, team_scores, fantasy_points = compute_totals(season)
+    targets = (
+        ("drivers", "points", season["drivers"], driver_totals),
+        ("teams", "score", season["teams"], team_scores),
+        ("fantasy_teams", "points", season["fantasy_teams"], fantasy_points)
+    )
+
+    writes = []
+    changed = {}
+    for collection, field, docs, totals in targets:
+        rows = changed_rows(docs, field, totals)
+        changed[collection] = len(rows)
+        for row in rows:
+            ref = db.collection(collection).document(docs[row][0])
+            writes.append((ref, {field: int(totals[row])}))
+    for rid in season["unscored"]:
+        writes.append((db.collection("races").document(rid), {"scored": season["results"][rid]}))
+    changed["races"] = len(season["unscored"])
+    computed = time.perf_counter()
+
+    write_stats = None
+    if not dry_run:
+        with BulkWritePipeline(db, batch_size=batch_size) as pipeline:
+            for ref, data in writes:
+                pipeline.update(ref, data)
+        write_stats = pipeline.stats()
+    finished = time.perf_counter()
+
+    return {
+        "drivers": len(season["drivers"]),
+        "teams": len(season["teams"]),
+        "fantasy_teams": len(season["fantasy_teams"]),
+        "races": len(season["race_ids"]),
+        "changed": changed,
+        "reads": season["reads"],
+        "writes": 0 if dry_run else len(writes),
+        "dry_run": dry_run,
+        "writes_per_sec": write_stats["writes_per_sec"] if write_stats else 0.0,
+        "seconds": {
+            "load": round(loaded - started, 4),
+            "compute": round(computed - loaded, 4),
+            "write": round(finished - computed, 4),
+            "total": round(finished - started, 4)
+        }
+    }
@@ -0,0 +1,112 @@
+import os
+import logging
+import threading
+
+#Process-wide cache of small reference collections (drivers, teams).
+#Firestore snapshot listeners keep it current; admin writes call invalidate().
+
+log = logging.getLogger(__name__)
+
+class ReferenceCache:
+    def __init__(self, db, collections=("drivers", "teams"), listen=True):
+        self.db = db
+        self.collections = tuple(collections)
+        self.listen = listen
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.snapshots = 0
+        self._data = {}
+        self._generation = {c: 0 for c in self.collections}
+        self._watches = {}
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self, collection):
+        with self._lock:
+            data = self._data.get(collection)
+            if data is not None:
+                self.hits += 1
+                watching = collection in self._watches
+            else:
+                self.misses += 1
+                generation = self._generation.get(collection, 0)
+        if data is not None:
+            #Data preloaded before a fork is served while the child starts its own listener
+            if not watching:
+                self._start_watch(collection)
+            return data
+
+        docs = {d.id: d.to_dict() for d in self.db.collection(collection).stream()}
+
+        with self._lock:
+            #Don't overwrite a newer snapshot or an invalidation that raced the load
+            if self._generation.get(collection, 0) == generation:
+                self._data[collection] = docs
+        self._start_watch(collection)
+        return docs
+
+    def drivers(self):
+        return self.get("drivers")
+
+    def teams(self):
+        return self.get("teams")
+
+    def invalidate(self, *collections):
+        with self._lock:
+            for collection in collections or self.collections:
+                self._data.pop(collection, None)
+                self._generation[collection] = self._generation.get(collection, 0) + 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "snapshots": self.snapshots,
+                "cached": {c: len(self._data[c]) for c in self._data},
+                "listening": sorted(c for c, watch in self._watches.items() if watch)
+            }
+
+    def close(self):
+        with self._lock:
+            watches = list(self._watches.values())
+            self._watches.clear()
+        for watch in watches:
+            if watch:
+                watch.unsubscribe()
+
+    def _after_fork(self):
+        #Listener threads don't survive fork; the next get() restarts them in the child
+        self._lock = threading.Lock()
+        self._watches = {}
+
+    def _start_watch(self, collection):
+        if not self.listen:
+            return
+        with self._lock:
+            if collection in self._watches:
+                return
+            self._watches[collection] = None
+
+        def on_snapshot(docs, changes, read_time):
+            fresh = {d.id: d.to_dict() for d in docs}
+            with self._lock:
+                self._data[collection] = fresh
+                self._generation[collection] = self._generation.get(collection, 0) + 1
+                self.snapshots += 1
+
+        try:
+            watch = self.db.collection(collection).on_snapshot(on_snapshot)
+        except Exception as e:
+            #The None entry stops every cache hit from retrying; invalidate() still refreshes it
+            log.warning("Snapshot listener for '%s' not started: %s", collection, e)
+            return
+
+        with self._lock:
+            self._watches[collection] = watch
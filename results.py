@@ -0,0 +1,127 @@
+import json
+import hashlib
+import logging
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from batching import BulkWritePipeline
+
+#Per-race results. races/{race_id}.results (driver id -> points) is the only copy of a
+#driver's race history; driver documents keep just their running total, so reading a
+#driver costs the same in round 1 as after several seasons. Totals are derived from here;
+#races/{race_id}.scored is the part of the results they already include (see scoring.py).
+#race_snapshots/{race_id} is the rendered, sorted results table served to users; it is
+#replaced whole whenever the race is saved and served as-is.
+
+RACES_COLLECTION = "races"
+SNAPSHOTS_COLLECTION = "race_snapshots"
+
+log = logging.getLogger(__name__)
+
+def load_results(db):
+    #race id -> {driver id: points}, reading only the results map of each race
+    docs = db.collection(RACES_COLLECTION).select(["results"]).stream()
+    return {doc.id: doc.to_dict().get("results") or {} for doc in docs}
+
+def scored_results(race):
+    #The part of a race the driver totals include; races saved before scored existed were scored in full
+    return (race["scored"] if "scored" in race else race.get("results")) or {}
+
+def load_race_ledger(db):
+    #race id -> (results, scored)
+    docs = db.collection(RACES_COLLECTION).select(["results", "scored"]).stream()
+    ledger = {}
+    for doc in docs:
+        race = doc.to_dict()
+        ledger[doc.id] = (race.get("results") or {}, scored_results(race))
+    return ledger
+
+def sum_driver_points(results):
+    totals = {}
+    for race in results.values():
+        for driver_id, points in race.items():
+            totals[driver_id] = totals.get(driver_id, 0) + int(points or 0)
+    return totals
+
+def driver_history(db, driver_id):
+    #race id -> points for one driver, from the races it scored in. Quoted, since
+    #auto-ids may start with a digit, which a bare field path segment cannot
+    field = FieldPath("results", driver_id).to_api_repr()
+    docs = db.collection(RACES_COLLECTION).where(field, ">=", 0).select([field]).stream()
+    return {doc.id: doc.to_dict().get("results", {}).get(driver_id, 0) for doc in docs}
+
+def migrate_driver_race_maps(db, dry_run=False):
+    #Folds the legacy drivers/{id}.races maps into the race documents, then drops them.
+    #The driver maps were what totals used to be summed from, so they win on conflicts.
+    results = load_results(db)
+    patches = {}
+    drivers = []
+    for doc in db.collection("drivers").select(["races"]).stream():
+        history = doc.to_dict().get("races")
+        if history is None:
+            continue
+        drivers.append(doc.reference)
+        for race_id, points in history.items():
+            points = int(points or 0)
+            if race_id not in results:
+                log.warning("Driver %s has points for unknown race %s", doc.id, race_id)
+            if results.get(race_id, {}).get(doc.id) != points:
+                patches.setdefault(race_id, {})[doc.id] = points
+
+    if not dry_run:
+        #Race documents first: a failure here leaves the driver maps in place for a rerun
+        with BulkWritePipeline(db) as pipeline:
+            for race_id, patch in patches.items():
+                pipeline.set(db.collection(RACES_COLLECTION).document(race_id), {"results": patch}, merge=True)
+        with BulkWritePipeline(db) as pipeline:
+            for ref in drivers:
+                pipeline.update(ref, {"races": firestore.DELETE_FIELD})
+
+    counts = {"drivers": len(drivers), "races_patched": len(patches),
+              "results_moved": sum(len(patch) for patch in patches.values()), "dry_run": dry_run}
+    log.info("Migrated driver race maps: %s", counts)
+    return counts
+
+#Rendered snapshots
+
+def snapshot_ref(db, race_id):
+    return db.collection(SNAPSHOTS_COLLECTION).document(race_id)
+
+def render_race_snapshot(race_id, race, drivers, teams):
+    #Scoring drivers only, best first; equal points share a position
+    rows = []
+    for driver_id, points in (race.get("results") or {}).items():
+        points = int(points or 0)
+        if points <= 0:
+            continue
+        driver = drivers.get(driver_id) or {}
+        team_id = driver.get("team_id")
+        rows.append({
+            "driver_id": driver_id,
+            "name": driver.get("name", "Unknown"),
+            "team_id": team_id,
+            "team_name": (teams.get(team_id) or {}).get("name") if team_id else None,
+            "points": points
+        })
+    rows.sort(key=lambda r: (-r["points"], str(r["name"]), r["driver_id"]))
+
+    previous = None
+    for index, row in enumerate(rows, start=1):
+        if row["points"] != previous:
+            position, previous = index, row["points"]
+        row["position"] = position
+
+    snapshot = {"race_id": race_id, "race_name": race.get("name"), "date": race.get("date"), "results": rows}
+    #Content hash: unchanged results keep their ETag across re-saves
+    snapshot["etag"] = hashlib.sha1(json.dumps(snapshot, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return snapshot
+
+def render_all_snapshots(db, drivers, teams):
+    #Backfill/refresh for every race, e.g. after drivers or constructors were renamed
+    races = db.collection(RACES_COLLECTION).select(["name", "date", "results"]).stream()
+    count = 0
+    with BulkWritePipeline(db) as pipeline:
+        for doc in races:
+            pipeline.set(snapshot_ref(db, doc.id), render_race_snapshot(doc.id, doc.to_dict(), drivers, teams))
+            count += 1
+    log.info("Rendered %d race result snapshot(s)", count)
+    return count
@@ -0,0 +1,206 @@
+import logging
+from firebase_admin import firestore
+import storage
+from batching import get_many, BulkWritePipeline
+from fanout import fan_out
+from standings import refresh_league_standings, leagues_for_fantasy_teams
+from results import RACES_COLLECTION, scored_results
+
+#Race scoring. races/{id}.results is what was entered and races/{id}.scored what the driver
+#and constructor totals include. A scoring pass moves the difference into the totals and
+#sets scored = results in one transaction, so a failed, retried or concurrent pass can
+#neither lose a change nor count it twice. Fantasy team totals are then recomputed (as
+#absolute values, so retrying is safe) for the teams that picked a changed driver or
+#constructor; scoring/pending keeps those ids until that has succeeded, and the leagues
+#those teams are entered in until their standings have been refreshed.
+
+#Reverse index: driver_fantasy_index/{driver id}/picked_by/{fantasy team id} (and the same
+#under team_fantasy_index for constructors), one document per pick with the owner as a
+#field. A popular driver is picked by thousands of teams, so a single array per driver
+#would outgrow the document size limit and every team creation would contend on it.
+FANTASY_INDEX_COLLECTIONS = {
+    "drivers": "driver_fantasy_index",
+    "teams": "team_fantasy_index"
+}
+FANTASY_INDEX_SUBCOLLECTION = "picked_by"
+PENDING_COLLECTION = "scoring"
+PENDING_DOCUMENT = "pending"
+
+log = logging.getLogger(__name__)
+
+def fantasy_index_ref(db, kind, item_id):
+    return db.collection(FANTASY_INDEX_COLLECTIONS[kind]).document(item_id).collection(FANTASY_INDEX_SUBCOLLECTION)
+
+def fantasy_index_entry_ref(db, kind, item_id, fantasy_team_id):
+    return fantasy_index_ref(db, kind, item_id).document(fantasy_team_id)
+
+def load_fantasy_team_ids(db, pending):
+    #pending: kind -> driver/constructor ids; one query per id, run concurrently
+    keys = [(kind, item_id) for kind, ids in pending.items() for item_id in sorted(ids)]
+    pages = fan_out(lambda key: [doc.id for doc in fantasy_index_ref(db, *key).select(["user_id"]).stream()],
+                    keys, timeout=60.0)
+    return {fid for page in pages for fid in page}
+
+def pending_ref(db):
+    return db.collection(PENDING_COLLECTION).document(PENDING_DOCUMENT)
+
+def race_point_deltas(old_results, new_results):
+    deltas = {}
+    for did in set(old_results) | set(new_results):
+        delta = int(new_results.get(did, 0) or 0) - int(old_results.get(did, 0) or 0)
+        if delta:
+            deltas[did] = delta
+    return deltas
+
+def pending_update(driver_ids=(), team_ids=(), league_ids=()):
+    #Bumps a version per id, so clearing never drops a change made after it was read
+    update = {}
+    for kind, ids in (("drivers", driver_ids), ("teams", team_ids), ("leagues", league_ids)):
+        if ids:
+            update[kind] = {item_id: firestore.Increment(1) for item_id in ids}
+    return update
+
+def mark_pending(db, driver_ids=(), team_ids=(), league_ids=()):
+    #For totals changed outside a scoring pass, e.g. a constructor's driver list
+    update = pending_update(driver_ids, team_ids, league_ids)
+    if update:
+        pending_ref(db).set(update, merge=True)
+
+def load_pending(db, kinds):
+    doc = pending_ref(db).get()
+    pending = doc.to_dict() if doc.exists else {}
+    return {kind: dict(pending.get(kind) or {}) for kind in kinds}
+
+def clear_pending(db, seen):
+    #seen: kind -> {id: version read}; ids bumped since are kept
+    def clear(transaction):
+        doc = pending_ref(db).get(transaction=transaction)
+        current = doc.to_dict() if doc.exists else {}
+        update = {}
+        for kind, versions in seen.items():
+            stored = current.get(kind) or {}
+            cleared = {item_id: firestore.DELETE_FIELD for item_id, version in versions.items()
+                       if stored.get(item_id) == version}
+            if cleared:
+                update[kind] = cleared
+        if update:
+            transaction.set(pending_ref(db), update, merge=True)
+
+    storage.run_transaction(db, clear)
+
+def apply_race_results(db, race_ids):
+    #Scores the unscored part of the given races; returns (driver deltas, constructor deltas)
+    race_refs = [db.collection(RACES_COLLECTION).document(rid) for rid in race_ids]
+
+    def score(transaction):
+        races = [snap for snap in db.get_all(race_refs, field_paths=["results", "scored"], transaction=transaction)
+                 if snap.exists]
+        driver_deltas = {}
+        unscored = []
+        for snap in races:
+            race = snap.to_dict()
+            results = race.get("results") or {}
+            deltas = race_point_deltas(scored_results(race), results)
+            if deltas or "scored" not in race:
+                unscored.append((snap.reference, results))
+            for did, delta in deltas.items():
+                driver_deltas[did] = driver_deltas.get(did, 0) + delta
+
+        #Deleted drivers are skipped
+        driver_refs = [db.collection("drivers").document(did) for did in sorted(driver_deltas)]
+        drivers = {snap.id for snap in db.get_all(driver_refs, field_paths=["points"], transaction=transaction)
+                   if snap.exists}
+        driver_deltas = {did: delta for did, delta in driver_deltas.items() if did in drivers}
+
+        #A constructor scores what the drivers in teams/{id}.drivers score, as in recompute.py;
+        #drivers.team_id is only a display field
+        team_deltas = {}
+        for snap in db.collection("teams").select(["drivers"]).stream(transaction=transaction):
+            delta = sum(driver_deltas.get(did, 0) for did in snap.to_dict().get("drivers", []))
+            if delta:
+                team_deltas[snap.id] = delta
+
+        for ref, results in unscored:
+            transaction.update(ref, {"scored": results})
+        for did, delta in driver_deltas.items():
+            transaction.update(db.collection("drivers").document(did), {"points": firestore.Increment(delta)})
+        for tid, delta in team_deltas.items():
+            transaction.update(db.collection("teams").document(tid), {"score": firestore.Increment(delta)})
+        update = pending_update(driver_deltas, team_deltas)
+        if update:
+            transaction.set(pending_ref(db), update, merge=True)
+        return driver_deltas, team_deltas
+
+    return storage.run_transaction(db, score)
+
+def load_totals(db):
+    drivers = {doc.id: int(doc.to_dict().get("points", 0) or 0)
+               for doc in db.collection("drivers").select(["points"]).stream()}
+    teams = {doc.id: int(doc.to_dict().get("score", 0) or 0)
+             for doc in db.collection("teams").select(["score"]).stream()}
+    return drivers, teams
+
+def refresh_fantasy_totals(db, max_rounds=3):
+    #Recomputes the fantasy teams under every pending driver/constructor from the current
+    #totals. The leagues of a changed team are marked pending before its points are
+    #written, so a failed standings refresh is still retried after the fantasy teams are
+    #done. Returns (counts, user id -> {fantasy team id: points delta}).
+    pending = load_pending(db, FANTASY_INDEX_COLLECTIONS)
+    counts = {"drivers": len(pending["drivers"]), "teams": len(pending["teams"]), "fantasy_teams": 0,
+              "writes_per_sec": 0.0}
+    if not any(pending.values()):
+        return counts, {}
+
+    fantasy_ids = load_fantasy_team_ids(db, pending)
+    fantasy_refs = [db.collection("fantasy_teams").document(fid) for fid in sorted(fantasy_ids)]
+
+    user_deltas = {}
+    totals = load_totals(db)
+    for _ in range(max_rounds):
+        drivers, teams = totals
+        changed = {}
+        for snap in get_many(db, fantasy_refs, field_paths=["drivers", "team", "points", "user_id"]):
+            if not snap:
+                continue
+            team = snap.to_dict()
+            points = sum(drivers.get(did, 0) for did in team.get("drivers", [])) + teams.get(team.get("team"), 0)
+            old = int(team.get("points", 0) or 0)
+            if points != old:
+                changed[snap.id] = (team.get("user_id"), points, points - old)
+
+        round_deltas = {}
+        for fid, (user_id, _, delta) in changed.items():
+            if user_id:
+                round_deltas.setdefault(user_id, {})[fid] = delta
+        if round_deltas:
+            mark_pending(db, league_ids=leagues_for_fantasy_teams(db, round_deltas))
+
+        with BulkWritePipeline(db) as pipeline:
+            for fid, (_, points, _) in changed.items():
+                pipeline.update(db.collection("fantasy_teams").document(fid), {"points": points})
+        counts["writes_per_sec"] = pipeline.stats()["writes_per_sec"]
+        for user_id, deltas in round_deltas.items():
+            for fid, delta in deltas.items():
+                user_deltas.setdefault(user_id, {})[fid] = user_deltas.get(user_id, {}).get(fid, 0) + delta
+        counts["fantasy_teams"] += len(changed)
+
+        #A pass that committed meanwhile may have been overwritten with older totals: go again
+        current = load_totals(db)
+        if current == totals:
+            break
+        totals = current
+    else:
+        log.warning("Totals kept changing during %d fantasy refresh rounds; left pending", max_rounds)
+        return counts, user_deltas
+
+    clear_pending(db, pending)
+    return counts, user_deltas
+
+def refresh_pending_standings(db):
+    #Refreshes the leagues marked by refresh_fantasy_totals; returns league id -> changes
+    pending = load_pending(db, ("leagues",))
+    if not pending["leagues"]:
+        return {}
+    changes = refresh_league_standings(db, pending["leagues"])
+    clear_pending(db, pending)
+    return changes
@@ -0,0 +1,114 @@
+import os
+import logging
+import threading
+from functools import wraps
+from flask import request, make_response, Response
+from metrics import header, labels
+
+#Single-flight coalescing for read endpoints. While one request for a key is being computed,
+#identical requests in the same process wait for it and reuse its response instead of running
+#the same queries again, so a burst costs one computation per distinct key.
+
+log = logging.getLogger(__name__)
+
+OUTCOMES = ("leader", "coalesced", "timeout", "error")
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, timeout=10.0):
+        #timeout: how long a waiter trusts the in-flight call before computing on its own
+        self.timeout = timeout
+        self.counts = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def do(self, key, fn, group="default", timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(group, "leader" if leader else "coalesced")
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._count(group, "error")
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self._count(group, "timeout")
+            log.warning("Single-flight wait for %s timed out; computing separately", key)
+            return fn()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "routes": {group: dict(counts) for group, counts in self.counts.items()}
+            }
+
+    def render(self):
+        #Prometheus lines, appended to /metrics
+        lines = header("app_singleflight_requests_total", "counter",
+                       "Coalesced reads by outcome: leader computed, coalesced reused, timeout/error")
+        with self._lock:
+            counts = {group: dict(c) for group, c in self.counts.items()}
+        for group, by_outcome in sorted(counts.items()):
+            for outcome in OUTCOMES:
+                lines.append(f"app_singleflight_requests_total{labels(route=group, outcome=outcome)} {by_outcome[outcome]}")
+        return lines
+
+    def _count(self, group, outcome):
+        #Caller holds the lock
+        counts = self.counts.setdefault(group, dict.fromkeys(OUTCOMES, 0))
+        counts[outcome] += 1
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+def coalesce(flight, versions=None, resources=(), timeout=None):
+    #Shares one GET response between identical concurrent requests. The key includes the
+    #resources' data versions, so a request that starts after a write never joins a
+    #computation that began before it. Only for views whose response doesn't depend on the caller.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            key = request.full_path
+            if versions is not None and resources:
+                key += "|" + ",".join(str(v) for v in versions.get(*resources))
+
+            def compute():
+                response = make_response(view(*args, **kwargs))
+                #Plain data, so every waiter builds its own Response for the after_request hooks
+                return response.get_data(), response.status_code, list(response.headers.items())
+
+            group = request.url_rule.rule if request.url_rule else view.__name__
+            body, status, headers = flight.do(key, compute, group=group, timeout=timeout)
+            return Response(body, status=status, headers=headers)
+        return wrapped
+    return decorator
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from firebase_admin import firestore
+from batching import get_many, BulkWritePipeline
+from fanout import fan_out
+from aio import fetch, fetch_doc
+from memberships import load_league_members, user_leagues_ref, MEMBERSHIPS_COLLECTION
+
+#Materialized league standings: league_standings/{league_id} holds the summary,
+#league_standings/{league_id}/entries/{user_id} one ranked row per member with a team
+
+STANDINGS_COLLECTION = "league_standings"
+ENTRIES_COLLECTION = "entries"
+
+log = logging.getLogger(__name__)
+
+def standings_ref(db, league_id):
+    return db.collection(STANDINGS_COLLECTION).document(league_id)
+
+def entries_ref(db, league_id):
+    return standings_ref(db, league_id).collection(ENTRIES_COLLECTION)
+
+def load_memberships(db, league_ids=None):
+    #From the league_members index instead of chunked "in" queries
+    return load_league_members(db, league_ids)
+
+def load_teams_and_users(db, members, full_scan):
+    if full_scan:
+        teams = {t.id: t.to_dict() for t in db.collection("fantasy_teams").select(["name", "points"]).stream()}
+        users = {u.id: u.to_dict() for u in db.collection("users").select(["username"]).stream()}
+        return teams, users
+
+    team_ids = sorted({m["team_id"] for mems in members.values() for m in mems if m.get("team_id")})
+    user_ids = sorted({m["user_id"] for mems in members.values() for m in mems})
+    team_docs = get_many(db, [db.collection("fantasy_teams").document(tid) for tid in team_ids])
+    user_docs = get_many(db, [db.collection("users").document(uid) for uid in user_ids])
+    teams = {doc.id: doc.to_dict() for doc in team_docs if doc}
+    users = {doc.id: doc.to_dict() for doc in user_docs if doc}
+    return teams, users
+
+def rank_entries(league_id, members, teams, users):
+    entries = []
+    for mem in members:
+        team = teams.get(mem.get("team_id"))
+        if not team:
+            continue
+        uid = mem["user_id"]
+        entries.append({
+            "league_id": league_id,
+            "user_id": uid,
+            "username": users.get(uid, {}).get("username") or uid,
+            "team_id": mem["team_id"],
+            "team_name": team.get("name"),
+            "points": team.get("points", 0)
+        })
+
+    entries.sort(key=lambda e: (-e["points"], str(e["username"]), e["user_id"]))
+
+    #Competition ranking: equal points share a rank; position is the unique cursor key
+    rank = 0
+    previous = None
+    for position, entry in enumerate(entries, start=1):
+        if entry["points"] != previous:
+            rank = position
+            previous = entry["points"]
+        entry["rank"] = rank
+        entry["position"] = position
+    return entries
+
+def load_existing_entries(db, league_ids=None):
+    existing = {}
+    if league_ids is None:
+        docs = db.collection_group(ENTRIES_COLLECTION).stream()
+    else:
+        #One query per league, run concurrently like load_league_members
+        pages = fan_out(lambda lid: list(entries_ref(db, lid).stream()), list(league_ids), timeout=60.0)
+        docs = [doc for page in pages for doc in page]
+    for doc in docs:
+        entry = doc.to_dict()
+        existing.setdefault(entry.get("league_id"), {})[doc.id] = entry
+    return existing
+
+def refresh_league_standings(db, league_ids=None):
+    #league_ids=None refreshes every league that has members
+    full_scan = league_ids is None
+    if not full_scan:
+        league_ids = sorted(set(league_ids))
+    members = load_memberships(db, league_ids)
+    teams, users = load_teams_and_users(db, members, full_scan)
+    existing = load_existing_entries(db, league_ids)
+
+    targets = set(members) | set(existing) if full_scan else set(league_ids)
+    refreshed = {}
+    changed_entries = 0
+
+    with BulkWritePipeline(db) as pipeline:
+        for league_id in targets:
+            entries = rank_entries(league_id, members.get(league_id, []), teams, users)
+            current = existing.get(league_id, {})
+            changes = []
+
+            for entry in entries:
+                if current.get(entry["user_id"]) != entry:
+                    pipeline.set(entries_ref(db, league_id).document(entry["user_id"]), entry)
+                    changes.append(entry)
+            kept = {entry["user_id"] for entry in entries}
+            for uid in current:
+                if uid not in kept:
+                    pipeline.delete(entries_ref(db, league_id).document(uid))
+                    changes.append({"user_id": uid, "removed": True})
+
+            if changes or not current:
+                pipeline.set(standings_ref(db, league_id), {
+                    "size": len(entries),
+                    "updated_at": firestore.SERVER_TIMESTAMP
+                })
+            changed_entries += len(changes)
+            refreshed[league_id] = changes
+
+    log.info("Refreshed standings for %d leagues (%d changed entries)", len(refreshed), changed_entries)
+    return refreshed
+
+def leagues_for_fantasy_team(db, team_id):
+    docs = db.collection(MEMBERSHIPS_COLLECTION).where("team_id", "==", team_id).stream()
+    return sorted({doc.to_dict().get("league_id") for doc in docs} - {None})
+
+def leagues_for_fantasy_teams(db, team_ids_by_user):
+    #Leagues where one of these teams is entered, from the owners' user_leagues documents
+    #(one batched read per owner) rather than a scan of every league
+    users = sorted(team_ids_by_user)
+    league_ids = set()
+    for doc in get_many(db, [user_leagues_ref(db, uid) for uid in users], field_paths=["leagues"]):
+        if not doc:
+            continue
+        team_ids = team_ids_by_user[doc.id]
+        for league_id, summary in (doc.to_dict().get("leagues") or {}).items():
+            if (summary or {}).get("team_id") in team_ids:
+                league_ids.add(league_id)
+    return sorted(league_ids)
+
+def standings_page_query(db, league_id, limit=None, cursor=None):
+    query = entries_ref(db, league_id).order_by("position")
+    if cursor:
+        query = query.start_after({"position": int(cursor)})
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def read_standings_page(db, league_id, limit=None, cursor=None):
+    query = standings_page_query(db, league_id, limit, cursor)
+    entries = [doc.to_dict() for doc in query.stream()]
+    if not entries and not cursor and not standings_ref(db, league_id).get().exists:
+        #Never materialized: build it now
+        refresh_league_standings(db, [league_id])
+        entries = [doc.to_dict() for doc in query.stream()]
+
+    next_cursor = entries[-1]["position"] if limit and len(entries) == limit else None
+    return entries, next_cursor
+
+def read_member_rank(db, league_id, user_id):
+    doc = entries_ref(db, league_id).document(user_id).get()
+    return doc.to_dict() if doc.exists else None
+
+async def read_standings_page_async(client, db, league_id, limit=None, cursor=None):
+    #The first page's rows and summary are read together, so telling "no members yet"
+    #from "never materialized" costs no extra round-trip; materializing runs on db
+    query = standings_page_query(client, league_id, limit, cursor)
+    if cursor:
+        docs, summary = await fetch(query), None
+    else:
+        docs, summary = await asyncio.gather(fetch(query), fetch_doc(standings_ref(client, league_id)))
+    entries = [doc.to_dict() for doc in docs]
+    if not entries and summary is not None and not summary.exists:
+        await asyncio.to_thread(refresh_league_standings, db, [league_id])
+        entries = [doc.to_dict() for doc in await fetch(query)]
+
+    next_cursor = entries[-1]["position"] if limit and len(entries) == limit else None
+    return entries, next_cursor
+
+async def read_member_rank_async(client, league_id, user_id):
+    doc = await fetch_doc(entries_ref(client, league_id).document(user_id))
+    return doc.to_dict() if doc.exists else None
@@ -75,7 +75,7 @@ function openForm(section, data = null) {
   modalTitle.textContent = data ? `Edit ${section}` : `Add ${section}`;
 
   const fields = {
-    drivers: ['name', 'price', 'points', 'team_id'],
+    drivers: ['name', 'price', 'team_id'],
     races: ['name', 'date', 'results'],
     leagues: ['name', 'type', 'team_restriction']
   };
@@ -89,13 +89,6 @@ function openForm(section, data = null) {
     nameInput.value = data?.name ?? '';
     modalForm.appendChild(nameInput);
 
-    const scoreInput = document.createElement('input');
-    scoreInput.placeholder = "Score";
-    scoreInput.name = "score";
-    scoreInput.type = "number";
-    scoreInput.value = data?.score ?? 0;
-    modalForm.appendChild(scoreInput);
-
     const priceInput = document.createElement('input');
     priceInput.placeholder = "Price";
     priceInput.name = "price";
@@ -141,7 +134,6 @@ function openForm(section, data = null) {
 
           const payload = {
             name: modalForm.elements.name.value,
-            score: parseInt(modalForm.elements.score.value || "0"),
             price: parseInt(modalForm.elements.price.value || "0"),
             drivers: [...modalForm.elements]
               .filter(el => el.name === "drivers" && el.value)
@@ -335,9 +327,13 @@ function openForm(section, data = null) {
           headers: { "Content-Type": "application/json" },
           body: JSON.stringify({ id: data?.id, ...payload })
         })
-          .then(() => {
+          .then(res => res.json())
+          .then(result => {
             closeModal();
             loadSection('races');
+            if (result.job_id) {
+              waitForJob(result.job_id).then(() => sections.forEach(section => loadSection(section)));
+            }
           })
           .finally(() => {
             loadingText.style.display = "none";
@@ -387,6 +383,20 @@ function openForm(section, data = null) {
   }
 }
 
+//Poll a background scoring job until it finishes
+async function waitForJob(jobId, intervalMs = 1500) {
+  while (true) {
+    const res = await fetch(`/admin/jobs/${jobId}`);
+    const job = await res.json();
+    if (!res.ok || job.status === "done") return job;
+    if (job.status === "failed") {
+      alert(`Race scoring failed: ${job.error}`);
+      return job;
+    }
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+}
+
 function closeModal() {
   modal.style.display = "none";
   document.body.style.overflow = "";
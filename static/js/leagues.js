@@ -1,4 +1,43 @@
 let selectedLeagueId = null;
+let currentStandings = [];
+
+//Live standings pushed by the server after scoring
+const socket = io();
+let subscribedLeagueId = null;
+
+socket.on("standings_update", update => {
+  if (update.league_id !== selectedLeagueId) return;
+
+  const byUser = Object.fromEntries(currentStandings.map(e => [e.user_id, e]));
+  update.changes.forEach(change => {
+    if (change.removed) {
+      delete byUser[change.user_id];
+    } else {
+      byUser[change.user_id] = change;
+    }
+  });
+  renderStandings(Object.values(byUser).sort((a, b) => a.position - b.position));
+});
+
+//Rooms belong to a connection: rejoin the open league after a reconnect and reload
+//its table, since pushes sent while disconnected were missed
+socket.on("connect", async () => {
+  const leagueId = subscribedLeagueId;
+  if (!leagueId) return;
+  socket.emit("subscribe_league", { league_id: leagueId });
+  const res = await fetch(`/user/leagues/${leagueId}/standings`);
+  const data = await res.json();
+  if (leagueId === selectedLeagueId) renderStandings(Array.isArray(data) ? data : []);
+});
+
+function subscribeToLeague(leagueId) {
+  if (subscribedLeagueId === leagueId) return;
+  if (subscribedLeagueId) {
+    socket.emit("unsubscribe_league", { league_id: subscribedLeagueId });
+  }
+  socket.emit("subscribe_league", { league_id: leagueId });
+  subscribedLeagueId = leagueId;
+}
 
 //Page initialization
 window.onload = () => {
@@ -253,19 +292,23 @@ async function showLeagueDetails(league) {
     codeContainer.style.display = "none";
   }
 
-  //Load standings
+  //Load standings, then keep them current from pushes
   const res = await fetch(`/user/leagues/${league.id}/standings`);
   const data = await res.json();
 
+  renderStandings(Array.isArray(data) ? data : []);
+  subscribeToLeague(league.id);
+}
+
+function renderStandings(entries) {
+  currentStandings = entries;
   const tableBody = document.querySelector("#leagueStandingsTable tbody");
   tableBody.innerHTML = "";
-  if (Array.isArray(data)) {
-    data.forEach(entry => {
-      const tr = document.createElement("tr");
-      tr.innerHTML = `<td>${entry.username}</td><td>${entry.team_name}</td><td>${entry.points}</td>`;
-      tableBody.appendChild(tr);
-    });
-  }
+  entries.forEach(entry => {
+    const tr = document.createElement("tr");
+    tr.innerHTML = `<td>${entry.username}</td><td>${entry.team_name}</td><td>${entry.points}</td>`;
+    tableBody.appendChild(tr);
+  });
 }
 
 //Change team modal setup
@@ -3,6 +3,33 @@ let driverPriceMap = {};
 let teamPriceMap = {};
 let currentUser = null;
 
+//Live score pushes: points diffs for this user's teams and new race results
+const socket = io();
+
+socket.on("points_update", update => {
+  Object.entries(update.teams).forEach(([teamId, delta]) => {
+    const label = document.querySelector(`[data-team-points="${teamId}"]`);
+    if (!label) return;
+    const points = Number(label.dataset.points) + delta;
+    label.dataset.points = points;
+    label.textContent = `Points: ${points}`;
+  });
+});
+
+socket.on("race_update", () => loadRaceResults());
+
+//Rooms belong to a connection: subscribe again after every (re)connect, with a fresh
+//token, and reload the teams since point pushes sent while disconnected were missed
+let socketConnected = false;
+socket.on("connect", async () => {
+  const reconnect = socketConnected;
+  socketConnected = true;
+  if (!currentUser) return;
+  const token = await currentUser.getIdToken();
+  socket.emit("subscribe_user", { token });
+  if (reconnect) loadFantasyTeams(token);
+});
+
 //Ensure user is authenticated before loading teams
 firebase.auth().onAuthStateChanged(async user => {
   if (!user) {
@@ -37,6 +64,7 @@ async function loadFantasyTeams(token) {
       <p>Drivers: ${driverList}</p>
       <p>Team: ${team.team_name}</p>
       <p>Price: $${team.price.toLocaleString()}</p>
+      <p data-team-points="${team.id}" data-points="${team.points ?? 0}">Points: ${team.points ?? 0}</p>
     `;
 
     const deleteBtn = document.createElement("button");
@@ -188,6 +216,7 @@ firebase.auth().onAuthStateChanged(async user => {
   attachFantasyForm(token);
   loadFantasyTeams(token);
   loadRaceResults();
+  if (socket.connected) socket.emit("subscribe_user", { token });
 });
 
 function openRaceModal(raceId) {
@@ -199,12 +228,11 @@ function openRaceModal(raceId) {
       const list = document.getElementById("raceDriverList");
       list.innerHTML = "";
 
-      //Sort drivers by points descending
-      data.results.sort((a, b) => b.points - a.points);
-
+      //Scoring drivers only, already sorted by the server
       data.results.forEach((d, i) => {
         const li = document.createElement("li");
-        li.textContent = `${i + 1}. ${d.name}: ${d.points} pts`;
+        const team = d.team_name ? ` (${d.team_name})` : "";
+        li.textContent = `${d.position}. ${d.name}${team}: ${d.points} pts`;
         li.style.fontSize = "13px";
         li.style.lineHeight = "1.4";
         if (i < 10) li.style.fontWeight = "bold"; //Highlight drivers with points
@@ -0,0 +1,651 @@
+import os
+import json
+import random
+import logging
+import string
+import threading
+from functools import lru_cache
+from datetime import datetime, timezone
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.field_path import FieldPath
+
+#Data-access layer. Routes talk to a client with the Firestore API surface the app uses
+#(collection/document/where/order_by/stream/get_all/batch/transaction/on_snapshot).
+#STORAGE_BACKEND=firestore (default) returns the real client; STORAGE_BACKEND=memory
+#returns MemoryClient, which needs no credentials and counts every read and write.
+
+log = logging.getLogger(__name__)
+
+_firebase_lock = threading.Lock()
+
+def backend_name(backend=None):
+    return (backend or os.getenv("STORAGE_BACKEND", "firestore")).lower()
+
+def firebase_app():
+    #Default firebase_admin app, initialized on first use rather than at import
+    import firebase_admin
+    from firebase_admin import credentials
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS"))
+            firebase_admin.initialize_app(cred)
+        return firebase_admin.get_app()
+
+def get_client(backend=None):
+    backend = backend_name(backend)
+    if backend == "memory":
+        client = MemoryClient()
+        seed_path = os.getenv("STORAGE_MEMORY_SEED")
+        if seed_path:
+            with open(seed_path) as f:
+                client.load(json.load(f))
+            log.info("Loaded in-memory store from %s", seed_path)
+        return client
+    if backend == "firestore":
+        #A client of our own rather than firebase_admin's per-app singleton, so a forked
+        #worker can open fresh gRPC channels instead of inheriting the parent's
+        from google.cloud import firestore as cloud_firestore
+        app = firebase_app()
+        return cloud_firestore.Client(project=app.project_id, credentials=app.credential.get_credential())
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+def get_async_client(backend=None, client=None):
+    #Async counterpart of get_client(). Build it on the event loop that will use it; the
+    #memory backend wraps client (the process's sync store) so both see the same data
+    backend = backend_name(backend)
+    if backend == "memory":
+        return AsyncMemoryClient(client if client is not None else get_client(backend))
+    if backend == "firestore":
+        from google.cloud import firestore as cloud_firestore
+        app = firebase_app()
+        return cloud_firestore.AsyncClient(project=app.project_id, credentials=app.credential.get_credential())
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+class LazyClient:
+    #Stands in for get_client(): the real client is built on first use, so importing the
+    #app does no credential or network work, and rebuilt in each forked child (Firestore
+    #only; a forked memory store is the child's own copy and is kept)
+    def __init__(self, backend=None):
+        self.backend = backend_name(backend)
+        self._lazy_client = None
+        self._lazy_lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def started(self):
+        return self._lazy_client is not None
+
+    def resolve(self):
+        client = self._lazy_client
+        if client is None:
+            with self._lazy_lock:
+                if self._lazy_client is None:
+                    self._lazy_client = get_client(self.backend)
+                    log.info("Created %s client in process %d", self.backend, os.getpid())
+                client = self._lazy_client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def _after_fork(self):
+        self._lazy_lock = threading.Lock()
+        if self.backend != "memory":
+            self._lazy_client = None
+
+def is_memory(db):
+    if isinstance(db, LazyClient):
+        return db.backend == "memory"
+    return isinstance(db, MemoryClient)
+
+def run_transaction(db, fn, *args):
+    #Runs fn(transaction, *args) atomically on either backend and returns its result
+    if is_memory(db):
+        #Holding the engine lock serializes it against every other commit
+        with db._lock:
+            transaction = db.transaction()
+            result = fn(transaction, *args)
+            transaction.commit()
+            return result
+    from firebase_admin import firestore
+    return firestore.transactional(fn)(db.transaction(), *args)
+
+#In-memory engine
+
+AUTO_ID_CHARS = string.ascii_letters + string.digits
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(v in a for v in b)
+}
+MISSING = object()
+
+def auto_id():
+    return "".join(random.choices(AUTO_ID_CHARS, k=20))
+
+def copy_value(value):
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    return value
+
+@lru_cache(maxsize=4096)
+def field_parts(field_path):
+    #"a.b" or quoted segments like results.`3xYz9`, as Firestore parses them
+    return FieldPath.from_api_repr(field_path).parts
+
+def get_path(data, field_path):
+    value = data
+    for part in field_parts(field_path):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def resolve_transform(current, value, now):
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, transforms.ArrayUnion):
+        base = list(current) if isinstance(current, list) else []
+        return base + [v for v in value.values if v not in base]
+    if isinstance(value, transforms.ArrayRemove):
+        base = list(current) if isinstance(current, list) else []
+        return [v for v in base if v not in value.values]
+    return copy_value(value)
+
+def set_path(data, parts, value, now):
+    target = data
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    if value is transforms.DELETE_FIELD:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = resolve_transform(target.get(parts[-1], MISSING), value, now)
+
+def merge_into(data, update, now):
+    for key, value in update.items():
+        if isinstance(value, dict) and not isinstance(data.get(key), dict):
+            data[key] = {}
+        if isinstance(value, dict):
+            merge_into(data[key], value, now)
+        else:
+            set_path(data, [key], value, now)
+
+def doc_id_of(value):
+    return value.id if isinstance(value, MemoryDocumentReference) else value
+
+class MemorySnapshot:
+    def __init__(self, reference, data, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self._field_paths = field_paths
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        if self._field_paths is None:
+            return copy_value(self._data)
+        projected = {}
+        for field in self._field_paths:
+            value = get_path(self._data, field)
+            if value is not MISSING:
+                parts = field_parts(field)
+                target = projected
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = copy_value(value)
+        return projected
+
+    def get(self, field_path):
+        value = get_path(self._data or {}, field_path)
+        if value is MISSING:
+            raise KeyError(field_path)
+        return copy_value(value)
+
+class MemoryWatch:
+    def __init__(self, client, key, callback):
+        self.client = client
+        self.key = key
+        self.callback = callback
+
+    def unsubscribe(self):
+        self.client._remove_listener(self)
+
+class MemoryQuery:
+    def __init__(self, client, collection_path, group=False, filters=(), orders=(),
+                 limit_count=None, cursor=None, projection=None):
+        self._client = client
+        self._path = collection_path
+        self._group = group
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders, "limit_count": self._limit,
+            "cursor": self._cursor, "projection": self._projection
+        }
+        state.update(changes)
+        return MemoryQuery(self._client, self._path, self._group, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in OPERATORS:
+            raise ValueError(f"Unsupported operator '{op_string}'")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def stream(self, transaction=None):
+        return iter(self._client._run_query(self))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._add_listener(("query", self), callback)
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.split("/")[-1]
+        self.path = path
+
+    @property
+    def parent(self):
+        parts = self.path.split("/")
+        return MemoryDocumentReference(self._client, "/".join(parts[:-1])) if len(parts) > 1 else None
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, f"{self.path}/{document_id or auto_id()}")
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id in self._client._docs(self.path)]
+
+    def on_snapshot(self, callback):
+        return self._client._add_listener(("collection", self.path), callback)
+
+class MemoryDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.split("/")[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self):
+        return MemoryCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return MemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._get(self, field_paths)
+
+    def create(self, document_data):
+        self._client._commit([("create", self, document_data, False)])
+
+    def set(self, document_data, merge=False):
+        self._client._commit([("set", self, document_data, merge)])
+
+    def update(self, field_updates):
+        self._client._commit([("update", self, field_updates, False)])
+
+    def delete(self):
+        self._client._commit([("delete", self, None, False)])
+
+    def on_snapshot(self, callback):
+        return self._client._add_listener(("document", self.path), callback)
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def create(self, reference, document_data):
+        self._ops.append(("create", reference, document_data, False))
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set", reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._ops.append(("update", reference, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        self._client._commit(ops)
+        return [datetime.now(timezone.utc)] * len(ops)
+
+    def __len__(self):
+        return len(self._ops)
+
+class MemoryTransaction(MemoryWriteBatch):
+    pass
+
+class MemoryClient:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._listeners = []
+        self.stats = {"reads": 0, "writes": 0, "queries": 0, "commits": 0}
+
+    #Public Firestore-like surface
+
+    def collection(self, path):
+        return MemoryCollectionReference(self, path)
+
+    def document(self, path):
+        return MemoryDocumentReference(self, path)
+
+    def collection_group(self, collection_id):
+        return MemoryQuery(self, collection_id, group=True)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def transaction(self):
+        return MemoryTransaction(self)
+
+    def run_transaction(self, fn, *args):
+        with self._lock:
+            transaction = MemoryTransaction(self)
+            result = fn(transaction, *args)
+            transaction.commit()
+            return result
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        with self._lock:
+            snapshots = [self._get(ref, field_paths) for ref in references]
+        return iter(snapshots)
+
+    def collections(self):
+        return [self.collection(path) for path in self._collections if "/" not in path]
+
+    #Stats and fixtures
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def snapshot_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def load(self, data):
+        #data: {collection path: {doc id: fields}}
+        with self._lock:
+            for path, docs in data.items():
+                bucket = self._collections.setdefault(path, {})
+                for doc_id, fields in docs.items():
+                    bucket[doc_id] = copy_value(fields)
+
+    def dump(self):
+        with self._lock:
+            return {path: copy_value(docs) for path, docs in self._collections.items() if docs}
+
+    def clear(self):
+        with self._lock:
+            self._collections.clear()
+
+    #Engine internals
+
+    def _docs(self, collection_path):
+        return self._collections.get(collection_path, {})
+
+    def _get(self, ref, field_paths=None):
+        collection_path, doc_id = ref.path.rsplit("/", 1)
+        with self._lock:
+            self.stats["reads"] += 1
+            data = self._docs(collection_path).get(doc_id)
+        return MemorySnapshot(ref, data, field_paths)
+
+    def _run_query(self, query):
+        with self._lock:
+            self.stats["queries"] += 1
+            if query._group:
+                sources = [p for p in self._collections if p.split("/")[-1] == query._path]
+            else:
+                sources = [query._path]
+            rows = [
+                (MemoryDocumentReference(self, f"{path}/{doc_id}"), data)
+                for path in sources for doc_id, data in self._docs(path).items()
+            ]
+
+            for field_path, op, value in query._filters:
+                matcher = OPERATORS[op]
+                if field_path == "__name__":
+                    rows = [r for r in rows if matcher(r[0].id, doc_id_of(value))]
+                else:
+                    rows = [r for r in rows if get_path(r[1], field_path) is not MISSING
+                            and matcher(get_path(r[1], field_path), value)]
+
+            orders = list(query._orders)
+            for field_path, _ in orders:
+                if field_path != "__name__":
+                    rows = [r for r in rows if get_path(r[1], field_path) is not MISSING]
+
+            def sort_key(row, field_path):
+                return row[0].path if field_path == "__name__" else get_path(row[1], field_path)
+
+            rows.sort(key=lambda r: r[0].path)
+            for field_path, direction in reversed(orders):
+                rows.sort(key=lambda r: sort_key(r, field_path), reverse=direction == "DESCENDING")
+
+            if query._cursor is not None:
+                rows = self._apply_cursor(rows, orders, query._cursor)
+            if query._limit is not None:
+                rows = rows[:query._limit]
+
+            self.stats["reads"] += max(1, len(rows))
+            return [MemorySnapshot(ref, data, query._projection) for ref, data in rows]
+
+    def _apply_cursor(self, rows, orders, cursor):
+        if isinstance(cursor, MemorySnapshot):
+            values = {field: (cursor.id if field == "__name__" else get_path(cursor._data, field))
+                      for field, _ in orders}
+            values.setdefault("__name__", cursor.id)
+        else:
+            values = {field: doc_id_of(value) for field, value in cursor.items()}
+
+        keys = [(field, direction) for field, direction in orders if field in values]
+        if "__name__" in values and "__name__" not in [f for f, _ in keys]:
+            keys.append(("__name__", "ASCENDING"))
+
+        def after(row):
+            for field, direction in keys:
+                current = row[0].id if field == "__name__" else get_path(row[1], field)
+                target = values[field]
+                if current == target:
+                    continue
+                return current > target if direction != "DESCENDING" else current < target
+            return False
+
+        return [row for row in rows if after(row)]
+
+    def _commit(self, ops):
+        now = datetime.now(timezone.utc)
+        touched = set()
+        with self._lock:
+            staged = {}
+
+            def current(ref):
+                if ref.path in staged:
+                    return staged[ref.path]
+                collection_path, doc_id = ref.path.rsplit("/", 1)
+                return self._docs(collection_path).get(doc_id)
+
+            for op, ref, data, merge in ops:
+                existing = current(ref)
+                if op == "create":
+                    if existing is not None:
+                        raise gexc.AlreadyExists(f"Document already exists: {ref.path}")
+                    new = {}
+                    merge_into(new, data, now)
+                elif op == "set":
+                    new = copy_value(existing) if merge and existing is not None else {}
+                    merge_into(new, data, now)
+                elif op == "update":
+                    if existing is None:
+                        raise gexc.NotFound(f"No document to update: {ref.path}")
+                    new = copy_value(existing)
+                    for field_path, value in data.items():
+                        set_path(new, field_parts(field_path), value, now)
+                else:
+                    new = None
+                staged[ref.path] = new
+
+            for path, data in staged.items():
+                collection_path, doc_id = path.rsplit("/", 1)
+                if data is None:
+                    self._collections.get(collection_path, {}).pop(doc_id, None)
+                else:
+                    self._collections.setdefault(collection_path, {})[doc_id] = data
+                touched.add(path)
+
+            self.stats["writes"] += len(ops)
+            self.stats["commits"] += 1
+            notifications = self._pending_notifications(touched)
+
+        for watch, payload in notifications:
+            watch.callback(*payload)
+
+    #Snapshot listeners: called outside the engine lock after each commit that touches them
+
+    def _add_listener(self, key, callback):
+        watch = MemoryWatch(self, key, callback)
+        with self._lock:
+            self._listeners.append(watch)
+            payload = self._listener_payload(watch)
+        callback(*payload)
+        return watch
+
+    def _remove_listener(self, watch):
+        with self._lock:
+            if watch in self._listeners:
+                self._listeners.remove(watch)
+
+    def _pending_notifications(self, touched):
+        pending = []
+        for watch in self._listeners:
+            kind, target = watch.key
+            if kind == "document":
+                hit = target in touched
+            elif kind == "collection":
+                hit = any(path.rsplit("/", 1)[0] == target for path in touched)
+            else:
+                hit = any(path.rsplit("/", 1)[0] == target._path or target._group for path in touched)
+            if hit:
+                pending.append((watch, self._listener_payload(watch)))
+        return pending
+
+    def _listener_payload(self, watch):
+        kind, target = watch.key
+        now = datetime.now(timezone.utc)
+        if kind == "document":
+            collection_path, doc_id = target.rsplit("/", 1)
+            ref = MemoryDocumentReference(self, target)
+            docs = [MemorySnapshot(ref, self._docs(collection_path).get(doc_id))]
+        elif kind == "collection":
+            docs = [MemorySnapshot(MemoryDocumentReference(self, f"{target}/{doc_id}"), data)
+                    for doc_id, data in self._docs(target).items()]
+        else:
+            docs = self._run_query(target)
+        return docs, [], now
+
+#Async face of the in-memory engine, for the async views of asgi.py on STORAGE_BACKEND=memory
+
+AWAITABLE_METHODS = {"get", "set", "update", "create", "delete", "add"}
+
+class AsyncMemoryClient:
+    #Mirrors google.cloud.firestore.AsyncClient over a MemoryClient: references and queries
+    #are built the same way, get()/writes are awaited and stream()/get_all() are async iterators
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, path):
+        return AsyncMemoryReference(self._client.collection(path))
+
+    def document(self, path):
+        return AsyncMemoryReference(self._client.document(path))
+
+    def collection_group(self, collection_id):
+        return AsyncMemoryReference(self._client.collection_group(collection_id))
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        targets = [ref._target if isinstance(ref, AsyncMemoryReference) else ref for ref in references]
+        for snapshot in self._client.get_all(targets, field_paths=field_paths):
+            yield snapshot
+
+class AsyncMemoryReference:
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name == "stream":
+            async def stream(*args, **kwargs):
+                for snapshot in value(*args, **kwargs):
+                    yield snapshot
+            return stream
+        if name in AWAITABLE_METHODS:
+            async def call(*args, **kwargs):
+                return value(*args, **kwargs)
+            return call
+        if callable(value):
+            def build(*args, **kwargs):
+                return _async_face(value(*args, **kwargs))
+            return build
+        return _async_face(value)
+
+def _async_face(value):
+    if isinstance(value, (MemoryQuery, MemoryDocumentReference)):
+        return AsyncMemoryReference(value)
+    return value
@@ -0,0 +1,29 @@
+import os
+import sys
+import random
+import pytest
+
+#The app builds its client at import, so point it at the in-memory store first
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("DEV_AUTH", "1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench
+import app as fantasy_app
+
+@pytest.fixture
+def app_module():
+    return fantasy_app
+
+@pytest.fixture
+def season(app_module):
+    #A small season seeded through the app's own code paths, as bench.py does
+    app_module.db.resolve().clear()
+    args = bench.parse_args(["--fantasy-teams", "200", "--leagues", "12", "--races", "6"])
+    data, lineups, _ = bench.seed(app_module, args, random.Random(7))
+    return data
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,53 @@
+import random
+from itertools import combinations
+import pytest
+from optimizer import optimize_lineups, LINEUP_SIZE
+
+def brute_force(drivers, teams, budget, limit, objective):
+    #Every 5-driver combination against every constructor: (score, price) of the top `limit`
+    rows = []
+    for combo in combinations(sorted(drivers), LINEUP_SIZE):
+        for tid in sorted(teams):
+            price = sum(drivers[did]["price"] for did in combo) + teams[tid]["price"]
+            if price > budget:
+                continue
+            points = sum(drivers[did]["points"] for did in combo) + teams[tid]["score"]
+            score = points / max(price, 1) if objective == "value" else float(points)
+            rows.append((score, price))
+    rows.sort(key=lambda row: (-row[0], row[1]))
+    return rows[:limit]
+
+def random_pool(rng):
+    #Small integer ranges so equal prices and points (ties) are common
+    drivers = {f"d{i:02d}": {"name": f"Driver {i}", "price": rng.randint(1, 30), "points": rng.randint(0, 60)}
+               for i in range(rng.randint(LINEUP_SIZE, 16))}
+    teams = {f"t{i}": {"name": f"Team {i}", "price": rng.randint(1, 30), "score": rng.randint(0, 80)}
+             for i in range(rng.randint(1, 4))}
+    return drivers, teams
+
+@pytest.mark.parametrize("objective", ["points", "value"])
+def test_matches_brute_force(objective):
+    rng = random.Random(objective)
+    for _ in range(150):
+        drivers, teams = random_pool(rng)
+        budget = rng.randint(40, 160)
+        limit = rng.randint(1, 8)
+
+        lineups = optimize_lineups(drivers, teams, budget, limit=limit, objective=objective)
+        expected = brute_force(drivers, teams, budget, limit, objective)
+
+        assert len(lineups) == len(expected)
+        for lineup, (score, price) in zip(lineups, expected):
+            points = lineup["points"]
+            assert lineup["price"] == price
+            assert (points / max(price, 1) if objective == "value" else points) == pytest.approx(score)
+            assert lineup["price"] <= budget
+            assert len(set(lineup["drivers"])) == LINEUP_SIZE
+
+def test_too_few_drivers():
+    drivers = {f"d{i}": {"price": 1, "points": 1} for i in range(LINEUP_SIZE - 1)}
+    assert optimize_lineups(drivers, {"t": {"price": 1, "score": 1}}, 100) == []
+
+def test_unknown_objective():
+    with pytest.raises(ValueError):
+        optimize_lineups({}, {}, 100, objective="cheapest")
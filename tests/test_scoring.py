@@ -0,0 +1,87 @@
+import random
+import pytest
+import scoring
+from recompute import recompute_season
+
+#Incremental scoring (apply_race_results and the fantasy/standings refresh after it) must
+#always land on what a full recompute from the race results gives
+
+NO_CHANGES = {"drivers": 0, "teams": 0, "fantasy_teams": 0, "races": 0}
+
+def submit(app_module, race_id, results, data):
+    race = data["races"].get(race_id) or {"name": f"Race {race_id}", "date": "2025-12-01"}
+    app_module.save_race(race_id, race["name"], race["date"], results)
+    return app_module.score_races([{"id": race_id, "name": race["name"], "date": race["date"]}])
+
+def random_results(rng, driver_ids):
+    return {did: rng.randint(0, 25) for did in rng.sample(driver_ids, rng.randint(1, 10))}
+
+def assert_consistent(app_module):
+    assert recompute_season(app_module.db, dry_run=True)["changed"] == NO_CHANGES
+    changes = app_module.refresh_league_standings(app_module.db)
+    assert not any(changes.values())
+
+def test_scoring_matches_recompute(app_module, season):
+    rng = random.Random(11)
+    driver_ids = sorted(season["drivers"])
+    race_ids = sorted(season["races"])
+
+    #Re-entered results for existing races, then a new race
+    for race_id in rng.sample(race_ids, 3) + ["race99"]:
+        submit(app_module, race_id, random_results(rng, driver_ids), season)
+        assert_consistent(app_module)
+
+def test_constructor_follows_its_driver_list(app_module, season, client):
+    team_id = sorted(season["teams"])[0]
+    team = app_module.db.collection("teams").document(team_id).get().to_dict()
+    kept, dropped = team["drivers"][0], team["drivers"][1]
+
+    response = client.put("/admin/update/teams", json={
+        "id": team_id, "name": team["name"], "price": team["price"], "drivers": [kept]
+    })
+    assert response.status_code == 200
+    assert app_module.db.collection("drivers").document(dropped).get().to_dict()["team_id"] is None
+
+    before = app_module.db.collection("teams").document(team_id).get().to_dict()["score"]
+    submit(app_module, sorted(season["races"])[0], {kept: 10, dropped: 5}, season)
+    race = season["races"][sorted(season["races"])[0]]["results"]
+    expected = before + 10 - int(race.get(kept, 0))
+    assert app_module.db.collection("teams").document(team_id).get().to_dict()["score"] == expected
+    assert_consistent(app_module)
+
+def test_failed_pass_is_repaired_by_resubmitting(app_module, season, monkeypatch):
+    race_id = sorted(season["races"])[1]
+    driver_ids = sorted(season["drivers"])
+    results = {driver_ids[0]: 25, driver_ids[1]: 18}
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("standings refresh timed out")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(scoring, "refresh_league_standings", fail)
+        with pytest.raises(RuntimeError):
+            submit(app_module, race_id, results, season)
+    assert scoring.load_pending(app_module.db, ("leagues",))["leagues"]
+
+    #Totals were not counted twice and the standings left behind are refreshed
+    submit(app_module, race_id, results, season)
+    assert not any(scoring.load_pending(app_module.db, ("drivers", "teams", "leagues")).values())
+    assert_consistent(app_module)
+
+def test_direct_total_edits_are_ignored(app_module, season, client):
+    driver_id = sorted(season["drivers"])[0]
+    driver = app_module.db.collection("drivers").document(driver_id).get().to_dict()
+    response = client.put("/admin/update/drivers", json={
+        "id": driver_id, "name": driver["name"], "price": driver["price"], "points": 12345,
+        "team_id": driver["team_id"]
+    })
+    assert response.status_code == 200
+    assert app_module.db.collection("drivers").document(driver_id).get().to_dict()["points"] == driver["points"]
+    assert_consistent(app_module)
+
+@pytest.mark.parametrize("results", [{"driver00": "x"}, ["driver00"], {"nobody": 3}, {"driver00": -1}])
+def test_invalid_race_results_are_rejected(season, client, results):
+    response = client.put("/admin/update/races", json={
+        "id": "race01", "name": "Grand Prix 1", "date": "2025-03-02", "results": results
+    })
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import pytest
+from firebase_admin import firestore
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1.field_path import FieldPath
+import storage
+
+#Semantics of the in-memory backend that the app and benchmarks rely on to match Firestore
+
+@pytest.fixture
+def db():
+    return storage.MemoryClient()
+
+def test_transforms(db):
+    ref = db.collection("c").document("d")
+    ref.set({"n": 1, "tags": ["a"], "m": {"x": 1, "y": 2}})
+    ref.update({"n": firestore.Increment(2), "tags": firestore.ArrayUnion(["a", "b"]),
+                "m.x": firestore.DELETE_FIELD})
+    assert ref.get().to_dict() == {"n": 3, "tags": ["a", "b"], "m": {"y": 2}}
+    ref.set({"m": {"y": firestore.DELETE_FIELD, "z": 3}, "tags": firestore.ArrayRemove(["a"])}, merge=True)
+    assert ref.get().to_dict() == {"n": 3, "tags": ["b"], "m": {"z": 3}}
+
+def test_update_and_create_preconditions(db):
+    with pytest.raises(gexc.NotFound):
+        db.collection("c").document("missing").update({"a": 1})
+    db.collection("c").document("d").create({"a": 1})
+    with pytest.raises(gexc.AlreadyExists):
+        db.collection("c").document("d").create({"a": 2})
+
+def test_quoted_field_paths(db):
+    #Map keys that are not plain identifiers must be quoted, as with Firestore
+    ref = db.collection("races").document("r")
+    ref.set({"results": {"3xY-z": 10, "plain": 1}})
+    field = FieldPath("results", "3xY-z").to_api_repr()
+    assert ref.get(field_paths=[field]).to_dict() == {"results": {"3xY-z": 10}}
+    ref.update({field: firestore.Increment(5)})
+    assert ref.get().to_dict()["results"]["3xY-z"] == 15
+
+def test_queries(db):
+    teams = db.collection("fantasy_teams")
+    teams.document("a").set({"user_id": "u1", "drivers": ["d1", "d2"], "points": 5})
+    teams.document("b").set({"user_id": "u2", "drivers": ["d2"], "points": 9})
+    teams.document("c").set({"user_id": "u1", "drivers": ["d3"], "points": 1})
+
+    assert {doc.id for doc in teams.where("drivers", "array_contains", "d2").stream()} == {"a", "b"}
+    ordered = [doc.id for doc in teams.where("user_id", "==", "u1").order_by("points").stream()]
+    assert ordered == ["c", "a"]
+    page = [doc.id for doc in teams.order_by("points").start_after({"points": 1}).limit(1).stream()]
+    assert page == ["a"]
+    assert [doc.to_dict() for doc in teams.select(["points"]).where("user_id", "==", "u2").stream()] == [{"points": 9}]
+
+def test_collection_group_and_subcollections(db):
+    db.collection("league_members").document("l1").collection("members").document("u1").set({"league_id": "l1"})
+    db.collection("league_members").document("l2").collection("members").document("u1").set({"league_id": "l2"})
+    #Documents under a subcollection are not listed with their parent collection
+    assert list(db.collection("league_members").stream()) == []
+    assert sorted(doc.to_dict()["league_id"] for doc in db.collection_group("members").stream()) == ["l1", "l2"]
+
+def test_batches_are_atomic(db):
+    db.collection("c").document("a").set({"n": 1})
+    batch = db.batch()
+    batch.update(db.collection("c").document("a"), {"n": 2})
+    batch.update(db.collection("c").document("missing"), {"n": 2})
+    with pytest.raises(gexc.NotFound):
+        batch.commit()
+    assert db.collection("c").document("a").get().to_dict() == {"n": 1}
+
+def test_transactions(db):
+    ref = db.collection("c").document("counter")
+    ref.set({"n": 0})
+
+    def bump(transaction):
+        current = ref.get(transaction=transaction).to_dict()["n"]
+        transaction.update(ref, {"n": current + 1})
+        return current + 1
+
+    assert storage.run_transaction(db, bump) == 1
+    assert storage.run_transaction(db, bump) == 2
+    assert ref.get().to_dict() == {"n": 2}
+
+def test_snapshots_are_copies(db):
+    ref = db.collection("c").document("d")
+    ref.set({"m": {"a": 1}})
+    data = ref.get().to_dict()
+    data["m"]["a"] = 2
+    assert ref.get().to_dict() == {"m": {"a": 1}}
@@ -0,0 +1,124 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from firebase_admin import auth
+import storage
+
+#Bounded LRU of decoded Firebase ID tokens keyed by token hash.
+#Entries live until the token's exp; optionally re-checked for revocation every N seconds.
+
+log = logging.getLogger(__name__)
+
+class TokenCache:
+    def __init__(self, verify=None, max_size=10000, revocation_check_seconds=0, clock=time.time):
+        self._verify = verify or verify_id_token
+        self.max_size = max_size
+        self.revocation_check_seconds = revocation_check_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.revocation_checks = 0
+        self.verifications = 0
+        self.verify_seconds_total = 0.0
+        self.verify_seconds_max = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token):
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["exp"] <= now:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                recheck = self.revocation_check_seconds and now - entry["checked_at"] >= self.revocation_check_seconds
+                if not recheck:
+                    self.hits += 1
+                    return entry["claims"]
+            else:
+                recheck = False
+                self.misses += 1
+
+        if recheck:
+            with self._lock:
+                self.revocation_checks += 1
+        claims = self._timed_verify(token, check_revoked=bool(recheck or self.revocation_check_seconds))
+
+        with self._lock:
+            self._entries[key] = {
+                "claims": claims,
+                "exp": claims.get("exp", now),
+                "checked_at": now
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return claims
+
+    def invalidate(self, token=None):
+        with self._lock:
+            if token is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(hashlib.sha256(token.encode("utf-8")).hexdigest(), None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "revocation_checks": self.revocation_checks,
+                "verifications": self.verifications,
+                "verify_ms_avg": round(1000 * self.verify_seconds_total / self.verifications, 3) if self.verifications else 0.0,
+                "verify_ms_max": round(1000 * self.verify_seconds_max, 3)
+            }
+
+    def _timed_verify(self, token, check_revoked):
+        started = time.perf_counter()
+        try:
+            if check_revoked:
+                return self._verify(token, check_revoked=True)
+            return self._verify(token)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.verifications += 1
+                self.verify_seconds_total += elapsed
+                self.verify_seconds_max = max(self.verify_seconds_max, elapsed)
+
+def verify_id_token(token, check_revoked=False):
+    #Initializes the Firebase app on the first verification instead of at import
+    return auth.verify_id_token(token, app=storage.firebase_app(), check_revoked=check_revoked)
+
+def insecure_dev_verify(token, check_revoked=False):
+    #Offline/load-test stand-in for verify_id_token: the token is the uid
+    return {"uid": token, "exp": time.time() + 3600}
+
+def preload_signing_keys(app=None):
+    #Warms the verifier's HTTP cache with Google's public signing certificates
+    try:
+        from firebase_admin import _token_gen
+        client = auth._get_client(app or storage.firebase_app())
+        started = time.perf_counter()
+        client._token_verifier.request(_token_gen.ID_TOKEN_CERT_URI)
+        log.info("Preloaded token signing keys in %.1f ms", 1000 * (time.perf_counter() - started))
+        return True
+    except Exception as e:
+        log.warning("Could not preload token signing keys: %s", e)
+        return False